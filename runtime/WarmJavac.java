@@ -0,0 +1,108 @@
+// mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+// Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+// This code is made avilable under the MIT license.  See LICENSE for the full
+// details.
+
+// The server half of warmjavac.py: runs javac inside this JVM for anyone who
+// asks, so that the JVM starts and the compiler warms up only once.  See
+// warmjavac.py for the protocol.  Written for Java 6, like the rest of MCP's
+// toolchain.
+
+import java.io.BufferedInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+public class WarmJavac {
+    public static void main(String[] args) throws IOException {
+        final JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            System.err.println("This Java has no compiler; is it a JRE?");
+            System.exit(1);
+        }
+
+        final InputStream stdin = System.in;
+        final String secret = readLine(stdin);
+        ServerSocket server = new ServerSocket(0, 50,
+                InetAddress.getByName("127.0.0.1"));
+        System.out.println(server.getLocalPort());
+        System.out.flush();
+
+        // Whoever started this closes stdin (by exiting, usually) once it's
+        // done with it.
+        Thread watcher = new Thread() {
+            public void run() {
+                try {
+                    while (stdin.read() != -1) {
+                    }
+                } catch (IOException e) {
+                }
+                System.exit(0);
+            }
+        };
+        watcher.setDaemon(true);
+        watcher.start();
+
+        while (true) {
+            final Socket socket = server.accept();
+            Thread handler = new Thread() {
+                public void run() {
+                    handle(socket, secret, compiler);
+                }
+            };
+            handler.setDaemon(true);
+            handler.start();
+        }
+    }
+
+    // A line of UTF-8, without its newline, or null at the end of the input.
+    static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != -1 && b != '\n') {
+            line.write(b);
+        }
+        if (b == -1) {
+            return null; // Requests end in a newline; this one was cut off.
+        }
+        return line.toString("UTF-8");
+    }
+
+    static void handle(Socket socket, String secret, JavaCompiler compiler) {
+        try {
+            InputStream in = new BufferedInputStream(socket.getInputStream());
+            OutputStream out = socket.getOutputStream();
+            if (secret == null || !secret.equals(readLine(in))) {
+                return;
+            }
+
+            String[] arguments = new String[Integer.parseInt(readLine(in))];
+            for (int i = 0; i < arguments.length; i++) {
+                arguments[i] = readLine(in);
+                if (arguments[i] == null) {
+                    return;
+                }
+            }
+
+            ByteArrayOutputStream output = new ByteArrayOutputStream();
+            int exit = compiler.run(null, output, output, arguments);
+            out.write((exit + "\n").getBytes("UTF-8"));
+            output.writeTo(out);
+            out.flush();
+        } catch (Exception e) {
+            // A bad request.  The client runs javac by itself instead.
+        } finally {
+            try {
+                socket.close();
+            } catch (IOException e) {
+            }
+        }
+    }
+}
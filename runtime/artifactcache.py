@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# A directory of build artifacts, keyed by a hash of everything that went into
+# them.  Entries are assembled in a temporary directory and renamed into
+# place, so any number of builds (on one machine, or on several sharing the
+# directory over the network) can use the same cache without ever seeing a
+# half-written entry.
+#
+# Since a cache can be shared, nothing in it is trusted to stay inside it: see
+# plain_name and extract.  For the same reason, manifests are JSON and checked
+# before use, never pickles.
+
+import json, os, os.path, shutil, tempfile, zipfile
+
+# Each entry's list of its artifacts and their metadata.  (Older entries had a
+# pickled "manifest" instead; they're never read.)
+MANIFEST = "manifest.json"
+
+# What recompile_mods stores for a side: the artifacts every entry has, and
+# the ones it has when its metadata says a package was created.
+REQUIRED = ["classes.zip"]
+REQUIRED_IF_CREATED = ["package", "obfuscated"]
+
+class BadEntry(Exception):
+    """A cache entry that can't be used as it is."""
+    pass
+
+def plain_name(name):
+    """Whether name is a file name and not a path."""
+    return name not in ("", ".", "..") and os.path.basename(name) == name \
+           and "/" not in name and "\\" not in name
+
+def extract(filename, dest):
+    """Extracts a zip from the cache into dest, one member at a time.
+
+    Raises BadEntry instead of writing anywhere outside dest, e.g. for an
+    absolute name or one with "..".
+    """
+    dest = os.path.abspath(dest)
+    try:
+        archive = zipfile.ZipFile(filename)
+    except (zipfile.BadZipfile, IOError), e:
+        raise BadEntry("%s is unreadable: %s" % (filename, e))
+
+    try:
+        for info in archive.infolist():
+            parts = info.filename.replace("\\", "/").split("/")
+            target = os.path.normpath(os.path.join(dest, *parts))
+            if info.filename.startswith(("/", "\\")) or ".." in parts \
+               or ":" in parts[0] \
+               or not target.startswith(os.path.join(dest, "")):
+                raise BadEntry("%s has a bad file name: %r"
+                               % (filename, info.filename))
+            archive.extract(info, dest)
+    except (zipfile.BadZipfile, IOError), e:
+        raise BadEntry("%s is unreadable: %s" % (filename, e))
+    finally:
+        archive.close()
+
+def utf8(text):
+    return text.encode("utf-8")
+
+def check_manifest(manifest):
+    """The files and metadata in a manifest as json.load returns it, with
+    strings as UTF-8.  Raises BadEntry unless it's what store writes.
+    """
+    if not isinstance(manifest, dict):
+        raise BadEntry("not a JSON object")
+    files = manifest.get("files")
+    metadata = manifest.get("metadata")
+    if not isinstance(files, list) or not isinstance(metadata, dict):
+        raise BadEntry("no file list or metadata")
+    if not all(isinstance(name, unicode) and plain_name(name)
+               for name in files):
+        raise BadEntry("a bad file name")
+
+    created = metadata.get("created")
+    token_usage = metadata.get("token_usage")
+    if not isinstance(created, bool) or not isinstance(token_usage, dict):
+        raise BadEntry("bad metadata")
+    for filename, tokens in token_usage.items():
+        if not isinstance(tokens, list) \
+           or not all(isinstance(token, list) and len(token) == 2
+                      and all(isinstance(part, unicode) for part in token)
+                      for token in tokens):
+            raise BadEntry("bad tokens for %r" % filename)
+
+    required = REQUIRED + (REQUIRED_IF_CREATED if created else [])
+    missing = set(required) - set(files)
+    if missing:
+        raise BadEntry("%s missing" % ", ".join(sorted(missing)))
+
+    return [utf8(name) for name in files], \
+           {"created": created,
+            "token_usage": dict((utf8(filename),
+                                 [tuple(utf8(part) for part in token)
+                                  for token in tokens])
+                                for filename, tokens in token_usage.items())}
+
+class ArtifactCache(object):
+    def __init__(self, root):
+        self.root = root
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, key):
+        """Returns (files, metadata) for a cached entry, or None.
+
+        files maps each artifact's name to its path in the cache.  metadata
+        has whether a package was created, and the token usage as {file:
+        [(token type, token)]}.  Entries that aren't just what store writes,
+        or that are missing any of their artifacts, count as missing.
+        """
+        entry_dir = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST)) as infile:
+                manifest = json.load(infile)
+            names, metadata = check_manifest(manifest)
+        except (IOError, ValueError, BadEntry):
+            return None
+
+        files = dict((name, os.path.join(entry_dir, name)) for name in names)
+        if not all(os.path.isfile(filename) for filename in files.values()):
+            return None # Pruned from the cache, most likely.
+        return files, metadata
+
+    def store(self, key, files, metadata):
+        """Stores artifacts (a map from name to file) under key.  metadata is
+        as lookup returns it, but the tokens can be any iterable.
+        """
+        entry_dir = self.entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        parent = os.path.dirname(entry_dir)
+        if not os.path.exists(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                pass # Someone else just made it.
+
+        temp_dir = tempfile.mkdtemp(prefix=key + ".", dir=parent)
+        try:
+            for name, filename in files.items():
+                shutil.copyfile(filename, os.path.join(temp_dir, name))
+            token_usage = dict((filename, sorted(tokens)) for filename, tokens
+                               in metadata["token_usage"].items())
+            with open(os.path.join(temp_dir, MANIFEST), "w") as outfile:
+                json.dump({"files": sorted(files),
+                           "metadata": {"created": bool(metadata["created"]),
+                                        "token_usage": token_usage}},
+                          outfile, sort_keys=True)
+            os.rename(temp_dir, entry_dir)
+        except (OSError, IOError):
+            # Most likely another build stored the same entry first, which is
+            # just as good.
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# A build daemon, and the thin client that talks to it over a Unix socket.
+#
+# The daemon loads whatever is expensive to load once, then forks for each
+# request.  The fork starts out with all of that already in memory and goes on
+# to build just like a normal run would, with its output going to the client.
+# When something the daemon loaded has changed, it hands that request to a
+# normal (cold) run and restarts itself to load everything again.
+
+import errno, json, os, os.path, signal, socket, sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Not on Windows.
+
+# Sent after a build's output, followed by its exit code.
+EXIT_MARKER = "@@mcp_daemon_exit@@ "
+
+# The script that cold runs and restarts run: the one that was started,
+# unless the script that imported this says otherwise.  It has to be found
+# again after a chdir.
+SCRIPT = os.path.abspath(sys.argv[0])
+
+def connect(socket_path):
+    """A connection to the daemon listening on socket_path, or None."""
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except socket.error:
+        client.close()
+        return None
+    return client
+
+def request_build(socket_path, argv):
+    """Has the daemon build with the command line argv.
+
+    Its output is passed along as it comes.  Returns the build's exit code, or
+    None if no daemon is listening.
+    """
+    client = connect(socket_path)
+    if client is None:
+        return None
+
+    client.sendall(json.dumps({"argv": argv}) + "\n")
+    replies = client.makefile("rb")
+    try:
+        for line in iter(replies.readline, ""):
+            marker = line.find(EXIT_MARKER)
+            if marker != -1:
+                sys.stdout.write(line[:marker])
+                return int(line[marker + len(EXIT_MARKER):])
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    finally:
+        replies.close()
+        client.close()
+
+    print "The build daemon went away in the middle of the build."
+    return 1
+
+def run_cold(argv):
+    """Replaces this process with a normal run of the script."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable, SCRIPT] + argv)
+
+def restart():
+    """Starts this process over, so that it loads everything again."""
+    run_cold(sys.argv[1:])
+
+def exit_code(pid):
+    """Waits for a child to finish and returns its exit code."""
+    pid, status = os.waitpid(pid, 0)
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return 1
+
+def fork_build():
+    """Forks a build.  Returns None in the child, which should go on to
+    build, and the child's exit code in the parent once it's done.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        return None
+    return exit_code(pid)
+
+def listen(socket_path):
+    if connect(socket_path) is not None:
+        print "A build daemon is already listening on %s." % socket_path
+        sys.exit(1)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path) # Left over from a daemon that died.
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(5)
+    if fcntl is not None:
+        # Builds don't need it, and a restarted daemon makes its own.
+        flags = fcntl.fcntl(server.fileno(), fcntl.F_GETFD)
+        fcntl.fcntl(server.fileno(), fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    return server
+
+def serve(socket_path, is_stale, prepare=None):
+    """Serves build requests on socket_path until interrupted.
+
+    Only returns in a forked child, with the command line it should build
+    with.  By then, its output goes to the client that asked.  is_stale says
+    whether anything loaded before serve was called has changed since.
+    prepare, if given, is called before each fork, to bring whatever else
+    the builds start with up to date.
+    """
+    server = listen(socket_path)
+    print "Build daemon listening on %s." % socket_path
+    sys.stdout.flush()
+
+    # Finished requests are reaped automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # Being killed cleans up like Ctrl-C does.
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        while True:
+            try:
+                connection, address = server.accept()
+            except socket.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            stale = is_stale()
+            if prepare is not None and not stale:
+                prepare()
+            if os.fork() == 0:
+                server.close()
+                argv = handle(connection, stale)
+                if argv is not None:
+                    return argv
+                os._exit(0)
+            connection.close()
+
+            if stale:
+                print "Inputs changed; restarting the build daemon."
+                server.close()
+                os.remove(socket_path)
+                restart()
+    except KeyboardInterrupt:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print
+        print "Build daemon stopped."
+        sys.exit(0)
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+def handle(connection, stale):
+    """Runs one request.  Returns its command line in the process that should
+    build, and None in the one that waits for it to finish.
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    try:
+        request = json.loads(connection.makefile("rb").readline())
+        argv = [str(arg) for arg in request["argv"]]
+    except (ValueError, KeyError, TypeError, socket.error):
+        connection.close()
+        return None
+
+    builder = os.fork()
+    if builder == 0:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(connection.fileno(), 1)
+        os.dup2(connection.fileno(), 2)
+        os.close(devnull)
+        connection.close()
+        sys.stdout = os.fdopen(1, "w", 0)
+
+        if stale:
+            run_cold(argv)
+        return argv
+
+    code = exit_code(builder)
+    try:
+        connection.sendall("%s%d\n" % (EXIT_MARKER, code))
+    except socket.error:
+        pass # The client went away.
+    connection.close()
+    return None
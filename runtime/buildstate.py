@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Helpers for the state that the build scripts keep between runs.
+
+import cPickle, hashlib, os, os.path
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+def hash_file(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as infile:
+        while True:
+            chunk = infile.read(65536)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load(filename, default=None):
+    """Loads saved state, or returns default if there is none (or it's bad)."""
+    try:
+        with open(filename, "rb") as infile:
+            return cPickle.load(infile)
+    except (IOError, EOFError, cPickle.UnpicklingError, ValueError,
+            AttributeError, ImportError):
+        return default
+
+def save(filename, data):
+    """Saves state atomically, so an interrupted run can't leave half of it."""
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Named after the process, in case another build saves it at once.
+    temp_name = "%s.%d.tmp" % (filename, os.getpid())
+    with open(temp_name, "wb") as outfile:
+        cPickle.dump(data, outfile, cPickle.HIGHEST_PROTOCOL)
+
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename) # Windows won't rename over an existing file.
+    os.rename(temp_name, filename)
+
+def discard(filename):
+    if os.path.exists(filename):
+        os.remove(filename)
+
+class HashCache(object):
+    """Content hashes of files, remembered by size and mtime so that
+    unchanged files don't have to be read again.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.hashes = load(filename, {})
+        self.changed = False
+
+    def hash(self, filename):
+        stat = os.stat(filename)
+        stamp = (stat.st_size, stat.st_mtime)
+        entry = self.hashes.get(filename)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, hash_file(filename))
+            self.hashes[filename] = entry
+            self.changed = True
+        return entry[1]
+
+    def save(self):
+        """Saves the hashes, along with any that another build saved since."""
+        if self.changed:
+            hashes = load(self.filename, {})
+            hashes.update(self.hashes)
+            save(self.filename, hashes)
+            self.changed = False
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Times the phases of a build, so that it's clear where the time goes.  The
+# results can be saved in Chrome's trace format (load them in chrome://tracing
+# or https://ui.perfetto.dev) and summed up in a table.
+
+import collections, contextlib, json, os, threading, time
+
+class Tracer(object):
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        # The phases each thread is in.
+        self.local = threading.local()
+
+    def open_phases(self):
+        if not hasattr(self.local, "phases"):
+            self.local.phases = []
+        return self.local.phases
+
+    def current(self):
+        """(phase, project, side) for what this thread is doing now.  The
+        phase includes the ones it's nested in, like "project/compile/javac".
+        """
+        phases = self.open_phases()
+        project = side = None
+        for name, phase_project, phase_side in phases:
+            project = phase_project or project
+            side = phase_side or side
+        path = "/".join(name for name, phase_project, phase_side in phases)
+        return path or None, project, side
+
+    @contextlib.contextmanager
+    def phase(self, name, project=None, side=None):
+        """Times what runs inside the with block.  Phases can nest."""
+        phases = self.open_phases()
+        phases.append((name, project, side))
+        start = time.time()
+        try:
+            yield
+        finally:
+            phases.pop()
+            self.record({"name": name, "project": project, "side": side,
+                         "start": start, "end": time.time(),
+                         "pid": os.getpid(),
+                         "thread": threading.current_thread().name})
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def take(self):
+        """Removes and returns the events so far, to pass them on to another
+        process's tracer (with add).
+        """
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def add(self, events):
+        for event in events:
+            self.record(event)
+
+    def save(self, filename):
+        """Saves the events in Chrome's trace format."""
+        # Chrome wants numbers for threads.
+        threads = {}
+        trace = []
+        for event in sorted(self.events, key=lambda event: event["start"]):
+            tid = threads.setdefault((event["pid"], event["thread"]),
+                                     len(threads) + 1)
+            label = event["name"]
+            if event["project"]:
+                label += " " + event["project"]
+            if event["side"]:
+                label += " (%s)" % event["side"]
+
+            trace.append({"name": label, "cat": event["name"], "ph": "X",
+                          "ts": int(event["start"] * 1000000),
+                          "dur": int((event["end"] - event["start"]) * 1000000),
+                          "pid": event["pid"], "tid": tid,
+                          "args": {"project": event["project"],
+                                   "side": event["side"]}})
+
+        for (pid, thread), tid in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid,
+                          "tid": tid, "args": {"name": thread}})
+
+        with open(filename, "w") as outfile:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"},
+                      outfile)
+
+    def summary(self):
+        """Lines of a table with the total and longest time of each phase."""
+        totals = collections.OrderedDict()
+        for event in sorted(self.events, key=lambda event: event["start"]):
+            took = event["end"] - event["start"]
+            count, total, longest, where = totals.get(event["name"],
+                                                      (0, 0.0, 0.0, ""))
+            if took >= longest:
+                longest = took
+                where = event["project"] or ""
+                if event["side"]:
+                    where += " (%s)" % event["side"]
+            totals[event["name"]] = (count + 1, total + took, longest, where)
+
+        lines = ["%-12s %6s %10s %10s  %s" % ("Phase", "Count", "Total (s)",
+                                              "Longest", "Longest in")]
+        for name, (count, total, longest, where) in totals.items():
+            lines.append("%-12s %6d %10.2f %10.2f  %s"
+                         % (name, count, total, longest, where))
+        return lines
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Keeps track of what the build's child processes (javac, the obfuscator and
+# such) cost: wall time, CPU time and peak memory.
+
+import errno, json, os, subprocess, sys, threading, time
+
+def call(cmd, shell=False):
+    """Like subprocess.call, but returns (exit code, resource usage).
+
+    The usage is a dict with the wall time, the user and system CPU time (in
+    seconds) and the peak resident set size (in KiB) of the child and of
+    whatever it waited for in turn.  Without wait4 (on Windows), only the
+    wall time is known; the others are None.
+    """
+    started = time.time()
+    process = subprocess.Popen(cmd, shell=shell)
+    if not hasattr(os, "wait4"):
+        exit = process.wait()
+        return exit, {"wall": time.time() - started, "user": None,
+                      "system": None, "max_rss": None}
+
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        except OSError, e:
+            if e.errno != errno.EINTR:
+                raise
+    wall = time.time() - started
+
+    if os.WIFSIGNALED(status):
+        exit = -os.WTERMSIG(status)
+    else:
+        exit = os.WEXITSTATUS(status)
+    # Tell subprocess it's been reaped already.
+    process.returncode = exit
+
+    max_rss = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024 # Bytes there, KiB everywhere else.
+    return exit, {"wall": wall, "user": rusage.ru_utime,
+                  "system": rusage.ru_stime, "max_rss": max_rss}
+
+def describe(cmd):
+    """A short name for a command: its program, or a shell command's first
+    word.
+    """
+    if isinstance(cmd, basestring):
+        words = cmd.split()
+        return os.path.basename(words[0]) if words else cmd
+    return os.path.basename(cmd[0])
+
+class UsageLog(object):
+    """The usage of every child process, with what it was for."""
+    def __init__(self):
+        self.processes = []
+        self.lock = threading.Lock()
+
+    def record(self, cmd, exit, usage, phase=None, project=None, side=None):
+        entry = {"command": describe(cmd), "exit": exit, "phase": phase,
+                 "project": project, "side": side}
+        entry.update(usage)
+        with self.lock:
+            self.processes.append(entry)
+
+    def take(self):
+        """Removes and returns the entries so far, to pass them on to another
+        process's log (with add).
+        """
+        with self.lock:
+            processes, self.processes = self.processes, []
+        return processes
+
+    def add(self, processes):
+        with self.lock:
+            self.processes.extend(processes)
+
+    def biggest(self):
+        """The entry with the highest peak RSS, or None."""
+        measured = [entry for entry in self.processes
+                    if entry["max_rss"] is not None]
+        if not measured:
+            return None
+        return max(measured, key=lambda entry: entry["max_rss"])
+
+    def totals(self):
+        """Sums by phase: {phase: (count, wall, user, system, max_rss)}."""
+        totals = {}
+        for entry in self.processes:
+            count, wall, user, system, max_rss = \
+                    totals.get(entry["phase"], (0, 0.0, 0.0, 0.0, 0))
+            totals[entry["phase"]] = (count + 1, wall + entry["wall"],
+                                      user + (entry["user"] or 0),
+                                      system + (entry["system"] or 0),
+                                      max(max_rss, entry["max_rss"] or 0))
+        return totals
+
+    def summary(self):
+        """Lines of a table of the usage by phase."""
+        lines = ["%-28s %5s %9s %9s %9s %9s" % ("Child processes by phase",
+                                                "Count", "Wall (s)", "User (s)",
+                                                "Sys (s)", "Peak MiB")]
+        for phase, (count, wall, user, system, max_rss) \
+                in sorted(self.totals().items()):
+            lines.append("%-28s %5d %9.2f %9.2f %9.2f %9.1f"
+                         % (phase or "-", count, wall, user, system,
+                            max_rss / 1024.0))
+        return lines
+
+    def save(self, filename):
+        """Saves every entry, and the sums by phase, as JSON."""
+        totals = {}
+        for phase, (count, wall, user, system, max_rss) \
+                in self.totals().items():
+            totals[phase or "-"] = {"count": count, "wall": wall,
+                                    "user": user, "system": system,
+                                    "max_rss": max_rss}
+        with open(filename, "w") as outfile:
+            json.dump({"processes": self.processes, "phases": totals},
+                      outfile, indent=2, sort_keys=True)
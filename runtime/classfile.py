@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# A small reader for the JVM class file format.  It only understands as much
+# as the build scripts need: the constant pool, the class header and the
+# declared fields, methods and attributes.  Method bodies are kept as raw
+# bytes and never decoded.
+
+import collections, hashlib, re, struct
+
+MAGIC = 0xCAFEBABE
+
+# Constant pool tags.
+UTF8 = 1
+INTEGER = 3
+FLOAT = 4
+LONG = 5
+DOUBLE = 6
+CLASS = 7
+STRING = 8
+FIELDREF = 9
+METHODREF = 10
+INTERFACE_METHODREF = 11
+NAME_AND_TYPE = 12
+METHOD_HANDLE = 15
+METHOD_TYPE = 16
+DYNAMIC = 17
+INVOKE_DYNAMIC = 18
+MODULE = 19
+PACKAGE = 20
+
+# Payload size of every constant except UTF8, which carries its own length.
+CONSTANT_SIZES = {
+    INTEGER: 4, FLOAT: 4, LONG: 8, DOUBLE: 8, CLASS: 2, STRING: 2,
+    FIELDREF: 4, METHODREF: 4, INTERFACE_METHODREF: 4, NAME_AND_TYPE: 4,
+    METHOD_HANDLE: 3, METHOD_TYPE: 2, DYNAMIC: 4, INVOKE_DYNAMIC: 4,
+    MODULE: 2, PACKAGE: 2,
+}
+
+# Access flags.
+ACC_PUBLIC = 0x0001
+ACC_PRIVATE = 0x0002
+ACC_PROTECTED = 0x0004
+ACC_STATIC = 0x0008
+ACC_FINAL = 0x0010
+ACC_INTERFACE = 0x0200
+ACC_ABSTRACT = 0x0400
+ACC_SYNTHETIC = 0x1000
+
+# Class names embedded in field/method descriptors and generic signatures.
+DESCRIPTOR_CLASS = re.compile(r"L([^;<>\[]+)[;<]")
+
+# How much to read from a stream at once.
+CHUNK_SIZE = 8192
+
+Member = collections.namedtuple("Member", "access name descriptor attributes")
+
+class ClassFormatError(Exception):
+    pass
+
+class Reader(object):
+    """Buffered big-endian reader over a string or a file-like object."""
+    def __init__(self, source):
+        if isinstance(source, str):
+            self.buffer = source
+            self.stream = None
+        else:
+            self.buffer = ""
+            self.stream = source
+        self.pos = 0
+
+    def take(self, size):
+        end = self.pos + size
+        if end > len(self.buffer):
+            if self.stream is None:
+                raise ClassFormatError("Truncated class file.")
+
+            # Drop what we've already consumed and read some more.
+            self.buffer = self.buffer[self.pos:]
+            end -= self.pos
+            self.pos = 0
+            chunks = [self.buffer]
+            have = len(self.buffer)
+            while have < end:
+                chunk = self.stream.read(max(CHUNK_SIZE, end - have))
+                if not chunk:
+                    raise ClassFormatError("Truncated class file.")
+                chunks.append(chunk)
+                have += len(chunk)
+            self.buffer = "".join(chunks)
+
+        data = self.buffer[self.pos:end]
+        self.pos = end
+        return data
+
+    def u1(self):
+        return ord(self.take(1))
+
+    def u2(self):
+        return struct.unpack(">H", self.take(2))[0]
+
+    def u4(self):
+        return struct.unpack(">I", self.take(4))[0]
+
+class ClassFile(object):
+    """A parsed class file.
+
+    Class names are kept in internal form (java/lang/Object).  With
+    header_only, parsing stops after the interface list, so fields, methods
+    and attributes stay empty and the rest of the input is never read.
+    """
+    def __init__(self, source, header_only=False):
+        reader = Reader(source)
+
+        if reader.u4() != MAGIC:
+            raise ClassFormatError("Not a class file.")
+        self.minor_version = reader.u2()
+        self.major_version = reader.u2()
+
+        self.constants = self.read_constants(reader)
+
+        self.access = reader.u2()
+        self.name = self.class_name(reader.u2())
+        super_index = reader.u2()
+        self.super_name = self.class_name(super_index) if super_index else None
+        self.interfaces = [self.class_name(reader.u2())
+                           for i in range(reader.u2())]
+
+        self.fields = []
+        self.methods = []
+        self.attributes = {}
+        if header_only:
+            return
+
+        self.fields = [self.read_member(reader) for i in range(reader.u2())]
+        self.methods = [self.read_member(reader) for i in range(reader.u2())]
+        self.attributes = self.read_attributes(reader)
+
+    @staticmethod
+    def read_constants(reader):
+        count = reader.u2()
+        constants = [None] * count
+        index = 1
+        while index < count:
+            tag = reader.u1()
+            if tag == UTF8:
+                constants[index] = (tag, reader.take(reader.u2()))
+            elif tag in CONSTANT_SIZES:
+                constants[index] = (tag, reader.take(CONSTANT_SIZES[tag]))
+            else:
+                raise ClassFormatError("Unknown constant pool tag %d." % tag)
+
+            # Longs and doubles take up two slots.
+            if tag in (LONG, DOUBLE):
+                index += 2
+            else:
+                index += 1
+        return constants
+
+    def read_attributes(self, reader):
+        attributes = {}
+        for i in range(reader.u2()):
+            name = self.utf8(reader.u2())
+            attributes[name] = reader.take(reader.u4())
+        return attributes
+
+    def read_member(self, reader):
+        access = reader.u2()
+        name = self.utf8(reader.u2())
+        descriptor = self.utf8(reader.u2())
+        return Member(access, name, descriptor, self.read_attributes(reader))
+
+    def constant(self, index, expected_tag):
+        try:
+            tag, data = self.constants[index]
+        except (IndexError, TypeError):
+            raise ClassFormatError("Bad constant pool index %d." % index)
+        if tag != expected_tag:
+            raise ClassFormatError("Constant %d has tag %d, expected %d."
+                                   % (index, tag, expected_tag))
+        return data
+
+    def utf8(self, index):
+        return self.constant(index, UTF8)
+
+    def class_name(self, index):
+        data = self.constant(index, CLASS)
+        return self.utf8(struct.unpack(">H", data)[0])
+
+    @property
+    def package(self):
+        if "/" in self.name:
+            return self.name.rsplit("/", 1)[0]
+        return ""
+
+    @property
+    def source_file(self):
+        """The SourceFile attribute, or None if it was compiled without it."""
+        data = self.attributes.get("SourceFile")
+        if data is None:
+            return None
+        return self.utf8(struct.unpack(">H", data)[0])
+
+    def referenced_classes(self):
+        """Every class this one mentions in its constant pool, by name."""
+        referenced = set()
+        for constant in self.constants:
+            if constant is None:
+                continue
+            tag, data = constant
+            if tag == CLASS:
+                name = self.utf8(struct.unpack(">H", data)[0])
+                if name.startswith("["):
+                    # Array type; only the element type matters.
+                    referenced.update(DESCRIPTOR_CLASS.findall(name))
+                else:
+                    referenced.add(name)
+            elif tag == UTF8 and ";" in data:
+                # Descriptors and signatures of fields, methods and
+                # annotations.
+                referenced.update(DESCRIPTOR_CLASS.findall(data))
+
+        referenced.discard(self.name)
+        return referenced
+
+def parents(parsed):
+    """The direct superclass and interfaces of a class, superclass first."""
+    if parsed.super_name is None:
+        return tuple(parsed.interfaces)
+    return (parsed.super_name,) + tuple(parsed.interfaces)
+
+def outer_class(name):
+    """The top-level class that a (possibly nested) class belongs to."""
+    package, _, simple_name = name.rpartition("/")
+    outer = simple_name.split("$", 1)[0]
+    if package:
+        return package + "/" + outer
+    return outer
+
+def source_path(classfile):
+    """The path, relative to a source root, of the file a class came from."""
+    source = classfile.source_file
+    if source is None:
+        source = outer_class(classfile.name).rpartition("/")[2] + ".java"
+
+    if classfile.package:
+        return classfile.package + "/" + source
+    return source
+
+def resolve_constant(parsed, index):
+    """A constant's value, with strings resolved to their text."""
+    tag, data = parsed.constants[index]
+    if tag in (CLASS, STRING, METHOD_TYPE):
+        return (tag, parsed.utf8(struct.unpack(">H", data)[0]))
+    return (tag, data)
+
+def member_signature(parsed, member):
+    signature = member.attributes.get("Signature")
+    if signature is not None:
+        signature = parsed.utf8(struct.unpack(">H", signature)[0])
+
+    exceptions = member.attributes.get("Exceptions")
+    if exceptions is not None:
+        count = struct.unpack(">H", exceptions[:2])[0]
+        indices = struct.unpack(">%dH" % count, exceptions[2:2 + 2 * count])
+        exceptions = sorted(parsed.class_name(index) for index in indices)
+
+    return (member.access, member.name, member.descriptor, signature,
+            exceptions)
+
+def visible_members(members):
+    for member in members:
+        if not member.access & (ACC_PRIVATE | ACC_SYNTHETIC):
+            yield member
+
+def abi_fingerprint(parsed):
+    """Hashes what other classes compile against: the class header and the
+    signatures of its non-private members.  Method bodies, private and
+    synthetic members don't count, and neither do constant values (see
+    constants_fingerprint).
+    """
+    signature = parsed.attributes.get("Signature")
+    if signature is not None:
+        signature = parsed.utf8(struct.unpack(">H", signature)[0])
+
+    abi = (parsed.access, parsed.name, parsed.super_name,
+           sorted(parsed.interfaces), signature,
+           sorted(member_signature(parsed, field)
+                  for field in visible_members(parsed.fields)),
+           sorted(member_signature(parsed, method)
+                  for method in visible_members(parsed.methods)))
+    return hashlib.sha1(repr(abi)).hexdigest()
+
+def constants_fingerprint(parsed):
+    """Hashes the values of the class's non-private compile-time constants.
+
+    javac copies these into the classes that use them without leaving a
+    reference behind, so changes to them can't be traced to dependents.
+    """
+    constants = []
+    for field in visible_members(parsed.fields):
+        value = field.attributes.get("ConstantValue")
+        if value is not None:
+            index = struct.unpack(">H", value)[0]
+            constants.append((field.name, resolve_constant(parsed, index)))
+    return hashlib.sha1(repr(sorted(constants))).hexdigest()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# An index of which classpath entries (jars or class directories) contain
+# which classes and packages, and which packages each entry refers to.  It is
+# saved between runs and only rescans entries that changed.
+
+import collections, contextlib, hashlib, os, os.path, zipfile
+
+import buildstate, classfile
+
+# Packages that come with the JDK and never need a classpath entry.
+JDK_PACKAGES = ("java.", "javax.", "sun.", "com.sun.", "jdk.", "org.w3c.",
+                "org.xml.", "org.omg.", "org.ietf.")
+
+def package_of(name):
+    return name.rpartition("/")[0]
+
+class ClassIndex(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.reload()
+
+    def file_stamp(self):
+        if not os.path.exists(self.filename):
+            return None
+        stat = os.stat(self.filename)
+        return (stat.st_size, stat.st_mtime)
+
+    def reload(self):
+        """Picks up whatever was saved since this was loaded, e.g. by
+        another build.
+        """
+        self.loaded = self.file_stamp()
+        self.entries = buildstate.load(self.filename, {})
+        self.index()
+
+    def reload_if_changed(self):
+        """Like reload, but only if anyone saved since this did."""
+        if self.file_stamp() != self.loaded:
+            self.reload()
+
+    @staticmethod
+    def stamp(path):
+        """Something that changes whenever the entry's contents do."""
+        if os.path.isdir(path):
+            digest = hashlib.sha1()
+            for (dir, subdirs, files) in sorted(os.walk(path)):
+                subdirs.sort()
+                for file in sorted(files):
+                    stat = os.stat(os.path.join(dir, file))
+                    digest.update(repr((os.path.relpath(dir, path), file,
+                                        stat.st_size, stat.st_mtime)))
+            return digest.hexdigest()
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            return (stat.st_size, stat.st_mtime)
+        else:
+            return None
+
+    @staticmethod
+    def class_files(path):
+        """Yields a readable stream for every class file in a jar or dir."""
+        if os.path.isdir(path):
+            for (dir, subdirs, files) in os.walk(path, followlinks=True):
+                for file in files:
+                    if file.endswith(".class"):
+                        with open(os.path.join(dir, file), "rb") as stream:
+                            yield stream
+        else:
+            with contextlib.closing(zipfile.ZipFile(path)) as archive:
+                for info in archive.infolist():
+                    if info.filename.endswith(".class"):
+                        with contextlib.closing(archive.open(info)) as stream:
+                            yield stream
+
+    @classmethod
+    def scan(cls, path, stamp):
+        classes = set()
+        references = set()
+        try:
+            for stream in cls.class_files(path):
+                parsed = classfile.ClassFile(stream, header_only=True)
+                classes.add(parsed.name)
+                references.update(package_of(name)
+                                  for name in parsed.referenced_classes())
+        except (zipfile.BadZipfile, classfile.ClassFormatError, IOError), e:
+            print "Unable to index %s: %s" % (path, e)
+
+        packages = set(package_of(name) for name in classes)
+        return {"stamp": stamp, "classes": classes,
+                "references": references - packages}
+
+    def refresh(self, paths):
+        """Brings the index up to date with exactly these entries."""
+        changed = False
+        for path in paths:
+            stamp = self.stamp(path)
+            entry = self.entries.get(path)
+            if entry is None or entry["stamp"] != stamp:
+                self.entries[path] = self.scan(path, stamp)
+                changed = True
+
+        for path in self.entries.keys():
+            if path not in paths:
+                del self.entries[path]
+                changed = True
+
+        if changed:
+            buildstate.save(self.filename, self.entries)
+            self.loaded = self.file_stamp()
+            self.index()
+
+    def index(self):
+        self.class_owners = collections.defaultdict(list)
+        self.package_owners = collections.defaultdict(set)
+        for path, entry in sorted(self.entries.items()):
+            for name in entry["classes"]:
+                self.class_owners[name].append(path)
+                self.package_owners[package_of(name)].add(path)
+
+    def locate(self, dotted_name):
+        """(package, class) for a dotted name (from an import or a fully
+        qualified reference), in internal form.  The class is None if the
+        name is a package, or a class this index doesn't know.  Returns None
+        if it doesn't look like anything on this classpath at all.
+        """
+        parts = dotted_name.split(".")
+        if "/".join(parts) in self.package_owners:
+            return "/".join(parts), None
+
+        for i in range(len(parts) - 1, 0, -1):
+            package = "/".join(parts[:i])
+            if package in self.package_owners:
+                name = package + "/" + parts[i]
+                if name in self.class_owners:
+                    return package, name
+                return package, None
+        return None
+
+    def resolve(self, dotted_name):
+        """The entries a dotted name could be found in, or None if it doesn't
+        look like a class or package on this classpath at all.
+        """
+        located = self.locate(dotted_name)
+        if located is None:
+            return None
+        package, name = located
+        if name is not None:
+            return self.class_owners[name]
+        return self.package_owners[package]
+
+    def select(self, roots, dotted_names, packages=()):
+        """Returns every entry needed for the roots and the dotted names,
+        including whatever the entries themselves refer to.
+
+        Every entry with classes in packages (in internal form) is needed as
+        well.  A package can be split between entries, and the sources in it
+        use its classes without importing them.
+        """
+        selected = set(roots)
+        for dotted_name in dotted_names:
+            selected.update(self.resolve(dotted_name) or ())
+        for package in packages:
+            selected.update(self.package_owners.get(package, ()))
+
+        pending = list(selected)
+        while pending:
+            entry = self.entries.get(pending.pop())
+            if entry is None:
+                continue
+            for package in entry["references"]:
+                for path in self.package_owners.get(package, ()):
+                    if path not in selected:
+                        selected.add(path)
+                        pending.append(path)
+        return selected
+
+    def conflicts(self, paths):
+        """Classes found in more than one of these entries, by entry pair."""
+        paths = set(paths)
+        conflicts = collections.defaultdict(list)
+        for name, owners in self.class_owners.items():
+            owners = [path for path in owners if path in paths]
+            if len(owners) > 1:
+                for i, first in enumerate(owners):
+                    for second in owners[i + 1:]:
+                        conflicts[(first, second)].append(name)
+        return conflicts
@@ -5,7 +5,10 @@
 # details.
 
 import itertools, os, os.path, platform, shutil, subprocess, sys, tarfile, \
-       zipfile, tempfile
+       zipfile, tempfile, argparse, hashlib, multiprocessing, \
+       multiprocessing.pool
+
+import buildstate, childusage, inheritance, jvmprofile, locking
 
 # Convenience functions.  These make the settings settings easier to work with.
 absolute = lambda rawpath: os.path.abspath(os.path.expanduser(rawpath))
@@ -24,15 +27,37 @@ DEOBF_LIBS = relative("lib")
 TEMP = relative("temp/lib")
 MCP_TEMP = relative("temp")
 
+parser = argparse.ArgumentParser(
+    description="Deobfuscates the libraries in lib-obf/ into lib/, with the "
+                "inheritance tables that builds need.")
+parser.add_argument("--usage", metavar="FILE",
+                    help="Save the wall time, CPU time and peak memory of "
+                         "every child process to FILE as JSON, and sum them "
+                         "up by phase at the end.")
+parser.add_argument("--jvm-inheritance", action="store_true",
+                    help="Have mcp_deobfuscate make the inheritance tables, "
+                         "instead of reading the class files here.")
+parser.add_argument("--workers", type=int, metavar="N",
+                    default=multiprocessing.cpu_count(),
+                    help="Run up to N copies of mcp_deobfuscate at a time.  "
+                         "(Default: one per CPU.)")
+args = parser.parse_args()
+
 # Most of this script assumes it's in the MCP directory, so let's go there.
 os.chdir(BASE)
 
+# Builds hold this (shared) while they use the libraries, their inheritance
+# tables and the SRG, so wait until none of them are running.
+lib_lock = locking.FileLock(relative("temp", "locks", "lib.lock"),
+                            description="lib/")
+lib_lock.acquire()
+
 # Create the project directory and force it to be seen as a category.
 if not os.path.exists(OBF_LIBS):
     os.makedirs(OBF_LIBS)
 
-# Create/clean the temp directory.
-clean_if_needed(TEMP)
+# Create the temp directory.  Each batch of libraries cleans its own part.
+make_if_needed(TEMP)
 
 # JAR files to build against.
 OBF_CLIENT = relative("temp/client_reobf.jar")
@@ -40,17 +65,54 @@ DEOBF_CLIENT = relative("temp/client_recomp.jar")
 OBF_SERVER = relative("temp/server_reobf.jar")
 DEOBF_SERVER = relative("temp/server_recomp.jar")
 
-def call_or_die(cmd, shell=False):
+# How mcp_deobfuscate is run.
+jvm = jvmprofile.JavaProfile(BASE)
+
+# What each child process cost, and what it was for.
+usage_log = childusage.UsageLog()
+
+def call_or_die(cmd, shell=False, phase=None, library=None):
     if shell:
         print "Running" + cmd
     else:
         print "Running " + (" ".join(cmd))
-    exit = subprocess.call(cmd, shell=shell)
+    exit, usage = childusage.call(cmd, shell=shell)
+    usage_log.record(cmd, exit, usage, phase, library)
+    jvm.ran(cmd, exit)
     if exit != 0:
         print "Command failed: %s" % cmd
         print "Aborting deobfuscate."
         sys.exit(1)
 
+def call_all(jobs):
+    """Runs (command, phase, library) jobs, up to args.workers at a time,
+    and returns the exit code of each.
+    """
+    for cmd, phase, library in jobs:
+        print "Running " + (" ".join(cmd))
+
+    def call(job):
+        cmd, phase, library = job
+        exit, usage = childusage.call(cmd)
+        usage_log.record(cmd, exit, usage, phase, library)
+        return exit
+
+    if args.workers <= 1 or len(jobs) <= 1:
+        exits = map(call, jobs)
+    else:
+        pool = multiprocessing.pool.ThreadPool(min(args.workers, len(jobs)))
+        try:
+            exits = pool.map(call, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    for (cmd, phase, library), exit in zip(jobs, exits):
+        jvm.ran(cmd, exit)
+        if exit != 0:
+            print "Command failed: %s" % cmd
+    return exits
+
 if os.path.exists(OBF_CLIENT) or os.path.exists(OBF_SERVER):
     pass # Yay!
 else:
@@ -69,22 +131,44 @@ CLIENT_SRG = os.path.join(MCP_TEMP, "client_ro.srg")
 SERVER_SRG = os.path.join(MCP_TEMP, "server_ro.srg")
 SRG = os.path.join(MCP_TEMP, "full.srg")
 
+# The SRGs that full.srg is made from.
 if FORGE_INSTALLED:
-    shutil.copy2(CLIENT_SRG, SRG)
-elif os.path.exists(CLIENT_SRG) and os.path.exists(SERVER_SRG):
-    call_or_die("cat %s %s | sort -u > %s" % (CLIENT_SRG, SERVER_SRG, SRG),
-                shell=True)
-elif os.path.exists(CLIENT_SRG):
-    shutil.copy2(CLIENT_SRG, SRG)
-elif os.path.exists(SERVER_SRG):
-    shutil.copy2(SERVER_SRG, SRG)
+    SRG_SOURCES = [CLIENT_SRG]
 else:
+    SRG_SOURCES = [srg for srg in [CLIENT_SRG, SERVER_SRG]
+                   if os.path.exists(srg)]
+if not SRG_SOURCES:
     print "You must run reobfuscate before deobfuscate_libs."
     sys.exit(1)
 
-CLASSPATH = "runtime/bin/jcommander-1.29.jar:jars/libraries/org/ow2/asm/asm-debug-all/4.1/asm-debug-all-4.1.jar:runtime/bin/mcp_deobfuscate-1.2.jar"
-MAIN_CLASS = "org.ldg.mcpd.MCPDeobfuscate"
-BASIC_COMMAND = ["java", "-classpath", CLASSPATH, MAIN_CLASS]
+def write_srg():
+    """Writes full.srg: the one SRG, or the sorted, unique lines of both.
+
+    It's only written if that changes it, so that what depends on it
+    doesn't look out of date.
+    """
+    if len(SRG_SOURCES) == 1:
+        with open(SRG_SOURCES[0]) as infile:
+            merged = infile.read()
+    else:
+        lines = set()
+        for source in SRG_SOURCES:
+            with open(source) as infile:
+                lines.update(line for line in infile.read().splitlines()
+                             if line)
+        merged = "".join(line + "\n" for line in sorted(lines))
+
+    if os.path.exists(SRG):
+        with open(SRG) as infile:
+            if infile.read() == merged:
+                return
+    partial = "%s.%d.tmp" % (SRG, os.getpid())
+    with open(partial, "w") as outfile:
+        outfile.write(merged)
+    if os.name == "nt" and os.path.exists(SRG):
+        os.remove(SRG) # Windows won't rename over an existing file.
+    os.rename(partial, SRG)
+
 class Library(object):
     def __init__(self, filename):
         self.name = os.path.basename(filename)
@@ -96,20 +180,28 @@ class Library(object):
         self.deobf = os.path.join(DEOBF_LIBS, self.name)
         self.deobf_inh = self.deobf + ".inh"
 
-    def build_inh(self, obfuscated):
+    def inh_job(self, obfuscated):
+        """(jar, inheritance table) for one side of this library."""
         if obfuscated:
-            lib = self.obf
-            inheritance = self.obf_inh
+            return self.obf, self.obf_inh
         else:
-            lib = self.deobf
-            inheritance = self.deobf_inh
+            return self.deobf, self.deobf_inh
 
-        command = BASIC_COMMAND + ["--inheritance", inheritance,
-                                        "--indir", "/",
-                                        "--infiles", lib]
+    def inh_command(self, obfuscated):
+        """(command, phase, library) to have mcp_deobfuscate write the
+        inheritance table for one side of this library.
+        """
+        lib, inheritance = self.inh_job(obfuscated)
 
-        call_or_die(command)
-        return inheritance
+        command = jvm.deobfuscator_command(["--inheritance", inheritance,
+                                            "--indir", "/",
+                                            "--infiles", lib])
+
+        if obfuscated:
+            phase = "inheritance (obfuscated)"
+        else:
+            phase = "inheritance"
+        return command, phase, self.name
 
     def package(self, side, in_dir):
         """Packages this project's files."""
@@ -186,32 +278,378 @@ if os.path.exists(OBF_SERVER):
     library.deobf = DEOBF_SERVER
     minecraft_jars.append(library)
 
-obf_inheritances = []
+# Everything this script reads or writes, as of the end of the last run that
+# worked.  If none of it has changed since, there's nothing to do.
+STAMP = relative("temp", "lib_stamp")
+# The scripts whose changes can change the results.
+SCRIPT_MODULES = ["deobfuscate_libs.py", "inheritance.py", "classfile.py",
+                  "jvmprofile.py"]
+
+def stamp():
+    """{file, relative to BASE: (size, mtime) or None if it's missing}, and
+    the options that change the results.
+    """
+    files = [OBF_CLIENT, OBF_SERVER, DEOBF_CLIENT, DEOBF_SERVER,
+             CLIENT_SRG, SERVER_SRG, SRG, relative("runtime", "commands.py"),
+             relative(jvmprofile.CONFIG_FILE),
+             relative(inheritance.MERGED_TABLE)] \
+            + [relative(entry) for entry in jvmprofile.DEOBFUSCATOR_CLASSPATH] \
+            + [relative("runtime", module) for module in SCRIPT_MODULES]
+    for library in minecraft_jars + libraries:
+        files += [library.obf, library.obf_inh,
+                  library.deobf, library.deobf_inh]
+
+    stamp = {"--jvm-inheritance": args.jvm_inheritance}
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+            stamp[os.path.relpath(filename, BASE)] = (stat.st_size,
+                                                      stat.st_mtime)
+        except OSError:
+            stamp[os.path.relpath(filename, BASE)] = None
+    return stamp
+
+def describe_changes(old, new):
+    """Lines saying what differs between two stamps."""
+    lines = []
+    for name in sorted(set(old) | set(new)):
+        before, after = old.get(name), new.get(name)
+        if before == after:
+            continue
+        if name.startswith("--"):
+            lines.append("  %s is %s now" % (name, after and "on" or "off"))
+        elif before is None:
+            lines.append("  %s (new)" % name)
+        elif after is None:
+            lines.append("  %s (missing)" % name)
+        else:
+            lines.append("  %s (changed)" % name)
+    return lines
+
+saved_stamp = buildstate.load(STAMP)
+current_stamp = stamp()
+if saved_stamp == current_stamp:
+    print "Libraries are up to date."
+    sys.exit(0)
+elif saved_stamp is None:
+    print "No record of an earlier run; checking everything."
+else:
+    print "Changed since the last run:"
+    for line in describe_changes(saved_stamp, current_stamp):
+        print line
+print
+# Until this run is done, the old stamp says nothing about what's here.
+buildstate.discard(STAMP)
+write_srg()
+
+# mcp_deobfuscate and its dependencies, as they are now.
+toolchain = [(entry, os.path.getsize(entry), os.path.getmtime(entry))
+             for entry in jvmprofile.DEOBFUSCATOR_CLASSPATH
+             if os.path.exists(entry)]
+
+# Whether inheritance.py's tables match mcp_deobfuscate's, for the version of
+# mcp_deobfuscate that was checked.
+INHERITANCE_CHECK = relative("temp", "lib_inheritance_check")
+
+def inheritance_reader_agrees():
+    """Checks inheritance.py against mcp_deobfuscate on the smallest jar,
+    unless that's been done for this version of mcp_deobfuscate already.
+    """
+    saved = buildstate.load(INHERITANCE_CHECK)
+    if saved is not None and saved["toolchain"] == toolchain:
+        return saved["agrees"]
+
+    # The smallest jar with any classes in it.
+    sample = None
+    for library in sorted(minecraft_jars + libraries,
+                          key=lambda library: os.path.getsize(library.obf)):
+        try:
+            if inheritance.read_jar(library.obf):
+                sample = library
+                break
+        except (IOError, zipfile.BadZipfile):
+            pass
+    if sample is None:
+        return False
+
+    print "Checking the inheritance table for %s against mcp_deobfuscate..." \
+            % sample.name
+    reference = os.path.join(TEMP, "check.inh")
+    call_or_die(jvm.deobfuscator_command(["--inheritance", reference,
+                                          "--indir", "/",
+                                          "--infiles", sample.obf]),
+                phase="inheritance (check)", library=sample.name)
+    agrees = inheritance.matches(sample.obf, reference)
+    if agrees:
+        print "They match.  Reading the class files here from now on."
+    else:
+        print "They don't match.  Leaving the inheritance tables to " \
+              "mcp_deobfuscate."
+    buildstate.save(INHERITANCE_CHECK, {"toolchain": toolchain,
+                                        "agrees": agrees})
+    return agrees
+
+# Whether the tables are read here (and so in a layout we know).
+read_class_files = not args.jvm_inheritance and inheritance_reader_agrees()
+
+# What each table and each deobfuscated library was made from, so that only
+# the ones whose inputs changed are made again:
+#   "tables": {table file: key of its jar and of whatever wrote it}
+#   "libraries": {library name: key of its jar, the SRG and its inheritance}
+#   "references": {library name: (hash of its jar, classes it references)}
+STATE = relative("temp", "lib_state")
+state = buildstate.load(STATE, {})
+state.setdefault("tables", {})
+state.setdefault("libraries", {})
+state.setdefault("references", {})
+file_hashes = buildstate.HashCache(relative("temp", "lib_hashes.idx"))
+
+def save_state():
+    buildstate.save(STATE, state)
+    file_hashes.save()
+
+# Libraries that were deobfuscated before, but aren't in lib-obf/ any more.
+for name in sorted(set(state["libraries"]) - set(library.name
+                                                  for library in libraries)):
+    print "Removing %s, which is gone from lib-obf/." % name
+    gone = Library(os.path.join(OBF_LIBS, name))
+    for filename in [gone.deobf, gone.deobf_inh, gone.obf_inh]:
+        if os.path.exists(filename):
+            os.remove(filename)
+        state["tables"].pop(filename, None)
+    del state["libraries"][name]
+    state["references"].pop(name, None)
+save_state()
+
+def table_key(jar):
+    if read_class_files:
+        writer = "inheritance.py"
+    else:
+        writer = toolchain
+    return file_hashes.hash(jar), writer
+
+def build_inheritance(obfuscated):
+    """Writes the inheritance tables that are missing or out of date and
+    returns every jar's.
+    """
+    jobs = [library.inh_job(obfuscated)
+            for library in minecraft_jars + libraries]
+    keys = {}
+    stale = []
+    for library in minecraft_jars + libraries:
+        jar, table = library.inh_job(obfuscated)
+        keys[table] = table_key(jar)
+        if not os.path.exists(table) or state["tables"].get(table) \
+                                        != keys[table]:
+            stale.append(library)
+    print "%d of %d tables are up to date." % (len(jobs) - len(stale),
+                                               len(jobs))
+    if not stale:
+        return [table for jar, table in jobs]
+
+    if read_class_files:
+        print "Reading the class files of %d jars..." % len(stale)
+        try:
+            inheritance.write_all([library.inh_job(obfuscated)
+                                   for library in stale], args.workers)
+        except (IOError, zipfile.BadZipfile), e:
+            print "Couldn't read a jar: %s" % e
+            print "Aborting deobfuscate."
+            sys.exit(1)
+        exits = [0] * len(stale)
+    else:
+        exits = call_all([library.inh_command(obfuscated)
+                          for library in stale])
+
+    for library, exit in zip(stale, exits):
+        table = library.inh_job(obfuscated)[1]
+        if exit == 0:
+            state["tables"][table] = keys[table]
+        else:
+            state["tables"].pop(table, None)
+    save_state()
+    if any(exits):
+        print "Aborting deobfuscate."
+        sys.exit(1)
+    return [table for jar, table in jobs]
+
 print "---Creating obfuscated inheritance tables---"
-for library in minecraft_jars + libraries:
-    print library.name + "..."
-    obf_inheritances.append(library.build_inh(obfuscated=True))
+obf_inheritances = build_inheritance(obfuscated=True)
 
 print "---Obfuscated inheritance tables complete---"
 print
 print "---Deobfuscating libraries---"
-obf_libraries = map(lambda library: library.name, libraries)
 
-if obf_libraries:
-    command = BASIC_COMMAND + ["--stored_inheritance"] + obf_inheritances + [
-                               "--config", SRG,
-                               "--indir", OBF_LIBS, "--outdir", DEOBF_LIBS,
-                               "--infiles"] + obf_libraries
+def library_references():
+    """{library name: the classes it references}, read from the jars that
+    changed since the last run.
+    """
+    hashes = dict((library.name, file_hashes.hash(library.obf))
+                  for library in libraries)
+    stale = [library for library in libraries
+             if state["references"].get(library.name, (None,))[0]
+                != hashes[library.name]]
+    if stale:
+        print "Reading the references of %d jars..." % len(stale)
+        found = inheritance.map_all(inheritance.read_references,
+                                    [library.obf for library in stale],
+                                    args.workers)
+        for library, references in zip(stale, found):
+            state["references"][library.name] = (hashes[library.name],
+                                                  references)
+        save_state()
+    return dict((library.name, state["references"][library.name][1])
+                for library in libraries)
+
+def inheritance_keys():
+    """{library name: key of the inheritance it's deobfuscated with}.
+
+    With tables in a known layout, that's the lines for its classes, every
+    class it references and all of their ancestors, wherever they are.  (How
+    a reference is remapped depends on where the member it names is
+    inherited from.)  So a new or changed library only affects the ones that
+    use or inherit from it.  Otherwise, it's every table.
+    """
+    if not read_class_files:
+        digest = hashlib.sha1()
+        for table in obf_inheritances:
+            digest.update(buildstate.hash_file(table))
+        return dict((library.name, digest.hexdigest())
+                    for library in libraries)
+
+    parsed = {}
+    parents = {}
+    for library in minecraft_jars + libraries:
+        with open(library.obf_inh) as infile:
+            parsed[library.name] = inheritance.parse_table(infile.read())
+        for name, direct in parsed[library.name].items():
+            parents.setdefault(name, []).append(direct)
+
+    try:
+        references = library_references()
+    except (IOError, zipfile.BadZipfile), e:
+        print "Couldn't read a jar: %s" % e
+        print "Aborting deobfuscate."
+        sys.exit(1)
 
-    call_or_die(command)
+    keys = {}
+    for library in libraries:
+        seen = set()
+        pending = list(parsed[library.name]) + references[library.name]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            for direct in parents.get(name, []):
+                pending.extend(direct)
+        lines = sorted(repr((name, parents.get(name))) for name in seen)
+        keys[library.name] = hashlib.sha1("\n".join(lines)).hexdigest()
+    return keys
+
+srg_hash = file_hashes.hash(SRG)
+inheritance_key = inheritance_keys()
+library_keys = dict((library.name,
+                     hashlib.sha1(repr((file_hashes.hash(library.obf),
+                                        srg_hash,
+                                        inheritance_key[library.name],
+                                        toolchain))).hexdigest())
+                    for library in libraries)
+stale = [library for library in libraries
+         if not os.path.exists(library.deobf)
+         or state["libraries"].get(library.name) != library_keys[library.name]]
+print "%d of %d libraries are up to date." % (len(libraries) - len(stale),
+                                              len(libraries))
+
+def batches(stale):
+    """Splits the stale libraries into up to args.workers batches of about
+    the same total size, one mcp_deobfuscate run each.
+    """
+    batches = [[] for i in range(min(max(args.workers, 1), len(stale)))]
+    sizes = [0] * len(batches)
+    for library in sorted(stale, key=lambda library:
+                                     -os.path.getsize(library.obf)):
+        smallest = sizes.index(min(sizes))
+        batches[smallest].append(library)
+        sizes[smallest] += os.path.getsize(library.obf)
+    return batches
+
+if stale:
+    jobs = []
+    outdirs = []
+    stale_batches = batches(stale)
+    for index, batch in enumerate(stale_batches):
+        # Written here and only moved into lib/ once the run worked, so a
+        # failed run can't leave half a library there.
+        outdir = os.path.join(TEMP, "batch-%d" % index)
+        clean_if_needed(outdir)
+        outdirs.append(outdir)
+        command = jvm.deobfuscator_command(
+            ["--stored_inheritance"] + obf_inheritances + [
+             "--config", SRG,
+             "--indir", OBF_LIBS, "--outdir", outdir,
+             "--infiles"] + [library.name for library in batch])
+        jobs.append((command, "deobfuscate",
+                     ", ".join(library.name for library in batch)))
+
+    exits = call_all(jobs)
+    for batch, outdir, exit in zip(stale_batches, outdirs, exits):
+        if exit != 0:
+            continue
+        for library in batch:
+            if os.name == "nt" and os.path.exists(library.deobf):
+                os.remove(library.deobf)
+            os.rename(os.path.join(outdir, library.name), library.deobf)
+            state["libraries"][library.name] = library_keys[library.name]
+        shutil.rmtree(outdir)
+    save_state()
+    if any(exits):
+        print "Aborting deobfuscate."
+        sys.exit(1)
 
 print "---Libraries deobfuscated---"
 print
 print "---Creating deobfuscated inheritance tables---"
-for library in minecraft_jars + libraries:
-    print library.name + "..."
-    obf_inheritances.append(library.build_inh(obfuscated=False))
+build_inheritance(obfuscated=False)
 
 print "---Deobfuscated inheritance tables complete---"
+
+# Builds pass one merged table to the obfuscator instead of all of lib/'s.
+MERGED_INHERITANCE = relative(inheritance.MERGED_TABLE)
+# The jars that the merged table was made from.
+MERGED_SOURCES = MERGED_INHERITANCE + ".sources"
+
+def merge_inheritance():
+    if not read_class_files:
+        # Can't merge tables without knowing their layout.
+        for filename in [MERGED_INHERITANCE, MERGED_SOURCES]:
+            if os.path.exists(filename):
+                os.remove(filename)
+        return
+
+    jobs = [library.inh_job(obfuscated=False)
+            for library in minecraft_jars + libraries]
+    sources = [(jar, os.path.getsize(jar), os.path.getmtime(jar))
+               for jar, table in jobs]
+    if os.path.exists(MERGED_INHERITANCE) \
+       and buildstate.load(MERGED_SOURCES) == sources:
+        print "The merged inheritance table is up to date."
+        return
+
+    inheritance.merge([table for jar, table in jobs], MERGED_INHERITANCE)
+    buildstate.save(MERGED_SOURCES, sources)
+    print "Merged %d inheritance tables into %s." \
+            % (len(jobs), inheritance.MERGED_TABLE)
+
+print
+merge_inheritance()
+buildstate.save(STAMP, stamp())
 print
 print "Library deobfuscation complete."
+
+if args.usage:
+    usage_log.save(absolute(args.usage))
+    print
+    for line in usage_log.summary():
+        print line
+    print "(Usage saved to %s.)" % args.usage
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Inheritance tables (.inh files) for jars, read straight from the class
+# headers instead of by starting a JVM.  Only the start of each class file
+# (up to its interface list) is ever inflated.
+#
+# Each line of a table is a class followed by its direct parents (superclass
+# first, then interfaces), all in internal form and separated by spaces.
+# That's meant to be what mcp_deobfuscate's --inheritance writes, but the
+# build checks it against a table from mcp_deobfuscate before relying on it;
+# see matches.
+
+import multiprocessing, os, zipfile
+
+import classfile
+
+# The merged table of everything in lib/, relative to the MCP directory.
+# deobfuscate_libs only writes it when the tables are in the layout above.
+MERGED_TABLE = os.path.join("temp", "lib_inheritance.inh")
+
+def read_jar(jar):
+    """{class name: [direct parents]} for every class in jar."""
+    table = {}
+    archive = zipfile.ZipFile(jar)
+    try:
+        for info in archive.infolist():
+            if not info.filename.endswith(".class"):
+                continue
+            stream = archive.open(info)
+            try:
+                parsed = classfile.ClassFile(stream, header_only=True)
+            except classfile.ClassFormatError:
+                continue # Not really a class; the JVM can't load it either.
+            finally:
+                stream.close()
+
+            parents = []
+            if parsed.super_name is not None:
+                parents.append(parsed.super_name)
+            table[parsed.name] = parents + parsed.interfaces
+    finally:
+        archive.close()
+    return table
+
+def read_references(jar):
+    """Every class that jar's classes mention in their constant pools, sorted.
+    That includes the jar's own classes, when they use each other.
+    """
+    references = set()
+    archive = zipfile.ZipFile(jar)
+    try:
+        for info in archive.infolist():
+            if not info.filename.endswith(".class"):
+                continue
+            stream = archive.open(info)
+            try:
+                parsed = classfile.ClassFile(stream, header_only=True)
+            except classfile.ClassFormatError:
+                continue
+            finally:
+                stream.close()
+            references.update(parsed.referenced_classes())
+    finally:
+        archive.close()
+    return sorted(references)
+
+def format_table(table):
+    return "".join(" ".join([name] + parents) + "\n"
+                   for name, parents in sorted(table.items()))
+
+def parse_table(text):
+    """The inverse of format_table."""
+    table = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if parts:
+            table[parts[0]] = parts[1:]
+    return table
+
+def write(job):
+    """Writes the table for a jar.  job is (jar, table file)."""
+    jar, filename = job
+    partial = "%s.%d.tmp" % (filename, os.getpid())
+    with open(partial, "w") as outfile:
+        outfile.write(format_table(read_jar(jar)))
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename) # Windows won't rename over an existing file.
+    os.rename(partial, filename)
+    return filename
+
+def map_all(function, jobs, workers=None):
+    """map(function, jobs), spread over workers processes (one per CPU by
+    default).  function has to be picklable, i.e. defined in a module.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(jobs) <= 1 or os.name == "nt":
+        # Windows would start the workers by running the script over again.
+        return map(function, jobs)
+
+    pool = multiprocessing.Pool(min(workers, len(jobs)))
+    try:
+        return pool.map(function, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def write_all(jobs, workers=None):
+    """Writes the tables for (jar, table file) jobs, spread over workers
+    processes (one per CPU by default).
+    """
+    return map_all(write, jobs, workers)
+
+def merge(tables, filename):
+    """Merges tables into one, sorted by class name.
+
+    A class that's in several tables keeps all of its lines, in the order of
+    tables, so the merged table says just what the separate ones did.
+    """
+    lines = []
+    for table in tables:
+        with open(table) as infile:
+            lines.extend(line.rstrip("\n") for line in infile if line.strip())
+    lines.sort(key=lambda line: line.split(" ", 1)[0])
+
+    partial = "%s.%d.tmp" % (filename, os.getpid())
+    with open(partial, "w") as outfile:
+        outfile.write("".join(line + "\n" for line in lines))
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename) # Windows won't rename over an existing file.
+    os.rename(partial, filename)
+
+def matches(jar, filename):
+    """Whether the table in filename says the same as the jar's classes do.
+
+    Parents are compared as sets, and lines in any order, so only the
+    content has to match.
+    """
+    with open(filename) as infile:
+        theirs = parse_table(infile.read())
+    ours = read_jar(jar)
+    return set(theirs) == set(ours) \
+           and all(set(theirs[name]) == set(ours[name]) for name in ours)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# How both scripts start Java to run mcp_deobfuscate.  The settings are read
+# from the [jvm] section of jvm.cfg in the MCP directory, if there is one:
+#
+#   [jvm]
+#   java = /usr/lib/jvm/java-17/bin/java   # Which java to run.
+#   heap = 1g                              # -Xmx
+#   gc = Serial                            # -XX:+UseSerialGC
+#   tiered_stop_at_level = 1               # Less JIT work for short runs.
+#   options = -Xss4m                       # Anything else.
+#   class_data_sharing = yes               # See below.
+#
+# With class_data_sharing, the first run saves the classes it loaded in an
+# AppCDS archive (under temp/jvm), and later runs map that archive instead
+# of loading and verifying the same classes again.  That needs Java 13 or
+# newer.  Archives are named after everything they depend on, so a new java,
+# new flags or new jars just make a new one.
+
+import ConfigParser, hashlib, os, os.path, re, shlex, subprocess
+
+# mcp_deobfuscate and its dependencies, relative to the MCP directory.
+DEOBFUSCATOR_CLASSPATH = [
+    "runtime/bin/jcommander-1.29.jar",
+    "jars/libraries/org/ow2/asm/asm-debug-all/4.1/asm-debug-all-4.1.jar",
+    "runtime/bin/mcp_deobfuscate-1.2.jar"]
+DEOBFUSCATOR_MAIN = "org.ldg.mcpd.MCPDeobfuscate"
+
+CONFIG_FILE = "jvm.cfg"
+ARCHIVE_DIR = os.path.join("temp", "jvm")
+
+JAVA_VERSION = re.compile(r'version "(\d+)(?:\.(\d+))?')
+
+class JavaProfile(object):
+    def __init__(self, base):
+        self.base = base
+        config = ConfigParser.RawConfigParser()
+        config.read(os.path.join(base, CONFIG_FILE))
+        def get(name, default=None):
+            if config.has_option("jvm", name):
+                return config.get("jvm", name).strip() or default
+            return default
+
+        self.java = get("java", "java")
+        self.flags = []
+        if get("heap"):
+            self.flags.append("-Xmx" + get("heap"))
+        if get("gc"):
+            self.flags.append("-XX:+Use%sGC" % get("gc"))
+        if get("tiered_stop_at_level"):
+            self.flags += ["-XX:+TieredCompilation",
+                           "-XX:TieredStopAtLevel=" + get("tiered_stop_at_level")]
+        self.flags += shlex.split(get("options", ""))
+        self.class_data_sharing = get("class_data_sharing", "no").lower() \
+                                  in ("yes", "true", "on", "1")
+
+        self.version_text = None
+        # The archive this process is creating, if any.
+        self.dumping = None
+        self.dump_tried = False
+
+    def version(self):
+        """What java -version says, or None if it can't be run."""
+        if self.version_text is None:
+            try:
+                process = subprocess.Popen([self.java, "-version"],
+                                           stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+                self.version_text = process.communicate()[0]
+            except OSError:
+                self.version_text = ""
+        return self.version_text or None
+
+    def major_version(self):
+        match = JAVA_VERSION.search(self.version() or "")
+        if match is None:
+            return None
+        major = int(match.group(1))
+        if major == 1 and match.group(2): # 1.8 and older
+            major = int(match.group(2))
+        return major
+
+    def archive(self, classpath):
+        """The CDS archive for running with classpath."""
+        key = hashlib.sha1(repr((os.path.realpath(self.java), self.version(),
+                                 self.flags,
+                                 [(entry, os.path.getsize(entry),
+                                   os.path.getmtime(entry))
+                                  for entry in classpath
+                                  if os.path.exists(entry)])))
+        return os.path.join(self.base, ARCHIVE_DIR,
+                            "deobfuscator-%s.jsa" % key.hexdigest()[:16])
+
+    def sharing_flags(self, classpath):
+        if not self.class_data_sharing:
+            return []
+
+        major = self.major_version()
+        if major is None or major < 13:
+            if not self.dump_tried:
+                print "Class data sharing needs Java 13 or newer; " \
+                      "running without it."
+                self.dump_tried = True
+            return []
+
+        archive = self.archive(classpath)
+        if os.path.exists(archive):
+            return ["-XX:SharedArchiveFile=" + archive]
+        if self.dump_tried:
+            return []
+
+        # Dumped under a name of our own, in case another build is dumping
+        # as well, and only put in place once it worked.
+        self.dump_tried = True
+        if not os.path.exists(os.path.dirname(archive)):
+            os.makedirs(os.path.dirname(archive))
+        self.dumping = (archive, "%s.%d.tmp" % (archive, os.getpid()))
+        return ["-XX:ArchiveClassesAtExit=" + self.dumping[1]]
+
+    def deobfuscator_command(self, arguments):
+        """The command that runs mcp_deobfuscate with arguments."""
+        return [self.java] + self.flags \
+               + self.sharing_flags(DEOBFUSCATOR_CLASSPATH) \
+               + ["-classpath", ":".join(DEOBFUSCATOR_CLASSPATH),
+                  DEOBFUSCATOR_MAIN] + arguments
+
+    def ran(self, command, exit):
+        """Called with every command run and its exit code, so that a new
+        archive can be put in place once it's been dumped.
+        """
+        if self.dumping is None:
+            return
+        archive, partial = self.dumping
+        if "-XX:ArchiveClassesAtExit=" + partial not in command:
+            return
+
+        self.dumping = None
+        if exit == 0 and os.path.exists(partial):
+            os.rename(partial, archive)
+        elif os.path.exists(partial):
+            os.remove(partial)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Lets several builds share one MCP directory.  Each run gets a temp
+# directory of its own, and whatever they share is guarded by file locks.
+
+import errno, os, os.path, re
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Not on Windows.
+
+# Per-run directories, named after the process that owns them.
+RUN_DIR = re.compile(r"^run-(\d+)$")
+
+class FileLock(object):
+    """An advisory lock on a file, held until it's released or the process
+    ends.  Any number of processes can hold a shared lock at once, but an
+    exclusive one keeps out everybody else.
+
+    Without fcntl, locks are always granted right away, so they don't
+    protect anything; runs just have to take turns, like they used to.
+    """
+    def __init__(self, filename, shared=False, description=None):
+        self.filename = filename
+        self.shared = shared
+        self.description = description or filename
+        self.file = None
+
+    def acquire(self, blocking=True):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        self.file = open(self.filename, "a")
+        if fcntl is None:
+            return True
+
+        if self.shared:
+            mode = fcntl.LOCK_SH
+        else:
+            mode = fcntl.LOCK_EX
+
+        try:
+            fcntl.flock(self.file.fileno(), mode | fcntl.LOCK_NB)
+            return True
+        except IOError, e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+
+        if not blocking:
+            self.release()
+            return False
+
+        print "Waiting for another build to finish with %s..." \
+                % self.description
+        fcntl.flock(self.file.fileno(), mode)
+        return True
+
+    def release(self):
+        # Closing the file lets go of the lock.
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def run_dir(root):
+    """This run's directory under root.  Its lock is run_dir(root) + ".lock"."""
+    return os.path.join(root, "run-%d" % os.getpid())
+
+def other_runs(root):
+    """Yields (directory, still running?) for other runs' directories."""
+    if not os.path.isdir(root):
+        return
+
+    own = run_dir(root)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not RUN_DIR.match(name) or path == own:
+            continue
+
+        lock = FileLock(path + ".lock")
+        if lock.acquire(blocking=False):
+            lock.release()
+            yield path, False
+        else:
+            yield path, True
+
+def stale_runs(root):
+    """The directories of runs that are over, with their lock files gone."""
+    stale = []
+    for path, running in other_runs(root):
+        if not running:
+            if os.path.exists(path + ".lock"):
+                os.remove(path + ".lock")
+            stale.append(path)
+    return stale
+
+def other_runs_active(root):
+    return any(running for path, running in other_runs(root))
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Zip entries that are prepared (read, checksummed and compressed) separately
+# from the archives they go into, so that the same work can be written into
+# any number of archives, or copied over from the last one.
+#
+# ZipFile can't write data that's already compressed, so archives are written
+# here, record by record, as the zip format (APPNOTE.TXT) lays them out.
+# ZipFile is only used to read them.
+
+import copy, hashlib, os, stat, struct, sys, threading, time, zipfile, zlib
+from multiprocessing.pool import ThreadPool
+
+import buildstate
+
+# What reproducible archives use instead of real timestamps and permissions.
+# 1980 is as early as a zip timestamp goes.
+FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+NORMAL_ATTR = (stat.S_IFREG | 0644) << 16
+UNIX = 3
+# Where ZipInfo says files come from by default.
+if sys.platform == "win32":
+    DEFAULT_SYSTEM = 0
+else:
+    DEFAULT_SYSTEM = UNIX
+
+# The records of a zip archive.
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_SIGNATURE = "PK\x03\x04"
+CENTRAL_HEADER = struct.Struct("<4s4B4H3L5H2L")
+CENTRAL_SIGNATURE = "PK\x01\x02"
+END_RECORD = struct.Struct("<4s4H2LH")
+END_SIGNATURE = "PK\x05\x06"
+# Version 2.0 of the format, which is all that's needed without zip64.
+ZIP_VERSION = 20
+# General purpose flag: the name is UTF-8.
+UTF8_NAME = 0x800
+# The largest sizes, offsets and counts there's room for without zip64.
+SIZE_LIMIT = 0xFFFFFFFF
+COUNT_LIMIT = 0xFFFF
+
+class Entry(object):
+    """A file's contents, ready to be written into a zip archive."""
+    def __init__(self, data, compress_type=zipfile.ZIP_STORED,
+                 date_time=None, external_attr=0600 << 16, previous=None,
+                 name=None, store=None):
+        if date_time is None:
+            date_time = time.localtime(time.time())[:6]
+
+        self.date_time = date_time
+        self.external_attr = external_attr
+        self.create_system = None # Whatever ZipInfo defaults to.
+        self.compress_type = compress_type
+        self.file_size = len(data)
+        self.crc = zlib.crc32(data) & 0xffffffff
+        self.digest = hashlib.sha1(data).hexdigest()
+
+        # If the same contents were compressed earlier in this run, or the
+        # last archive had them under this name, the compressed bytes can be
+        # used as they are.
+        compressed = None
+        if store is not None:
+            compressed = store.compressed(self)
+        if compressed is None and previous is not None:
+            compressed = previous.compressed(name, self)
+
+        if compressed is not None:
+            data = compressed
+        elif compress_type == zipfile.ZIP_DEFLATED:
+            # The same settings ZipFile uses, so the output doesn't change.
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                          zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        self.data = data
+
+        if store is not None:
+            store.add(self)
+
+    def normalized(self):
+        """A copy with a fixed timestamp and plain file permissions."""
+        entry = copy.copy(self)
+        entry.date_time = FIXED_DATE_TIME
+        entry.external_attr = NORMAL_ATTR
+        entry.create_system = UNIX
+        return entry
+
+def data_entry(data, compress_type=zipfile.ZIP_STORED, previous=None,
+               name=None, store=None):
+    """An entry like ZipFile.writestr would create for a bare name."""
+    return Entry(data, compress_type, previous=previous, name=name,
+                 store=store)
+
+def file_entry(filename, compress_type=zipfile.ZIP_STORED, previous=None,
+               name=None, store=None):
+    """An entry like ZipFile.write would create for a file."""
+    info = os.stat(filename)
+    date_time = time.localtime(info.st_mtime)[:6]
+    external_attr = (info.st_mode & 0xFFFF) << 16
+
+    with open(filename, "rb") as infile:
+        data = infile.read()
+    return Entry(data, compress_type, date_time, external_attr, previous,
+                 name, store)
+
+class EntryStore(object):
+    """Compressed contents by hash, shared by all the archives of a run.
+
+    Identical contents, whether they're in several sides' packages or in
+    several projects, are only compressed once.  They're still read (and
+    substituted) each time, since that's what finds their hash.  Stored
+    entries aren't kept, since there's nothing to save on them, and neither
+    is anything past limit bytes of compressed data.
+    """
+    def __init__(self, limit=64 * 1024 * 1024):
+        # {(digest, compress type): compressed data}
+        self.entries = {}
+        self.size = 0
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def compressed(self, entry):
+        if entry.compress_type == zipfile.ZIP_STORED:
+            return None
+        found = self.entries.get((entry.digest, entry.compress_type))
+        if found is None:
+            return None
+        with self.lock:
+            self.hits += 1
+        return found
+
+    def add(self, entry):
+        if entry.compress_type == zipfile.ZIP_STORED:
+            return
+        key = (entry.digest, entry.compress_type)
+        with self.lock:
+            if key in self.entries \
+               or self.size + len(entry.data) > self.limit:
+                return
+            self.entries[key] = entry.data
+            self.size += len(entry.data)
+
+def read_raw(stream, info):
+    """An entry's compressed bytes, straight out of an archive's file.
+    info is the entry's ZipInfo.
+
+    Returns None if the entry's local header doesn't look right.
+    """
+    if info.flag_bits & 0x1:
+        return None # Encrypted.
+
+    stream.seek(info.header_offset)
+    header = stream.read(LOCAL_HEADER.size)
+    if len(header) != LOCAL_HEADER.size:
+        return None
+    header = LOCAL_HEADER.unpack(header)
+    if header[0] != LOCAL_SIGNATURE:
+        return None
+
+    name_length, extra_length = header[-2:]
+    stream.seek(name_length + extra_length, 1)
+    data = stream.read(info.compress_size)
+    if len(data) != info.compress_size:
+        return None
+    return data
+
+def manifest(entries):
+    """What went into an archive, for PreviousArchive to check against."""
+    return dict((name, (entry.digest, entry.compress_type, entry.crc,
+                        entry.file_size))
+                for name, entry in entries)
+
+class PreviousArchive(object):
+    """The last archive written for a package, along with its manifest.
+
+    Entries whose contents haven't changed since then are copied over
+    compressed, instead of being compressed all over again.  They have to
+    match the manifest's hash and the archive's own CRC and size, so a
+    stale or damaged archive just means compressing everything.
+    """
+    def __init__(self, filename, manifest_file):
+        self.manifest = buildstate.load(manifest_file, {})
+        self.archive = None
+        # The archive's file, for reading entries raw.
+        self.stream = None
+        if self.manifest and os.path.exists(filename):
+            try:
+                self.archive = zipfile.ZipFile(filename)
+                self.stream = open(filename, "rb")
+            except (zipfile.BadZipfile, IOError):
+                self.close()
+        self.lock = threading.Lock()
+        self.reused = 0
+
+    def compressed(self, name, entry):
+        if self.archive is None or name is None:
+            return None
+
+        known = (entry.digest, entry.compress_type, entry.crc, entry.file_size)
+        if self.manifest.get(name) != known:
+            return None
+
+        try:
+            info = self.archive.getinfo(name.replace(os.sep, "/"))
+        except KeyError:
+            return None
+        if (info.compress_type, info.CRC, info.file_size) != known[1:]:
+            return None
+
+        # Entries are prepared on several threads, but they all share the
+        # archive's file.
+        with self.lock:
+            data = read_raw(self.stream, info)
+            if data is not None:
+                self.reused += 1
+        return data
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+class Packer(object):
+    """Prepares entries on a pool of threads.
+
+    zlib lets go of the GIL while it compresses, so entries really are
+    compressed in parallel.  Each entry is compressed on its own, with the
+    same settings either way, so the results don't depend on the number of
+    workers.
+    """
+    def __init__(self, workers=1):
+        if workers > 1:
+            self.pool = ThreadPool(workers)
+        else:
+            self.pool = None
+
+    def map(self, function, items):
+        """Like map(function, items), in order, but spread over the pool."""
+        if self.pool is None or len(items) < 2:
+            return map(function, items)
+        return self.pool.map(function, items, chunksize=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+def dos_date_time(date_time):
+    """The (date, time) fields of a zip record for a timestamp."""
+    year, month, day, hour, minute, second = date_time
+    return ((year - 1980) << 9 | month << 5 | day,
+            hour << 11 | minute << 5 | second // 2)
+
+def encode_name(name):
+    """(name as bytes, flags) for an entry name, the way ZipInfo does it."""
+    if os.sep != "/":
+        name = name.replace(os.sep, "/")
+    if isinstance(name, unicode):
+        try:
+            return name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return name.encode("utf-8"), UTF8_NAME
+    return name, 0
+
+class ArchiveWriter(object):
+    """Writes prepared entries into a new archive, as they are.
+
+    Archives are written without zip64, which no package comes close to
+    needing; zipfile.LargeZipFile is raised if one would.
+    """
+    def __init__(self, filename):
+        self.file = open(filename, "wb")
+        # The central directory's records, written by close.
+        self.central = []
+
+    def write(self, name, entry):
+        name, flags = encode_name(name)
+        offset = self.file.tell()
+        if entry.file_size > SIZE_LIMIT or len(entry.data) > SIZE_LIMIT \
+           or offset > SIZE_LIMIT or len(self.central) >= COUNT_LIMIT:
+            raise zipfile.LargeZipFile("%s would need zip64." % name)
+
+        date, time_of_day = dos_date_time(entry.date_time)
+        create_system = entry.create_system
+        if create_system is None:
+            create_system = DEFAULT_SYSTEM
+
+        self.file.write(LOCAL_HEADER.pack(
+            LOCAL_SIGNATURE, ZIP_VERSION, flags, entry.compress_type,
+            time_of_day, date, entry.crc, len(entry.data), entry.file_size,
+            len(name), 0))
+        self.file.write(name)
+        self.file.write(entry.data)
+
+        self.central.append(CENTRAL_HEADER.pack(
+            CENTRAL_SIGNATURE, ZIP_VERSION, create_system, ZIP_VERSION, 0,
+            flags, entry.compress_type, time_of_day, date, entry.crc,
+            len(entry.data), entry.file_size, len(name), 0, 0, 0, 0,
+            entry.external_attr, offset) + name)
+
+    def close(self):
+        """Writes the central directory and closes the file."""
+        try:
+            start = self.file.tell()
+            self.file.write("".join(self.central))
+            size = self.file.tell() - start
+            if start > SIZE_LIMIT or size > SIZE_LIMIT:
+                raise zipfile.LargeZipFile("The archive would need zip64.")
+            self.file.write(END_RECORD.pack(END_SIGNATURE, 0, 0,
+                                            len(self.central),
+                                            len(self.central), size, start, 0))
+        finally:
+            self.file.close()
+
+def write_archive(filename, entries, reproducible=False):
+    """Writes (name, entry) pairs into a new archive, replacing any old one.
+    Returns the entries as they were written.
+
+    Reproducible archives only depend on the entries' names and contents:
+    they're written in sorted order, with a fixed timestamp and plain
+    permissions.  A later entry replaces an earlier one with the same name
+    instead of being added next to it.
+    """
+    if reproducible:
+        entries = sorted((name, entry.normalized())
+                         for name, entry in dict(entries).items())
+
+    archive = ArchiveWriter(filename)
+    try:
+        for name, entry in entries:
+            archive.write(name, entry)
+    finally:
+        archive.close()
+    return entries
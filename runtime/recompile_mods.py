@@ -6,12 +6,21 @@
 
 import itertools, os, os.path, platform, shutil, subprocess, sys, tarfile, \
        zipfile, tempfile, fnmatch, re, collections, StringIO, contextlib, \
-       traceback
+       traceback, argparse, hashlib, glob, multiprocessing, json, threading, \
+       Queue, time
 
 from patch import fromfile as build_patch
+import artifactcache, builddaemon, buildstate, buildtrace, childusage, \
+       classfile, classindex, inheritance, jvmprofile, locking, packaging, \
+       srgindex, staging, tokenindex, warmjavac, watching
 
 SUBST_TOKEN = re.compile("%(conf|MD|FD|CL):([^%]*)%")
 
+# Used to find out which libraries a source file might need.
+PACKAGE_DECLARATION = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.M)
+IMPORT = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+?)(?:\.\*)?\s*;", re.M)
+DOTTED_NAME = re.compile(r"\b[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+")
+
 class KnownFailure(Exception):
     pass
 
@@ -24,47 +33,261 @@ class ObfuscateFailed(KnownFailure):
 # Convenience functions.  These make the settings settings easier to work with.
 absolute = lambda rawpath: os.path.abspath(os.path.expanduser(rawpath))
 relative = lambda relpath: absolute(os.path.join(BASE, relpath))
+def run_relative(arg):
+    """A command line argument with the paths (or path lists) in this run's
+    TEMP made relative to it, so that it's the same in every run.
+    """
+    paths = arg.split(":")
+    for i, path in enumerate(paths):
+        if path == TEMP or path.startswith(os.path.join(TEMP, "")):
+            paths[i] = os.path.join("<TEMP>", os.path.relpath(path, TEMP))
+    return ":".join(paths)
+
 def make_if_needed(dir):
     if not os.path.exists(dir):
         os.makedirs(dir)
+# Old trees are moved aside and removed in the background.
+janitor = staging.Janitor()
 def create_or_clean(dir):
     if os.path.exists(dir):
-        shutil.rmtree(dir)
+        janitor.discard(dir)
     os.makedirs(dir)
+def publish(filename, name=None, hardlinks=True):
+    """Moves a finished package into TARGET in one step, so that nobody
+    (including other builds) ever sees half of one.
+
+    Without hardlinks, the package never shares its inode with filename, so
+    whatever rewrites it in place can't change filename too.
+    """
+    if name is None:
+        name = os.path.basename(filename)
+    partial = os.path.join(TARGET, ".%s.%d.tmp" % (name, os.getpid()))
+    staging.stage(filename, partial, hardlinks)
+
+    final = os.path.join(TARGET, name)
+    if os.name == "nt" and os.path.exists(final):
+        os.remove(final) # Windows won't rename over an existing file.
+    os.rename(partial, final)
+
+# Bumped whenever the records of incremental compiles change format.
+RECORD_FORMAT = 3
+
+# Fingerprints of classpath entries, computed at most once per run.
+classpath_fingerprints = {}
+def classpath_fingerprint(entry):
+    if entry not in classpath_fingerprints:
+        if os.path.isdir(entry):
+            # Directories (like the API classes) get rebuilt every run, so
+            # only their contents count.
+            digest = hashlib.sha1()
+            for (dir, subdirs, files) in sorted(os.walk(entry)):
+                subdirs.sort()
+                for file in sorted(files):
+                    full_name = os.path.join(dir, file)
+                    digest.update(os.path.relpath(full_name, entry))
+                    digest.update(buildstate.hash_file(full_name))
+            fingerprint = digest.hexdigest()
+        elif os.path.exists(entry):
+            stat = os.stat(entry)
+            fingerprint = (stat.st_size, stat.st_mtime)
+        else:
+            fingerprint = None
+        classpath_fingerprints[entry] = fingerprint
+    return classpath_fingerprints[entry]
+
+# ABI and constant fingerprints and direct parents of each class in a
+# directory, by class name.
+class_fingerprint_cache = {}
+def class_fingerprints(dir):
+    if dir not in class_fingerprint_cache:
+        fingerprints = {}
+        for filename in Project.collect_files(dir, relative=True,
+                                              required_extension=".class"):
+            with open(os.path.join(dir, filename), "rb") as infile:
+                parsed = classfile.ClassFile(infile.read())
+            fingerprints[parsed.name] = (classfile.abi_fingerprint(parsed),
+                                         classfile.constants_fingerprint(parsed),
+                                         classfile.parents(parsed))
+        class_fingerprint_cache[dir] = fingerprints
+    return class_fingerprint_cache[dir]
+
+def with_subclasses(names, parents):
+    """names, plus every class that extends or implements one of them,
+    directly or not.  parents is {class name: its direct parents}.
+
+    A class's inherited members are used through the class itself (b.foo()
+    refers to B.foo even when A declares it), so when A's ABI changes, so does
+    what B offers.
+    """
+    children = {}
+    for name, direct in parents.items():
+        for parent in direct:
+            children.setdefault(parent, []).append(name)
+
+    found = set(names)
+    pending = list(found)
+    while pending:
+        for child in children.get(pending.pop(), []):
+            if child not in found:
+                found.add(child)
+                pending.append(child)
+    return found
 
 CLIENT, SERVER, FORGE = range(3)
+SIDE_NAMES = ["client", "server", "universal"]
 
 BASE = absolute(".")
 USER = relative("mods")
-TEMP = relative("temp/mods")
 LIB = relative("lib")
 JAR_LIB = relative("jars/libraries")
 MCP_TEMP = relative("temp")
 TARGET = relative("packages")
+# Compiled classes and their dependency records.  Unlike TEMP, this survives
+# between runs, so that only changed sources need to be recompiled.
+BUILD = relative("temp/mods_build")
+# Which library holds which classes, so that each project can compile against
+# just the libraries it needs.
+CLASS_INDEX = os.path.join(BUILD, "classes.idx")
+# Locks on what builds share.
+LOCKS = relative("temp/locks")
+STATE_LOCK = os.path.join(LOCKS, "state.lock")
+# This script, to run it again (for workers, say).  __file__ may be the .pyc
+# if it was imported.
+SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+# Where the build daemon listens.
+DAEMON_SOCKET = relative("temp/mods_daemon.sock")
 
 MCP_SRC = [relative("src/minecraft"),
            relative("src/minecraft_server"),
            relative("src/minecraft")]
 
 SRG = os.path.join(MCP_TEMP, "full.srg")
+CLIENT_SRG = os.path.join(MCP_TEMP, "client_ro.srg")
+SERVER_SRG = os.path.join(MCP_TEMP, "server_ro.srg")
+
+# How the obfuscator is run.
+jvm = jvmprofile.JavaProfile(BASE)
+
+parser = argparse.ArgumentParser(
+    prog="recompile_mods.py [build]",
+    description="Compiles, packages and obfuscates the projects in mods/.",
+    epilog="recompile_mods.py projects lists the projects, "
+           "recompile_mods.py config shows the settings and "
+           "recompile_mods.py srg NAME looks names up in the SRG, all "
+           "without building anything.  (To build projects by those names, "
+           "start with build.)")
+parser.add_argument("projects", nargs="*",
+                    help="Only build these projects.  (Default: all of them.)")
+parser.add_argument("--full", action="store_true",
+                    help="Recompile every source file, not just the ones "
+                         "that changed since the last build.")
+parser.add_argument("--cache", metavar="DIR",
+                    help="Keep compiled and obfuscated packages in this "
+                         "directory, keyed by a hash of their inputs, and "
+                         "reuse them instead of building again.  It can be "
+                         "shared between checkouts and machines.")
+parser.add_argument("--full-classpath", action="store_true",
+                    help="Compile against every library, not just the ones "
+                         "each project's sources refer to.")
+parser.add_argument("--reproducible", action="store_true",
+                    help="Package in a way that only depends on the files' "
+                         "names and contents, so that the same inputs always "
+                         "give byte-identical packages.  Unchanged packages "
+                         "aren't obfuscated again.")
+parser.add_argument("--compress", action="store_true",
+                    help="Deflate the files in packages instead of just "
+                         "storing them.")
+parser.add_argument("--package-workers", type=int, metavar="N",
+                    default=multiprocessing.cpu_count(),
+                    help="How many threads read and compress package "
+                         "entries.  (Default: one per CPU.)  The packages "
+                         "come out the same no matter how many there are.")
+parser.add_argument("--temp", metavar="DIR",
+                    help="Put the temporary build trees in a directory of "
+                         "their own under DIR instead of temp/mods.  A tmpfs "
+                         "like /dev/shm saves a lot of disk I/O.  Packages "
+                         "and what incremental builds need are kept in MCP "
+                         "either way.")
+parser.add_argument("--workers", type=int, metavar="N", default=1,
+                    help="Build N projects at a time, each in a worker "
+                         "process of its own.")
+parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+# Where a worker finds the APIs its coordinator built.
+parser.add_argument("--api-dir", help=argparse.SUPPRESS)
+parser.add_argument("--side", action="append", choices=["client", "server"],
+                    help="Only build this side.  (Can be given twice.)  "
+                         "Ignored with Forge, which only has the one.")
+parser.add_argument("--watch", action="store_true",
+                    help="Build, then keep building whatever changes in "
+                         "mods/, lib/ or the SRG affect.")
+parser.add_argument("--trace", metavar="FILE",
+                    help="Time each phase of the build, save the times to "
+                         "FILE in Chrome's trace format (for "
+                         "chrome://tracing) and sum them up at the end.")
+parser.add_argument("--usage", metavar="FILE",
+                    help="Save the wall time, CPU time and peak memory of "
+                         "every javac and obfuscator run to FILE as JSON, "
+                         "and sum them up by phase at the end.")
+parser.add_argument("--daemon", action="store_true",
+                    help="Keep running, and build whenever asked to with "
+                         "--via-daemon.  The SRG and such are only loaded "
+                         "again when they change.")
+parser.add_argument("--via-daemon", action="store_true",
+                    help="Have the build daemon do this build, if one is "
+                         "running.")
+
+def apply_args():
+    """Sets up whatever depends on the command line."""
+    global coordinating, TEMP_ROOT, TEMP, PACKAGE_COMPRESSION
+
+    # With more than one worker, this process only hands out the projects and
+    # collects the results.
+    coordinating = args.workers > 1 and not args.worker
+
+    # Each run gets a temp directory of its own under here, so that several
+    # builds can share this MCP directory.
+    if args.temp:
+        # Named after this MCP directory, so that several can share DIR.
+        TEMP_ROOT = os.path.join(absolute(args.temp), "mcp_mods_"
+                                 + hashlib.sha1(BASE).hexdigest()[:8])
+    else:
+        TEMP_ROOT = relative("temp/mods")
+    TEMP = locking.run_dir(TEMP_ROOT)
 
-# Most of this script assumes it's in the MCP directory, so let's go there.
-os.chdir(BASE)
-
-# Create the project directory and force it to be seen as a category.
-if not os.path.exists(USER):
-    os.makedirs(USER)
-
-    # Touch the CATEGORY file.
-    with open(os.path.join(USER, "CATEGORY"), "w") as catfile:
-        catfile.write("This is a placeholder file to mark this directory as a "
-                      "category, not a project.")
-
-# Create/clean the temp directory.
-create_or_clean(TEMP)
-
-# Create/clean the package directory.
-create_or_clean(TARGET)
+    if args.compress:
+        PACKAGE_COMPRESSION = zipfile.ZIP_DEFLATED
+    else:
+        PACKAGE_COMPRESSION = zipfile.ZIP_STORED
+
+# Times each phase of the build, for --trace.
+tracer = buildtrace.Tracer()
+# What each child process cost, and in which phase.
+usage_log = childusage.UsageLog()
+
+def start_run():
+    """Takes the locks a build needs, and sets up its directories."""
+    global lib_lock, run_lock
+
+    # The libraries, their inheritance tables and the SRG belong to
+    # deobfuscate_libs, which won't touch them while any build holds this.
+    lib_lock = locking.FileLock(os.path.join(LOCKS, "lib.lock"), shared=True,
+                                description="lib/")
+    lib_lock.acquire()
+
+    # Claim this run's temp directory, and clean up after runs that are over.
+    run_lock = locking.FileLock(TEMP + ".lock")
+    run_lock.acquire()
+    janitor.sweep(TEMP_ROOT)
+    for stale_dir in locking.stale_runs(TEMP_ROOT):
+        janitor.discard(stale_dir)
+    create_or_clean(TEMP)
+
+    # Create the package directory.  Old packages are replaced as projects are
+    # built, and whatever is left over gets cleaned out at the end.
+    make_if_needed(TARGET)
+
+    make_if_needed(BUILD)
+    janitor.sweep(BUILD)
 
 # JAR files to build against.
 DEOBF_CLIENT = relative("temp/minecraft_exc.jar")
@@ -82,21 +305,39 @@ MCP_REOBF = relative("reobf")
 MCP_REOBF_CLIENT = os.path.join(MCP_REOBF, "minecraft")
 MCP_REOBF_SERVER = os.path.join(MCP_REOBF, "minecraft_server")
 
+def path_stamp(path):
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime)
+    return (path, None)
+
+def daemon_stamp():
+    """Changes whenever anything the daemon keeps loaded might have."""
+    paths = [SRG, CLIENT_SRG, SERVER_SRG, relative("runtime/commands.py")]
+    paths += glob.glob(os.path.join(os.path.dirname(SCRIPT), "*.py"))
+    paths.append(warmjavac.SOURCE)
+    return [path_stamp(path) for path in paths]
+
+# The SRG, as {line type: {deobfuscated name: obfuscated name}}.  Only loaded
+# by what needs it, with load_srg.
 OBF_KEY = collections.defaultdict(dict)
-with open(SRG) as srgfile:
-    for line in srgfile.readlines():
-        parts = line.split("#")[0].split()
-
-        if len(parts) < 2:
-            continue
-
-        line_type = parts[0].strip(":")
-        parts = parts[1:]
-
-        size = len(parts) // 2
-        obf, deobf = " ".join(parts[:size]), " ".join(parts[size:])
-
-        OBF_KEY[line_type][deobf] = obf
+def load_srg():
+    if OBF_KEY:
+        return
+    with tracer.phase("srg"):
+        for line_type, obf, deobf in srgindex.read_srg(SRG):
+            OBF_KEY[line_type][deobf] = obf
+
+# OBF_KEY, indexed for searches, once something has asked.
+loaded_srg_index = []
+def srg_index():
+    if not loaded_srg_index:
+        load_srg()
+        loaded_srg_index.append(srgindex.SrgIndex(
+            (line_type, obf, deobf)
+            for line_type, names in OBF_KEY.items()
+            for deobf, obf in names.items()))
+    return loaded_srg_index[0]
 
 # This class is used to represent a user project, also known as a subdirectory
 # of USER.  The format is described in the README.
@@ -119,6 +360,13 @@ class Project(object):
         self.hide_source     = self.get_config("HIDE_SOURCE",  False, data_type=bool)
         self.suppress_warnings     = self.get_config("NOT_MY_CODE",  False, data_type=bool)
 
+        # The substitution tokens each file used, by path within the project.
+        self.token_usage = collections.defaultdict(set)
+
+        # Side-independent work, done once per run and shared by all sides.
+        self.common_sources = None
+        self.common_entries = None
+
     def get_config(self, setting, default=None, data_type=str):
         filename = os.path.join(self.dir, "conf", setting)
         exists = os.path.isfile(filename)
@@ -137,26 +385,30 @@ class Project(object):
 
 
     @staticmethod
-    def collect_projects(root, projects):
+    def collect_projects(root, projects, quiet=False):
         """Collects all the active projects under root into projects."""
+        def say(message):
+            if not quiet:
+                print message
+
         for (dir, subdirs, files) in os.walk(root, followlinks=True):
             if "DISABLED" in files or "DISABLE" in files:
                 # This project or category has been disabled.  Skip it.
                 del subdirs[:]
-                print "Disabled project or category at %s." % dir
+                say("Disabled project or category at %s." % dir)
             elif "CATEGORY" in files:
                 # This is a category, not a project.  Continue normally.
                 pass
-                print "Found category at %s, recursing." % dir
+                say("Found category at %s, recursing." % dir)
             else:
                 # This is a project.  Create it, but do not continue into
                 # subdirectories.
                 project = Project(dir)
                 if project.disabled:
-                    print "Disabled project or category at %s.  (Disabled by conf/)" % dir
+                    say("Disabled project or category at %s.  (Disabled by conf/)" % dir)
                 else:
                     projects.append(Project(dir))
-                    print "Found project at %s." % dir
+                    say("Found project at %s." % dir)
 
                 del subdirs[:]
 
@@ -169,15 +421,106 @@ class Project(object):
                 if file.startswith("."):
                     continue
 
-                try:
-                    shutil.copy2(os.path.join(source_dir, file), dest_dir)
-                except shutil.WindowsError:
-                    pass # Windows doesn't like copying access time.
+                staging.stage(os.path.join(source_dir, file),
+                              os.path.join(dest_dir, file))
 
             for i in range(len(subdirs), 0, -1):
                 if subdirs[i-1].startswith("."):
                     del subdirs[i-1]
 
+    def input_fingerprint(self, all_projects, environment):
+        """Fingerprints everything this project's packages are built from.
+
+        That's the project itself, its dependencies and the given build
+        environment.  The SRG isn't included; its effect is tracked token by
+        token instead.
+        """
+        inputs = [environment, self.dependencies]
+        for dep, filename, full_name in self.input_files(all_projects):
+            stat = os.stat(full_name)
+            inputs.append((dep, filename, stat.st_size, stat.st_mtime))
+        return buildstate.hash_bytes(repr(inputs))
+
+    def input_files(self, all_projects):
+        """Yields (project name, relative name, full name) for every file in
+        this project and its dependencies.
+        """
+        for dep in [self.name] + self.dependencies:
+            project = all_projects.get(dep, None)
+            if project is None:
+                continue
+            for filename in sorted(self.collect_files(project.dir,
+                                                      relative=True)):
+                yield dep, filename, os.path.join(project.dir, filename)
+
+    def cache_key(self, all_projects, side, environment):
+        """Hashes the contents of everything that goes into one side's
+        packages, for the artifact cache.  Unlike input_fingerprint, it only
+        depends on file contents, so it's the same in every checkout.
+        """
+        inputs = [environment, side, self.name, self.dependencies]
+        for dep, filename, full_name in self.input_files(all_projects):
+            inputs.append((dep, filename, file_hashes.hash(full_name)))
+        return buildstate.hash_bytes(repr(inputs))
+
+    def store_artifacts(self, cache, key, side, compile_dir, created):
+        """Puts one side's compiled classes and packages into the cache."""
+        classes = os.path.join(TEMP, "classes.zip")
+        archive = zipfile.ZipFile(classes, "w")
+        try:
+            for filename in sorted(self.collect_files(compile_dir,
+                                                      relative=True)):
+                archive.write(os.path.join(compile_dir, filename), filename)
+        finally:
+            archive.close()
+
+        files = {"classes.zip": classes}
+        if os.path.exists(compile_dir + ".deps"):
+            files["classes.deps"] = compile_dir + ".deps"
+        if created:
+            package = self.get_package_file(side)
+            files["package"] = package
+            files["obfuscated"] = os.path.join(TARGET,
+                                               os.path.basename(package))
+
+        cache.store(key, files, {"created": created,
+                                 "token_usage": dict(self.token_usage)})
+        os.remove(classes)
+
+    def restore_artifacts(self, cached, side, compile_dir):
+        """Restores one side's classes and packages from the cache, in place
+        of compiling, packaging and obfuscating.  Returns whether there is a
+        package.  Raises artifactcache.BadEntry if the entry can't be used.
+        """
+        files, metadata = cached
+
+        create_or_clean(compile_dir)
+        try:
+            artifactcache.extract(files["classes.zip"], compile_dir)
+
+            if "classes.deps" in files:
+                shutil.copyfile(files["classes.deps"], compile_dir + ".deps")
+            else:
+                buildstate.discard(compile_dir + ".deps")
+
+            if metadata["created"]:
+                package = self.get_package_file(side)
+                shutil.copyfile(files["package"], package)
+                # The cache entry is shared; packages/ is anybody's to change.
+                publish(files["obfuscated"], os.path.basename(package),
+                        hardlinks=False)
+        except (artifactcache.BadEntry, IOError, OSError, KeyError), e:
+            # Don't let an incremental compile trust what got extracted.
+            create_or_clean(compile_dir)
+            buildstate.discard(compile_dir + ".deps")
+            if isinstance(e, artifactcache.BadEntry):
+                raise
+            raise artifactcache.BadEntry(str(e))
+
+        for filename, tokens in metadata["token_usage"].items():
+            self.token_usage[filename].update(tokens)
+        return metadata["created"]
+
     def get_package_file(self, side):
         if self.package_name is not None:
             filename = self.package_name
@@ -223,35 +566,6 @@ class Project(object):
 
         return all_files
 
-    def zip(self, archive_name, files=None, clean=False, do_replace=False):
-        if clean or not os.path.exists(archive_name):
-            mode = "w"
-        else:
-            mode = "a"
-
-        archive = zipfile.ZipFile(archive_name, mode)
-        try:
-            if files is None:
-                for dir, subdirs, files in os.walk(".", followlinks=True):
-                    for file in files:
-                        full_path = os.path.join(dir, file)
-                        if do_replace:
-                            contents = self.replace_tokens(full_path)
-                            full_path = os.path.relpath(full_path)
-                            archive.writestr(full_path, contents)
-                        else:
-                            archive.write(full_path)
-            else:
-                for file in files:
-                    if do_replace:
-                        contents = self.replace_tokens(file)
-                        full_path = os.path.relpath(full_path)
-                        archive.writestr(file, contents)
-                    else:
-                        archive.write(file)
-        finally:
-            archive.close()
-
     def get_source_dirs(self, side):
         source_dirs = [os.path.join(self.dir, "src", "common")]
         if side == CLIENT:
@@ -298,8 +612,14 @@ class Project(object):
             if replacement is not None:
                 return replacement
             else:
-                raise CompileFailed("No SRG entry of type %s for '%s'" %
-                                                    (subst_type, value))
+                message = "No SRG entry of type %s for '%s'" % (subst_type,
+                                                                value)
+                suggestions = srg_index().suggest(subst_type, value)
+                if suggestions:
+                    message += ".  Did you mean %s?" \
+                               % " or ".join("'%s'" % suggestion
+                                             for suggestion in suggestions)
+                raise CompileFailed(message)
         else:
             raise CompileFailed("Unrecognized subst token '%%%s:%s%%'" %
                                                     (subst_type, value))
@@ -307,6 +627,7 @@ class Project(object):
     def replace_tokens(self, filename, output_root=None):
         input_name = filename
         output_name_raw = self.shorten_filename(filename)
+        usage = self.token_usage[os.path.relpath(filename, self.dir)]
 
         split = SUBST_TOKEN.split(output_name_raw)
         output_name = ""
@@ -316,8 +637,14 @@ class Project(object):
             elif index % 3 == 1:
                 token_type = token
             else:
+                usage.add((token_type, token))
                 output_name += self.do_replacement(token_type, token)
 
+        with open(input_name) as infile:
+            contents = infile.read()
+
+        split = SUBST_TOKEN.split(contents)
+
         if output_root is not None:
             output = os.path.join(output_root, output_name)
 
@@ -325,6 +652,11 @@ class Project(object):
             if not os.path.exists(outdir):
                 os.makedirs(outdir)
 
+            if len(split) == 1:
+                # No tokens, so there's nothing to write.
+                staging.stage(input_name, output)
+                return output
+
             stream = open(output, "w")
         else:
             output = None
@@ -335,11 +667,6 @@ class Project(object):
 
             stream = string_stream()
 
-        with open(input_name) as infile:
-            contents = infile.read()
-
-        split = SUBST_TOKEN.split(contents)
-
         with stream as outfile:
             for index, token in enumerate(split):
                 if index % 3 == 0:
@@ -347,6 +674,7 @@ class Project(object):
                 elif index % 3 == 1:
                     token_type = token
                 else:
+                    usage.add((token_type, token))
                     outfile.write(self.do_replacement(token_type, token))
 
         if output is None:
@@ -393,7 +721,9 @@ class Project(object):
                                                        patch_target)
 
                         os.makedirs(os.path.dirname(target_location))
-                        shutil.copy2(source_file, target_location)
+                        # The patch replaces the file instead of changing
+                        # it, so it's safe to start from a link.
+                        staging.stage(source_file, target_location)
 
                 if patch_target is not None:
                     break
@@ -417,79 +747,482 @@ class Project(object):
 
         return patched_files
 
-    def compile(self, all_projects, side, out_dir, temp_dir, library_classpath, api=False):
+    def substitute_common_sources(self, common_dir):
+        """Substitutes tokens in the common sources, once per run.
+
+        Returns a map from each source file to its substituted copy.  The
+        results don't depend on the side, so all sides (and the API build)
+        share them.
+        """
+        if self.common_sources is None:
+            create_or_clean(common_dir)
+            common_sources = {}
+            for filename in self.collect_files(
+                    os.path.join(self.dir, "src", "common"),
+                    required_extension=".java"):
+                common_sources[filename] = \
+                        self.replace_tokens(filename, common_dir)
+            # Only once they're all done, so that a failure isn't forgotten
+            # by the next side.
+            self.common_sources = common_sources
+        return self.common_sources
+
+    def compile(self, all_projects, side, out_dir, temp_dir, library_classpath, api=False, incremental=False):
         create_or_clean(temp_dir)
 
+        # Common sources are substituted once per run, for all sides.
+        common_dir = os.path.join(TEMP, "common", self.name)
+        with tracer.phase("substitute", self.name, "common"):
+            common_sources = self.substitute_common_sources(common_dir)
+
         source_files = set()
         patch_files = set()
         for dir in self.get_source_dirs(side):
-            source_files.update(self.collect_files(dir, required_extension=".java"))
+            if dir != os.path.join(self.dir, "src", "common"):
+                source_files.update(self.collect_files(dir, required_extension=".java"))
             patch_files.update(self.collect_files(dir, required_extension=".diff"))
             patch_files.update(self.collect_files(dir, required_extension=".patch"))
 
         if api:
             source_files = filter(self.is_api, source_files)
-
-        source_files = map(lambda f: self.replace_tokens(f, temp_dir),
-                           source_files)
-        for patch in patch_files:
-            for patched_file in self.apply_patch(patch, temp_dir, side):
-                source_files.append(patched_file)
+            common_sources = dict((filename, output) for filename, output
+                                  in common_sources.items()
+                                  if self.is_api(filename))
+
+        # The sources to compile, by path relative to their source root.
+        # Side-specific files override common ones.
+        sources = {}
+        for output in common_sources.values():
+            sources[os.path.relpath(output, common_dir)] = output
+        with tracer.phase("substitute", self.name, SIDE_NAMES[side]):
+            for filename in source_files:
+                output = self.replace_tokens(filename, temp_dir)
+                sources[os.path.relpath(output, temp_dir)] = output
+        with tracer.phase("patch", self.name, SIDE_NAMES[side]):
+            for patch in patch_files:
+                for patched_file in self.apply_patch(patch, temp_dir, side):
+                    sources[os.path.relpath(patched_file, temp_dir)] = patched_file
 
         source_dirs = [temp_dir]
+        if not api:
+            # APIs must not pick up the rest of the common sources.
+            source_dirs.append(common_dir)
+        dep_dirs = []
         for dep in self.dependencies:
             project = all_projects.get(dep, None)
             if project is None:
                 add_warning(self, side, "Depends on %s, which is not available!" % dep)
                 continue
-            source_dirs += project.get_source_dirs(side)
+            dep_dirs += project.get_source_dirs(side)
+        source_dirs += dep_dirs
 
         if side in [CLIENT, FORGE]:
             classpath = MCP_BIN_CLIENT + ":" + library_classpath
         else: # if side == SERVER:
             classpath = MCP_BIN_SERVER + ":" + library_classpath
 
+        if not args.full_classpath:
+            classpath = self.prune_classpath(classpath, sources.values(),
+                                             dep_dirs)
+
+        if incremental:
+            # Classes from the last build stand in for unchanged sources.
+            classpath = out_dir + ":" + classpath
+
         if self.suppress_warnings:
             command = ["javac",
                        "-sourcepath", ":".join(source_dirs), "-classpath",
-                       classpath, "-d", out_dir] + list(source_files)
+                       classpath, "-d", out_dir]
         else:
             command = ["javac", "-Xlint:all",
                        "-sourcepath", ":".join(source_dirs), "-classpath",
-                       classpath, "-d", out_dir] + list(source_files)
+                       classpath, "-d", out_dir]
 
-        self.call_or_die(command, CompileFailed)
+        if not incremental:
+            with tracer.phase("javac", self.name, SIDE_NAMES[side]):
+                self.call_or_die(command + sorted(sources.values()),
+                                 CompileFailed)
+            return
 
-    def obfuscate(self, side, stored_inheritance):
-        classpath = "runtime/bin/jcommander-1.29.jar:jars/libraries/org/ow2/asm/asm-debug-all/4.1/asm-debug-all-4.1.jar:runtime/bin/mcp_deobfuscate-1.2.jar"
-        main_class = "org.ldg.mcpd.MCPDeobfuscate"
-        outdir = TARGET
+        record_file = out_dir + ".deps"
+        with tracer.phase("plan", self.name, SIDE_NAMES[side]):
+            record = self.plan_compile(command, classpath, out_dir, sources,
+                                       dep_dirs, record_file)
+        if not record["compile"]:
+            print "Nothing to recompile for %s." % self.name
+
+        # Recompile the changed sources first.  Their dependents only need to
+        # follow if the classes' ABI changed, which we can't know until the
+        # new class files exist.
+        compiled = set()
+        pending = record["compile"]
+        try:
+            while pending:
+                with tracer.phase("javac", self.name, SIDE_NAMES[side]):
+                    self.call_or_die(command
+                                     + sorted(record["source_paths"][relname]
+                                              for relname in pending),
+                                     CompileFailed)
+                compiled.update(pending)
+                pending = self.record_classes(out_dir, record, compiled)
+        except:
+            # The output is in an unknown state now; start over next time.
+            buildstate.discard(record_file)
+            raise
+
+        # Forget dependencies' sources that no longer produce any classes.
+        used = set(info[0] for info in record["classes"].values())
+        sources = dict((relname, hash)
+                       for relname, hash in record["sources"].items()
+                       if relname in used or relname in record["own"])
+
+        buildstate.save(record_file, {"environment": record["environment"],
+                                      "sources": sources,
+                                      "classes": record["classes"],
+                                      "api": record["api"]})
+
+    def prune_classpath(self, classpath, source_files, dep_dirs):
+        """Drops the libraries that none of the sources can reach.
+
+        Libraries are kept if an import or a fully qualified name in the
+        sources resolves to them, if they have classes in a package that the
+        sources are in or use, or if a kept entry refers to them.  Class
+        directories (Minecraft's and the APIs) are always kept.
+        """
+        source_files = list(source_files)
+        for dir in dep_dirs:
+            source_files += self.collect_files(dir, required_extension=".java")
+
+        names = set()
+        imports = set()
+        packages = set()
+        for filename in source_files:
+            with open(filename) as infile:
+                contents = infile.read()
+            names.update(DOTTED_NAME.findall(contents))
+            imports.update(IMPORT.findall(contents))
+            packages.update(PACKAGE_DECLARATION.findall(contents))
+
+        for name in imports:
+            if class_index.resolve(name) is not None \
+               or name.startswith(classindex.JDK_PACKAGES):
+                continue
+
+            parts = name.split(".")
+            if any(".".join(parts[:i]) in packages
+                   for i in range(1, len(parts) + 1)):
+                continue
+
+            # Nobody knows where this comes from.  Better safe than sorry.
+            return classpath
+
+        used_packages = set(package.replace(".", "/") for package in packages)
+        for name in names | imports:
+            located = class_index.locate(name)
+            if located is not None:
+                used_packages.add(located[0])
+
+        entries = classpath.split(":")
+        roots = [entry for entry in entries if os.path.isdir(entry)]
+        selected = class_index.select(roots, names | imports, used_packages)
+        return ":".join(entry for entry in entries
+                        if entry in selected
+                           or entry not in class_index.entries)
+
+    def plan_compile(self, command, classpath, out_dir, own_sources,
+                     dep_dirs, record_file):
+        """Decides which sources an incremental compile has to start with.
+
+        Sources count as changed when their token-substituted contents
+        differ from the last build.  Sources whose classes used a class that
+        went away, or an API class whose ABI changed (or a subclass of one),
+        are recompiled as well.
+        Class files of all of these are removed from out_dir first.
+        """
+        # Every source javac might see, by path relative to its source root.
+        # The project's own (substituted) sources override dependencies'.
+        sources = {}
+        for dir in reversed(dep_dirs):
+            for filename in self.collect_files(dir, relative=True,
+                                               required_extension=".java"):
+                sources[filename] = os.path.join(dir, filename)
+        sources.update(own_sources)
+        own = set(own_sources)
+
+        hashes = {}
+        for relname in own:
+            hashes[relname] = buildstate.hash_file(sources[relname])
+
+        # API classes are tracked by their ABI, one class at a time.  Only
+        # their constants (which javac inlines) affect every file.
+        classpath = classpath.split(":")
+        if api_dir in classpath:
+            api = class_fingerprints(api_dir)
+        else:
+            api = {}
+        api_constants = sorted((name, fingerprints[1])
+                               for name, fingerprints in api.items())
+
+        # Anything that changes how every file compiles forces a full build.
+        # Every run has a TEMP of its own, so where it is doesn't count.
+        environment = (RECORD_FORMAT, [run_relative(arg) for arg in command],
+                       api_constants,
+                       [classpath_fingerprint(entry) for entry in classpath
+                        if entry not in (out_dir, api_dir)])
+        environment = buildstate.hash_bytes(repr(environment))
+
+        record = {"environment": environment, "sources": hashes,
+                  "classes": {}, "previous": {}, "api": api,
+                  "source_paths": sources, "own": own}
+
+        previous = buildstate.load(record_file)
+        if previous is None or previous["environment"] != environment \
+           or not os.path.isdir(out_dir) or not os.listdir(out_dir):
+            create_or_clean(out_dir)
+            record["compile"] = own
+            return record
+
+        # Sources from dependencies only matter if we compiled them before.
+        for relname in previous["sources"]:
+            if relname not in hashes and relname in sources:
+                hashes[relname] = buildstate.hash_file(sources[relname])
+
+        changed = set(relname for relname, hash in hashes.items()
+                      if previous["sources"].get(relname) != hash)
+        removed = set(info[0] for info in previous["classes"].values()
+                      if info[0] not in hashes)
+
+        stale = set(name for name, info in previous["classes"].items()
+                    if info[0] in removed)
+        stale.update(name for name in set(api) | set(previous["api"])
+                     if api.get(name) != previous["api"].get(name))
+        parents = dict((name, info[2]) for name, info
+                       in previous["api"].items() + api.items())
+        parents.update((name, info[5])
+                       for name, info in previous["classes"].items())
+        stale = with_subclasses(stale, parents)
+        recompile = set(changed)
+        for name, info in previous["classes"].items():
+            if info[1] & stale and info[0] in hashes:
+                recompile.add(info[0])
+
+        for name, info in previous["classes"].items():
+            if info[0] in recompile or info[0] in removed:
+                class_file = os.path.join(out_dir, *name.split("/")) + ".class"
+                if os.path.exists(class_file):
+                    os.remove(class_file)
+                record["previous"][name] = info
+            else:
+                record["classes"][name] = info
+
+        # javac prefers whichever of a class file and its source is newer.
+        # Backdate the unchanged sources so that it uses the existing class
+        # files instead of quietly recompiling them.  Sources that are
+        # hardlinked to the project's own files are left alone; they're
+        # usually older than their classes anyway.
+        for relname in own - recompile:
+            if not staging.is_shared(sources[relname]):
+                os.utime(sources[relname], (0, 0))
+
+        if recompile:
+            print "Recompiling %d of %d source files for %s." \
+                    % (len(recompile), len(own), self.name)
+
+        record["compile"] = recompile
+        return record
+
+    def record_classes(self, out_dir, record, compiled):
+        """Records which classes came from which source and what they use.
+
+        Returns the sources that have to be recompiled because a class they
+        use (or one of its superclasses or interfaces) changed its ABI.
+        """
+        classes = record["classes"]
+        found = set()
+        changed_abi = set()
+        changed_constants = False
+        for filename in self.collect_files(out_dir, relative=True,
+                                           required_extension=".class"):
+            name = filename[:-len(".class")].replace(os.sep, "/")
+            found.add(name)
+            full_name = os.path.join(out_dir, filename)
+            stat = os.stat(full_name)
+            stamp = (stat.st_size, stat.st_mtime)
+
+            old = classes.get(name) or record["previous"].pop(name, None)
+            if old is not None and old[2] == stamp:
+                continue
+
+            with open(full_name, "rb") as infile:
+                parsed = classfile.ClassFile(infile.read())
+            source = os.path.normpath(classfile.source_path(parsed))
+            classes[name] = (source, frozenset(parsed.referenced_classes()),
+                             stamp, classfile.abi_fingerprint(parsed),
+                             classfile.constants_fingerprint(parsed),
+                             classfile.parents(parsed))
+
+            # Brand new classes can't have been used by anything yet.
+            if old is not None and old[3] != classes[name][3]:
+                changed_abi.add(name)
+            if old is not None and old[4] != classes[name][4]:
+                changed_constants = True
+
+            # Classes javac built from dependencies' sources are tracked too.
+            if source not in record["sources"] \
+               and source in record["source_paths"]:
+                record["sources"][source] = \
+                        buildstate.hash_file(record["source_paths"][source])
+
+        # Classes that a recompiled source no longer produces.
+        for name, info in record["previous"].items():
+            if info[0] in compiled and name not in found:
+                changed_abi.add(name)
+                del record["previous"][name]
+
+        if changed_constants:
+            # Whoever used the constants doesn't mention them anymore.
+            dependents = set(record["own"])
+        else:
+            parents = dict((name, info[2])
+                           for name, info in record["api"].items())
+            parents.update((name, info[5]) for name, info
+                           in record["previous"].items() + classes.items())
+            changed_abi = with_subclasses(changed_abi, parents)
+            dependents = set(info[0] for info in classes.values()
+                             if info[1] & changed_abi)
+
+        dependents = set(relname for relname in dependents
+                         if relname in record["source_paths"]) - compiled
+        if dependents:
+            print "Recompiling %d dependent source files for %s." \
+                    % (len(dependents), self.name)
+        return dependents
+
+    def obfuscate(self, side, stored_inheritance, record_file=None):
+        """Obfuscates one side's package into TARGET.
+
+        If there's a record_file, it remembers what the last obfuscation
+        started from.  When that's the same now (which takes reproducible
+        packages), the existing output is kept instead.
+        """
+        # The result is published into TARGET once it's complete.
+        outdir = os.path.join(TEMP, "obfuscated")
+        make_if_needed(outdir)
 
         if side in [CLIENT, FORGE]:
-            config = os.path.join(MCP_TEMP, "client_ro.srg")
+            config = CLIENT_SRG
             mc_jar = DEOBF_CLIENT
         else: #if side == SERVER:
-            config = os.path.join(MCP_TEMP, "server_ro.srg")
+            config = SERVER_SRG
             mc_jar = DEOBF_SERVER
 
-        command = ["java", "-classpath", classpath, main_class,
-                   "--stored_inheritance"] +  stored_inheritance + ["--invert",
-                   "--config", config, "--outdir", outdir, "--indir", "/",
-                   "--infiles", self.get_package_file(side)]
+        arguments = ["--stored_inheritance"] + stored_inheritance + [
+                     "--invert", "--config", config, "--outdir", outdir,
+                     "--indir", "/", "--infiles", self.get_package_file(side)]
+
+        package = self.get_package_file(side)
+        output = os.path.join(TARGET, os.path.basename(package))
+        if record_file is not None:
+            # How the JVM is started doesn't change the output.
+            key = buildstate.hash_bytes(repr((
+                arguments, buildstate.hash_file(package),
+                [classpath_fingerprint(relative(entry))
+                 for entry in [config] + stored_inheritance
+                               + jvmprofile.DEOBFUSCATOR_CLASSPATH])))
+            record = buildstate.load(record_file)
+            if record is not None and record["key"] == key \
+               and os.path.exists(output) \
+               and buildstate.hash_file(output) == record["output"]:
+                print "%s's package is unchanged; not obfuscating it again." \
+                        % self.name
+                return
+            buildstate.discard(record_file)
 
         print "---Obfuscating %s---" % self.name
-        self.call_or_die(command, ObfuscateFailed)
+        self.call_or_die(jvm.deobfuscator_command(arguments), ObfuscateFailed)
+        publish(os.path.join(outdir, os.path.basename(package)))
         print "---Obfuscation complete---"
         print
 
+        if record_file is not None:
+            buildstate.save(record_file, {"key": key,
+                                          "output": buildstate.hash_file(output)})
+
     def call_or_die(self, cmd, error, shell=False):
-        exit = subprocess.call(cmd, shell=shell)
+        result = None
+        if not shell and cmd[0] == "javac":
+            result = warmjavac.call(cmd)
+        if result is None:
+            result = childusage.call(cmd, shell=shell)
+        exit, usage = result
+        phase, project, side = tracer.current()
+        usage_log.record(cmd, exit, usage, phase, project or self.name, side)
+        jvm.ran(cmd, exit)
         if exit != 0:
             if shell:
                 raise error("Command failed: %s" % cmd)
             else:
                 raise error("Command failed: %s" % cmd[0])
 
+    def collect_entries(self, root, do_replace=False, previous=None,
+                        store=None):
+        """Prepares zip entries for everything under root.
+
+        Files are read and compressed on the packer's threads, but the
+        entries come back in the order they were found.  Entries that are
+        unchanged since the previous archive, or already in the store, are
+        copied from there instead.
+        """
+        filenames = []
+        for dir, subdirs, files in os.walk(root, followlinks=True):
+            for file in files:
+                filenames.append(os.path.join(dir, file))
+
+        names = [os.path.relpath(filename, root) for filename in filenames]
+
+        if do_replace:
+            # Substitution is mostly Python, so it wouldn't gain anything
+            # from the threads.
+            contents = [self.replace_tokens(filename) for filename in filenames]
+            entries = packer.map(lambda (name, data): packaging.data_entry(
+                                         data, PACKAGE_COMPRESSION, previous,
+                                         name, store),
+                                 zip(names, contents))
+        else:
+            entries = packer.map(lambda (name, filename): packaging.file_entry(
+                                         filename, PACKAGE_COMPRESSION,
+                                         previous, name, store),
+                                 zip(names, filenames))
+
+        return zip(names, entries)
+
+    def common_package_entries(self, previous=None):
+        """Returns the common source and resource entries for packages.
+
+        Either is None if there is nothing to package.  They're prepared the
+        first time any side asks for them, reusing what they can from that
+        side's previous archive.
+        """
+        if self.common_entries is None:
+            common_source = os.path.join(self.dir, "src", "common")
+            common_resources = os.path.join(self.dir, "resources", "common")
+
+            source_entries = None
+            if not self.hide_source and os.path.isdir(common_source) \
+               and os.listdir(common_source):
+                source_entries = self.collect_entries(common_source,
+                                                      previous=previous)
+
+            resource_entries = None
+            if os.path.isdir(common_resources):
+                resource_entries = self.collect_entries(common_resources,
+                                                        do_replace=True,
+                                                        previous=previous,
+                                                        store=resource_store)
+
+            self.common_entries = (source_entries, resource_entries)
+        return self.common_entries
+
     def package(self, side, in_dir):
         """Packages this project's files."""
         created = False
@@ -506,100 +1239,316 @@ class Project(object):
             source = os.path.join(self.dir, "src", "server")
             resources = os.path.join(self.dir, "resources", "server")
 
+        # The last package built from in_dir and its manifest are kept next
+        # to it, so that unchanged entries don't need to be compressed again.
+        previous_package = in_dir + ".zip"
+        manifest_file = in_dir + ".manifest"
+        previous = packaging.PreviousArchive(previous_package, manifest_file)
+
+        # Common files are the same for every side, so they're only read
+        # (and substituted) once per run.
+        common_sources, common_resources = \
+                self.common_package_entries(previous)
+
+        entries = []
         if not self.hide_source:
-            ## Collect and package source files.
+            ## Collect source files.
             # Common first, so they can be overridden.
-            common_source = os.path.join(self.dir, "src", "common")
-            if os.path.isdir(common_source) and os.listdir(common_source):
-                # To package these, we just change to the appropriate directory
-                # and let self.zip find everything in it.
-                os.chdir(common_source)
-                self.zip(package)
+            if common_sources is not None:
+                entries += common_sources
                 created = True
 
-
             if side != FORGE and os.path.isdir(source) and os.listdir(source):
-                os.chdir(source)
-                self.zip(package)
+                entries += self.collect_entries(source, previous=previous)
                 created = True
 
-        ## Collect and package class files.
+        ## Collect class files.
         if os.path.exists(in_dir) and os.listdir(in_dir):
-            os.chdir(in_dir)
-            self.zip(package)
+            entries += self.collect_entries(in_dir, previous=previous)
             created = True
 
-
-        ## Collect and package resource files.
+        ## Collect resource files.
         # Common first, so they can be overridden.
-        common_resources = os.path.join(self.dir, "resources", "common")
-        if os.path.isdir(common_resources):
-            # To package these, we just change to the appropriate directory
-            # and let the shell and zip command find everything in it.
-            os.chdir(common_resources)
-            self.zip(package, do_replace=True)
+        if common_resources is not None:
+            entries += common_resources
             created = True
 
         if side != FORGE and os.path.isdir(resources):
-            os.chdir(resources)
-            self.zip(package, do_replace=True)
+            entries += self.collect_entries(resources, do_replace=True,
+                                            previous=previous,
+                                            store=resource_store)
             created = True
 
-        os.chdir(BASE)
+        try:
+            if created:
+                written = packaging.write_archive(package, entries,
+                                                  args.reproducible)
+        finally:
+            previous.close()
+
+        if previous.reused:
+            print "Reused %d of %d entries from the last package of %s." \
+                    % (previous.reused, len(entries), self.name)
+
+        buildstate.discard(manifest_file)
+        buildstate.discard(previous_package)
+        if created:
+            staging.stage(package, previous_package)
+            buildstate.save(manifest_file, packaging.manifest(written))
+
         return created
 
-FORGE_INSTALLED = False
-with open(relative("runtime/commands.py")) as source:
-    contents = source.read()
-    if "FML" in contents:
-        FORGE_INSTALLED = True
-
-if FORGE_INSTALLED:
-    print "!!! Forge detected.  Building universal packages only. !!!"
-    print
-
-projects = []
-if not os.path.isdir(USER):
-    print "No user directory found.  Nothing to do."
-    sys.exit(0)
-else:
-    Project.collect_projects(USER, projects)
-
-if os.path.exists(os.path.join(LIB, "client_reobf.jar.inh")) \
-   or os.path.exists(os.path.join(LIB, "server_reobf.jar.inh")):
-    pass # Yay!
-else:
-    print "Please run deobfuscate_libs first."
-    sys.exit(1)
-
-libraries = []
-stored_inheritance = []
-for filename in os.listdir(LIB):
-    base, extension = os.path.splitext(filename)
-    if extension.lower() == ".inh":
-        stored_inheritance.append(os.path.join(LIB, filename))
-    elif extension.lower() in [".jar", ".zip"]:
-        libraries.append(os.path.join(LIB, filename))
-
-if os.path.exists(JAR_LIB):
-    for (dir, subdirs, files) in os.walk(JAR_LIB, followlinks=True):
-        for filename in files:
-            base, extension = os.path.splitext(filename)
-            if extension.lower() == ".inh":
-                stored_inheritance.append(os.path.join(LIB, filename))
-            elif extension.lower() in [".jar", ".zip"]:
-                libraries.append(os.path.join(dir, filename))
-
-library_classpath = ":".join(libraries)
-
-projects_dict = {}
-for project in projects:
-    projects_dict[project.name] = project
-
-if FORGE_INSTALLED:
-    sides = [FORGE]
-else:
-    sides = [CLIENT, SERVER]
+# Whether Forge is installed, once something has asked.
+forge_detected = []
+def forge_installed():
+    if not forge_detected:
+        with open(relative("runtime/commands.py")) as source:
+            forge_detected.append("FML" in source.read())
+    return forge_detected[0]
+
+def scan_projects(quiet=False):
+    """The active projects in USER."""
+    projects = []
+    if os.path.isdir(USER):
+        Project.collect_projects(USER, projects, quiet)
+    return projects
+
+def find_libraries():
+    """(libraries, inheritance tables) to build against."""
+    libraries = []
+    stored_inheritance = []
+    for filename in os.listdir(LIB):
+        base, extension = os.path.splitext(filename)
+        if extension.lower() == ".inh":
+            stored_inheritance.append(os.path.join(LIB, filename))
+        elif extension.lower() in [".jar", ".zip"]:
+            libraries.append(os.path.join(LIB, filename))
+
+    if os.path.exists(JAR_LIB):
+        for (dir, subdirs, files) in os.walk(JAR_LIB, followlinks=True):
+            for filename in files:
+                base, extension = os.path.splitext(filename)
+                if extension.lower() == ".inh":
+                    stored_inheritance.append(os.path.join(dir, filename))
+                elif extension.lower() in [".jar", ".zip"]:
+                    libraries.append(os.path.join(dir, filename))
+
+    # deobfuscate_libs merges lib/'s tables into one when it can, which the
+    # obfuscator reads a lot faster.
+    merged_inheritance = relative(inheritance.MERGED_TABLE)
+    if os.path.exists(merged_inheritance):
+        stored_inheritance = [merged_inheritance] \
+                             + [table for table in stored_inheritance
+                                if os.path.dirname(table) != LIB]
+    return libraries, stored_inheritance
+
+# What the daemon (or the watcher) keeps between builds besides what
+# daemon_stamp covers, as {name: (stamp, value)}.  warm_up brings it up to
+# date before each build is forked.
+warm_state = {}
+def keep_warm(name, stamp, load):
+    """What load returns, loaded again only when stamp changes."""
+    if name not in warm_state or warm_state[name][0] != stamp:
+        warm_state[name] = (stamp, load())
+    return warm_state[name][1]
+
+def project_stamp():
+    """Changes whenever scan_projects' answer might have."""
+    stamp = []
+    for (dir, subdirs, files) in os.walk(USER, followlinks=True):
+        subdirs.sort()
+        stamp.append(path_stamp(dir))
+        if "DISABLED" in files or "DISABLE" in files:
+            del subdirs[:]
+        elif "CATEGORY" not in files:
+            # A project, configured by conf/.
+            conf = os.path.join(dir, "conf")
+            stamp.append(path_stamp(conf))
+            if os.path.isdir(conf):
+                stamp += [path_stamp(os.path.join(conf, filename))
+                          for filename in sorted(os.listdir(conf))]
+            del subdirs[:]
+    return stamp
+
+def warm_projects():
+    return keep_warm("projects", project_stamp(),
+                     lambda: scan_projects(quiet=True))
+
+def library_stamp():
+    """Changes whenever find_libraries' answer might have.  The libraries'
+    contents are the class index's business.
+    """
+    dirs = [LIB]
+    if os.path.exists(JAR_LIB):
+        dirs += [dir for (dir, subdirs, files)
+                 in os.walk(JAR_LIB, followlinks=True)]
+    return [path_stamp(path)
+            for path in dirs + [relative(inheritance.MERGED_TABLE)]]
+
+def warm_libraries():
+    return keep_warm("libraries", library_stamp(), find_libraries)
+
+def warm_up():
+    """Brings what builds start with up to date, so that the builds the
+    daemon (or the watcher) forks don't each do it again.
+    """
+    global class_index
+    try:
+        with locking.FileLock(os.path.join(LOCKS, "lib.lock"), shared=True,
+                              description="lib/"):
+            warm_projects()
+            warmed_libraries, warmed_inheritance = warm_libraries()
+            if class_index is None:
+                class_index = classindex.ClassIndex(CLASS_INDEX)
+            class_dirs = [dir for dir in [MCP_BIN_CLIENT, MCP_BIN_SERVER]
+                          if os.path.isdir(dir)]
+            with locking.FileLock(STATE_LOCK, description="the build state"):
+                class_index.reload_if_changed()
+                class_index.refresh(warmed_libraries + class_dirs)
+    except (OSError, IOError):
+        # The build finds out what's wrong for itself.
+        warm_state.clear()
+        class_index = None
+
+    warmjavac.start(relative("temp/warmjavac"), BASE)
+
+def warm_state_stale():
+    return daemon_stamp() != loaded_stamp
+
+def project_dir_of(path):
+    """The directory of the project that path is in, or None."""
+    dir = USER
+    for part in os.path.relpath(path, USER).split(os.sep):
+        if not os.path.isfile(os.path.join(dir, "CATEGORY")):
+            break
+        dir = os.path.join(dir, part)
+
+    if not os.path.isdir(dir) or os.path.isfile(os.path.join(dir, "CATEGORY")):
+        return None
+    return dir
+
+def affected_by(changed):
+    """The projects (by name) and sides that changed paths call for
+    rebuilding, or None if they don't matter.  Empty lists mean all of them.
+    """
+    everything = (list(args.projects), [])
+    all_projects = warm_projects()
+    by_dir = dict((project.dir, project) for project in all_projects)
+
+    names = set()
+    side_names = set()
+    for path in changed:
+        filename = os.path.basename(path)
+        if filename.startswith(".") or filename.endswith("~"):
+            continue # Editors' scratch files.
+
+        if not path.startswith(USER + os.sep):
+            return everything # lib/ or the SRG.
+
+        project = by_dir.get(project_dir_of(path))
+        if project is None or project.api:
+            # A project came or went, or everybody's API changed.  Building
+            # everything sorts that out.
+            return everything
+        names.add(project.name)
+
+        parts = os.path.relpath(path, project.dir).split(os.sep)
+        if len(parts) > 2 and parts[0] in ("src", "resources") \
+           and parts[1] in ("client", "server"):
+            side_names.add(parts[1])
+        else:
+            side_names.update(["client", "server"])
+
+    # Projects that depend on a changed one change with it.
+    while True:
+        dependents = set(project.name for project in all_projects
+                         if project.name not in names
+                         and names.intersection(project.dependencies))
+        if not dependents:
+            break
+        names.update(dependents)
+
+    if args.projects:
+        names.intersection_update(args.projects)
+    if not names:
+        return None
+
+    if forge_installed() or len(side_names) == 2:
+        side_names = set()
+    return sorted(names), sorted(side_names)
+
+def watch_for_changes():
+    """Builds, then builds again whenever something changes, each time in a
+    fork of this process.  Only returns in the forks, with the projects and
+    sides they should build.
+    """
+    watcher = watching.watcher([USER, LIB], [SRG])
+    names, side_names = list(args.projects), []
+    try:
+        while True:
+            stale = warm_state_stale()
+            if not stale:
+                warm_up()
+            started = time.time()
+            code = builddaemon.fork_build()
+            if code is None:
+                return names, side_names
+
+            took = time.time() - started
+            print
+            if code == 0:
+                print "Build finished in %.1f seconds." % took
+            else:
+                print "Build failed (exit code %d) after %.1f seconds." \
+                        % (code, took)
+
+            if stale:
+                print "Inputs changed; starting over."
+                builddaemon.restart()
+
+            affected = None
+            while affected is None:
+                print "Watching for changes.  (Ctrl-C to stop.)"
+                affected = affected_by(watching.wait_for_changes(watcher))
+            names, side_names = affected
+
+            print
+            print "Rebuilding %s%s..." \
+                    % (", ".join(names) or "everything",
+                       "".join(" (%s)" % side for side in side_names))
+    except KeyboardInterrupt:
+        print
+        print "Stopped watching."
+        sys.exit(0)
+
+# The loaded CLASS_INDEX.  The daemon (or the watcher) keeps it between builds.
+class_index = None
+def refresh_class_index():
+    class_dirs = [dir for dir in [MCP_BIN_CLIENT, MCP_BIN_SERVER, api_dir]
+                  if os.path.isdir(dir)]
+    with locking.FileLock(STATE_LOCK, description="the build state"):
+        class_index.reload_if_changed()
+        class_index.refresh(libraries + class_dirs)
+
+def report_conflicts():
+    """Warns about classes that are in more than one entry of a side's
+    classpath.  Which of them javac sees depends on the order.
+    """
+    conflicts = {}
+    for side in sides:
+        if side == SERVER:
+            bin_dir = MCP_BIN_SERVER
+        else:
+            bin_dir = MCP_BIN_CLIENT
+        entries = [bin_dir] + library_classpath.split(":")
+        for pair, classes in class_index.conflicts(entries).items():
+            conflicts.setdefault(pair, set()).update(classes)
+
+    for (first, second), classes in sorted(conflicts.items()):
+        print "Warning: %d classes are in both %s and %s, e.g. %s." \
+                % (len(classes), first, second, min(classes))
+    if conflicts:
+        print
 
 warnings = collections.defaultdict(lambda: [])
 def add_warning(project, side, warning):
@@ -609,76 +1558,305 @@ errors = collections.defaultdict(lambda: [])
 def add_error(project, side, error):
     errors[project].append((side, error, sys.exc_info()[2]))
 
-compile_temp = os.path.join(TEMP, "compile_temp")
+# The outcome of each project's last build, so that projects which haven't
+# changed can be skipped.
+project_states_file = os.path.join(BUILD, "projects.state")
+
+def save_project_state(name, state):
+    """Saves a project's state right away, so that other builds see it, and
+    cleans the packages it doesn't make anymore out of TARGET.
+    """
+    with locking.FileLock(STATE_LOCK, description="the build state"):
+        project_states = buildstate.load(project_states_file, {})
+        old_state = project_states.get(name)
+        project_states[name] = state
+        buildstate.save(project_states_file, project_states)
+
+    if old_state is not None:
+        for package in set(old_state["packages"]) - set(state["packages"]):
+            if os.path.exists(os.path.join(TARGET, package)):
+                os.remove(os.path.join(TARGET, package))
+
+def toolchain_version(command):
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        return process.communicate()[0]
+    except OSError:
+        return None
+
+# Like build_environment, but by content only and including the SRG and the
+# toolchain, so that it matches across checkouts.  Only computed when needed.
+cached_environment = []
+def cache_environment():
+    if not cached_environment:
+        def fingerprint(path):
+            if os.path.isfile(path):
+                return (os.path.relpath(path, BASE), file_hashes.hash(path))
+            return (os.path.relpath(path, BASE), classpath_fingerprint(path))
+
+        toolchain = [toolchain_version(["javac", "-version"]),
+                     jvm.version()]
+        toolchain += [fingerprint(relative(jar))
+                      for jar in jvmprofile.DEOBFUSCATOR_CLASSPATH
+                      if os.path.exists(relative(jar))]
+
+        cached_environment.append(buildstate.hash_bytes(repr((
+            forge_installed(), args.full_classpath, args.reproducible,
+            args.compress, toolchain,
+            [buildstate.hash_file(filename) for filename in
+             sorted(glob.glob(os.path.join(os.path.dirname(SCRIPT), "*.py")))],
+            [fingerprint(path) for path in libraries + stored_inheritance
+                                           + [MCP_BIN_CLIENT, MCP_BIN_SERVER,
+                                              SRG, CLIENT_SRG, SERVER_SRG]
+             if os.path.exists(path)],
+            classpath_fingerprint(api_dir)))))
+    return cached_environment[0]
+
+def resolve_srg_token(token):
+    subst_type, value = token
+    if subst_type in OBF_KEY:
+        return OBF_KEY[subst_type].get(value, None)
+    return None
+
+def build_project(project):
+    """Builds, packages and obfuscates one project, unless it's up to date.
+
+    Returns a summary of what happened, for Tally.add.  Problems are
+    recorded with add_warning and add_error.
+    """
+    # Nobody else may build this project while we do.
+    with tracer.phase("project", project.name), \
+         locking.FileLock(os.path.join(LOCKS, "project-%s.lock" % project.name),
+                          description=project.name):
+        inputs = project.input_fingerprint(projects_dict, build_environment)
+        # Another build may have just done this project, so check what's saved
+        # now.
+        state = buildstate.load(project_states_file, {}).get(project.name)
+        if state is not None and not args.full and state["inputs"] == inputs \
+           and project.name not in srg_affected \
+           and all(os.path.exists(os.path.join(TARGET, package))
+                   for package in state["packages"]):
+            print "%s is up to date." % project.name
+            return {"up_to_date": True}
+
+        # The old packages stay where they are until they're replaced, so that
+        # unchanged ones can be kept.  Whatever isn't rebuilt is cleaned out of
+        # TARGET once the project is done.
+        print "Processing %s..." % project.name
+        shared_before = resource_store.hits
+        created_sides = []
+        packages = []
 
-api_dir = os.path.join(TEMP, "lib")
-create_or_clean(api_dir)
-api_count = 0
-for project in projects:
-    if project.api:
         for side in sides:
-            project.compile(projects_dict, side, api_dir, compile_temp, library_classpath, api=True)
-            api_count += 1
-
-print "Built %d APIs." % api_count
-
-library_classpath += ":" + api_dir
-
-count = 0
-source_count = 0
-client_count = 0
-server_count = 0
-for project in projects:
-    if len(sys.argv) > 1 and not project.name in sys.argv:
-        print "Skipping unrequested project %s." % project.name
-        continue
-
-    print "Processing %s..." % project.name
-    any_created = False
-
-    for side in sides:
-        try:
-            compile_dir = os.path.join(TEMP, project.name)
-            if side == SERVER:
-                compile_dir += "_server"
-            elif side == FORGE:
-                compile_dir += "_universal"
+            side_name = SIDE_NAMES[side]
+            try:
+                compile_dir = os.path.join(BUILD, project.name)
+                if side == SERVER:
+                    compile_dir += "_server"
+                elif side == FORGE:
+                    compile_dir += "_universal"
+
+                cached = None
+                if artifact_cache is not None:
+                    cache_key = project.cache_key(projects_dict, side,
+                                                  cache_environment())
+                    if not args.full:
+                        cached = artifact_cache.lookup(cache_key)
+
+                if cached is not None:
+                    print "Using cached build of %s." % project.name
+                    try:
+                        with tracer.phase("restore", project.name, side_name):
+                            created = project.restore_artifacts(cached, side,
+                                                                compile_dir)
+                    except artifactcache.BadEntry, e:
+                        print "Can't use the cached build of %s: %s" \
+                                % (project.name, e)
+                        cached = None
+
+                if cached is None:
+                    if args.full:
+                        create_or_clean(compile_dir)
+                    else:
+                        make_if_needed(compile_dir)
+
+                    with tracer.phase("compile", project.name, side_name):
+                        project.compile(projects_dict, side, compile_dir, compile_temp, library_classpath, incremental=True)
+
+                    with tracer.phase("package", project.name, side_name):
+                        created = project.package(side, compile_dir)
+
+                    if created:
+                        with tracer.phase("obfuscate", project.name,
+                                          side_name):
+                            project.obfuscate(side, stored_inheritance,
+                                              compile_dir + ".obf")
+
+                    if artifact_cache is not None:
+                        project.store_artifacts(artifact_cache, cache_key, side,
+                                                compile_dir, created)
+
+                if created:
+                    created_sides.append(side)
+                    packages.append(os.path.basename(project.get_package_file(side)))
+            except Exception, e:
+                # You did something wrong!
+                add_error(project, side, e)
+
+        # Every side is done with the shared package entries.
+        project.common_entries = None
+
+        if partial and state is not None:
+            skipped = [os.path.basename(project.get_package_file(side))
+                       for side in [CLIENT, SERVER] if side not in sides]
+            packages += [package for package in state["packages"]
+                         if package in skipped]
+
+        if project in errors or partial:
+            # Keep whatever did get built, but look at the whole project again
+            # next time.
+            save_project_state(project.name, {"inputs": None,
+                                              "packages": packages})
+            token_index.forget(project.name)
+        else:
+            save_project_state(project.name, {"inputs": inputs,
+                                              "packages": packages})
+            token_index.update(project.name, project.token_usage,
+                               resolve_srg_token)
+
+        return {"up_to_date": False, "created": created_sides,
+                "source": not project.hide_source,
+                "shared": resource_store.hits - shared_before}
+
+class Tally(object):
+    """Sums up what the projects' builds did, for the summary."""
+    def __init__(self):
+        self.count = 0
+        self.source_count = 0
+        self.client_count = 0
+        self.server_count = 0
+        self.up_to_date_count = 0
+        self.shared_count = 0
+
+    def add(self, result):
+        """Counts a result from build_project."""
+        if result["up_to_date"]:
+            self.up_to_date_count += 1
+            return
 
-            create_or_clean(compile_dir)
+        if result["created"]:
+            self.count += 1
+            if result["source"]:
+                self.source_count += 1
+        self.client_count += result["created"].count(CLIENT)
+        self.server_count += result["created"].count(SERVER)
+        self.shared_count += result["shared"]
+
+# Marks the lines of a worker's output that are meant for the coordinator.
+WORKER_MESSAGE = "@@mcp_worker@@ "
+
+def send_to_coordinator(message):
+    sys.stdout.write(WORKER_MESSAGE + json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def drain_messages(project_messages, project):
+    """Takes a project's warnings or errors, as text for the coordinator."""
+    drained = []
+    for info in project_messages.pop(project, []):
+        side, message = info[:2]
+        text = str(message)
+        if len(info) == 3 and isinstance(message, Exception) \
+           and not isinstance(message, KnownFailure):
+            text += "\n" + "".join(traceback.format_tb(info[2])).rstrip()
+        drained.append((side, text))
+    return drained
+
+def serve_coordinator():
+    """The worker's side of coordinate."""
+    send_to_coordinator({"ready": True})
+    for line in iter(sys.stdin.readline, ""):
+        name = json.loads(line)["project"]
+        project = projects_dict[name]
+        result = build_project(project)
+        send_to_coordinator({"project": name, "result": result,
+                             "warnings": drain_messages(warnings, project),
+                             "errors": drain_messages(errors, project),
+                             "trace": tracer.take(),
+                             "usage": usage_log.take()})
+
+def coordinate(names, worker_count):
+    """Builds projects in worker processes and yields their results.
+
+    The workers are this script, run with --worker.  Each one is sent a
+    project's name on its stdin whenever it's free, and answers on its
+    stdout with the result, warnings and errors.  Anything else the workers
+    print is passed along.  The workers all compile against the APIs built
+    here, so projects don't depend on each other and can be built in any
+    order.
+    """
+    command = [sys.executable, "-u", SCRIPT, "build"] + arguments \
+              + ["--worker", "--workers", "1", "--api-dir", api_dir]
+
+    messages = Queue.Queue()
+    def read_output(index, stream):
+        for line in iter(stream.readline, ""):
+            messages.put((index, line))
+        messages.put((index, None))
+
+    workers = []
+    for index in range(min(worker_count, len(names))):
+        worker = subprocess.Popen(command, cwd=BASE, stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE)
+        reader = threading.Thread(target=read_output,
+                                  args=(index, worker.stdout))
+        reader.daemon = True
+        reader.start()
+        workers.append(worker)
+
+    pending = list(names)
+    busy = {}
+    running = len(workers)
+    while running:
+        index, line = messages.get()
+        if line is None:
+            running -= 1
+            name = busy.pop(index, None)
+            if name is not None:
+                add_error(projects_dict[name], sides[0],
+                          "Worker %d exited while building it." % index)
+            continue
 
-            project.compile(projects_dict, side, compile_dir, compile_temp, library_classpath)
+        if not line.startswith(WORKER_MESSAGE):
+            sys.stdout.write("[worker %d] %s" % (index, line))
+            continue
 
-            created = project.package(side, compile_dir)
+        message = json.loads(line[len(WORKER_MESSAGE):])
+        if "project" in message:
+            project = projects_dict[busy.pop(index)]
+            for side, text in message["warnings"]:
+                warnings[project].append((side, text))
+            for side, text in message["errors"]:
+                errors[project].append((side, text))
+            tracer.add(message["trace"])
+            usage_log.add(message["usage"])
+            yield message["result"]
+
+        # The worker is free again.
+        if pending:
+            busy[index] = pending.pop(0)
+            workers[index].stdin.write(json.dumps({"project": busy[index]})
+                                       + "\n")
+            workers[index].stdin.flush()
+        else:
+            workers[index].stdin.close()
 
-            if created:
-                any_created = True
-                project.obfuscate(side, stored_inheritance)
-
-                if side == CLIENT:
-                    client_count += 1
-                elif side == SERVER:
-                    server_count += 1
-        except Exception, e:
-            # You did something wrong!
-            add_error(project, side, e)
-    if any_created:
-        count += 1
-        if not project.hide_source:
-            source_count += 1
-
-s = "" if count == 1 else "s"
-print "%d project%s compiled and packaged successfully." % (count, s)
-if count and not FORGE_INSTALLED:
-    print "(%d client, %d server)" % (client_count, server_count)
-if count:
-    if source_count == 0:
-        smiley = ":/"
-    elif source_count == count:
-        smiley = ":D"
-    else:
-        smiley = ":)"
+    for worker in workers:
+        worker.wait()
 
-    print "Source included in packages for %d/%d projects.  %s" % (source_count, count, smiley)
+    for name in pending:
+        add_error(projects_dict[name], sides[0],
+                  "No workers were left to build it.")
 
 def print_messages(project_messages):
     for project, messages in project_messages.items():
@@ -697,17 +1875,438 @@ def print_messages(project_messages):
                     traceback.print_tb(info[2])
 
 
-if warnings:
-    print
-    print "Warnings in %d projects:" % len(warnings)
+def forget_runs():
+    """Drops whatever earlier builds in this process loaded or worked out, so
+    that main() can be called more than once.
+    """
+    global tracer, usage_log, class_index
+    tracer = buildtrace.Tracer()
+    usage_log = childusage.UsageLog()
+    classpath_fingerprints.clear()
+    class_fingerprint_cache.clear()
+    OBF_KEY.clear()
+    del loaded_srg_index[:]
+    del forge_detected[:]
+    del cached_environment[:]
+    warm_state.clear()
+    class_index = None
+    warnings.clear()
+    errors.clear()
+
+def build(argv):
+    """Builds the projects, as asked for by the command line argv.  Returns
+    the exit code.
+    """
+    global args, arguments, tracer, usage_log, loaded_stamp, projects_dict, \
+           libraries, stored_inheritance, library_classpath, class_index, \
+           sides, partial, compile_temp, api_dir, build_environment, \
+           file_hashes, packer, resource_store, artifact_cache, token_index, \
+           srg_affected
+    forget_runs()
+    args = parser.parse_args(argv)
+    # The build's own arguments, for its workers.
+    arguments = list(argv)
+
+    if args.via_daemon:
+        code = builddaemon.request_build(DAEMON_SOCKET,
+                                         [arg for arg in arguments
+                                          if arg != "--via-daemon"])
+        if code is not None:
+            return code
+        print "No build daemon is running.  Building here instead."
+
+    apply_args()
+
+    # Most of this script assumes it's in the MCP directory, so let's go there.
+    os.chdir(BASE)
+
+    # Create the project directory and force it to be seen as a category.
+    if not os.path.exists(USER):
+        os.makedirs(USER)
+
+        # Touch the CATEGORY file.
+        with open(os.path.join(USER, "CATEGORY"), "w") as catfile:
+            catfile.write("This is a placeholder file to mark this "
+                          "directory as a category, not a project.")
+
+    # The daemon only does this when it's asked to build.
+    if not (args.daemon or args.watch):
+        start_run()
+
+    # Taken before anything is loaded, so that changes made meanwhile count.
+    if args.daemon or args.watch:
+        loaded_stamp = daemon_stamp()
+    load_srg()
+    forge_installed() # So that the daemon keeps the answer.
+
+    # Everything above is what the daemon (or the watcher) keeps loaded.  The
+    # rest happens for each build, in a fork that starts from here.
+    forked = args.daemon or args.watch
+    if args.daemon:
+        request = builddaemon.serve(DAEMON_SOCKET, warm_state_stale,
+                                    prepare=warm_up)
+        arguments = request
+        args = parser.parse_args(request)
+    elif args.watch:
+        request = [arg for arg in arguments if arg != "--watch"]
+        args.projects, args.side = watch_for_changes()
+        # Workers need to know the sides, but get their projects one by one.
+        for side_name in args.side:
+            request += ["--side", side_name]
+        arguments = request
+
+    if forked:
+        apply_args()
+        start_run()
+        # This build's trace starts now, not when the SRG was loaded.
+        tracer = buildtrace.Tracer()
+        usage_log = childusage.UsageLog()
+        if warm_state_stale():
+            # Changed while this build waited for lib/.
+            lib_lock.release()
+            run_lock.release()
+            builddaemon.run_cold(["build"] + request)
+
+    if forge_installed():
+        print "!!! Forge detected.  Building universal packages only. !!!"
+        print
+
+    with tracer.phase("discovery"):
+        if not os.path.isdir(USER):
+            print "No user directory found.  Nothing to do."
+            return 0
+        if forked and "projects" in warm_state:
+            projects = warm_projects()
+            print "Found %d projects." % len(projects)
+        else:
+            projects = scan_projects()
+
+        if os.path.exists(os.path.join(LIB, "client_reobf.jar.inh")) \
+           or os.path.exists(os.path.join(LIB, "server_reobf.jar.inh")):
+            pass # Yay!
+        else:
+            print "Please run deobfuscate_libs first."
+            return 1
+
+        if forked and "libraries" in warm_state:
+            libraries, stored_inheritance = warm_libraries()
+        else:
+            libraries, stored_inheritance = find_libraries()
+        library_classpath = ":".join(libraries)
+
+    if class_index is None:
+        class_index = classindex.ClassIndex(CLASS_INDEX)
+
+    projects_dict = {}
+    for project in projects:
+        projects_dict[project.name] = project
 
-    print_messages(warnings)
+    if forge_installed():
+        sides = [FORGE]
+    else:
+        sides = [CLIENT, SERVER]
+        if args.side:
+            sides = [side for side in sides
+                     if SIDE_NAMES[side] in args.side]
+    # Projects keep what they built before for the other sides.
+    partial = len(sides) < (1 if forge_installed() else 2)
+
+    compile_temp = os.path.join(TEMP, "compile_temp")
+
+    if args.api_dir:
+        # The coordinator built them, and keeps them until the workers are
+        # done.
+        api_dir = args.api_dir
+    else:
+        api_dir = os.path.join(TEMP, "lib")
+        create_or_clean(api_dir)
+        refresh_class_index()
+        api_count = 0
+        for project in projects:
+            if project.api:
+                for side in sides:
+                    with tracer.phase("api", project.name, SIDE_NAMES[side]):
+                        project.compile(projects_dict, side, api_dir,
+                                        compile_temp, library_classpath,
+                                        api=True)
+                    api_count += 1
+
+        print "Built %d APIs." % api_count
+
+    library_classpath += ":" + api_dir
+    refresh_class_index()
+    if not args.worker: # The coordinator already said.
+        report_conflicts()
+
+    # Everything besides the projects themselves (and the SRG) that goes into
+    # the packages.  If any of it changes, every project is out of date.
+    build_environment = buildstate.hash_bytes(repr((
+        forge_installed(), args.full_classpath, args.reproducible,
+        args.compress,
+        [buildstate.hash_file(filename) for filename in
+         sorted(glob.glob(os.path.join(os.path.dirname(SCRIPT), "*.py")))],
+        [classpath_fingerprint(entry)
+         for entry in libraries + stored_inheritance
+                      + [MCP_BIN_CLIENT, MCP_BIN_SERVER]],
+        sorted(class_fingerprints(api_dir).items()))))
+
+    # Content hashes of input files, for the artifact cache.
+    file_hashes = buildstate.HashCache(os.path.join(BUILD, "hashes.idx"))
+
+    # Prepares package entries.
+    packer = packaging.Packer(args.package_workers)
+    # Resources are often the same in several packages (or several projects), so
+    # they're kept around to be compressed only once.
+    resource_store = packaging.EntryStore()
+
+    if args.cache:
+        artifact_cache = artifactcache.ArtifactCache(absolute(args.cache))
+    else:
+        artifact_cache = None
+
+    token_index = tokenindex.TokenIndex(os.path.join(BUILD, "tokens.idx"))
+    srg_hash = buildstate.hash_file(SRG)
+    srg_affected = token_index.stale_projects(resolve_srg_token)
+    if token_index.srg not in (None, srg_hash):
+        print "%s has changed since the last build." % SRG
+    if srg_affected:
+        print "Tokens resolve differently now in %d projects:" \
+                % len(srg_affected)
+        for name, files in sorted(srg_affected.items()):
+            print "    %s (%s)" % (name, ", ".join(sorted(files)))
+
+    tally = Tally()
+    if args.worker:
+        serve_coordinator()
+    else:
+        requested = []
+        for project in projects:
+            if args.projects and not project.name in args.projects:
+                print "Skipping unrequested project %s." % project.name
+            else:
+                requested.append(project)
 
-if errors:
-    print
-    print "Errors in %d projects:" % len(errors)
+        if coordinating:
+            for result in coordinate([project.name for project in requested],
+                                     args.workers):
+                tally.add(result)
+        else:
+            for project in requested:
+                tally.add(build_project(project))
+
+    # Everything else is saved along with whatever other builds saved meanwhile.
+    state_lock = locking.FileLock(STATE_LOCK, description="the build state")
+    state_lock.acquire()
+    project_states = buildstate.load(project_states_file, {})
+
+    # Forget projects that are gone, and clean their packages out of TARGET.
+    current_packages = set()
+    for name, state in project_states.items():
+        if name in projects_dict:
+            current_packages.update(state["packages"])
+        else:
+            for package in state["packages"]:
+                if os.path.exists(os.path.join(TARGET, package)):
+                    os.remove(os.path.join(TARGET, package))
+            del project_states[name]
+            token_index.forget(name)
+
+    # Anything else in TARGET is left over, unless another build is still busy
+    # adding its packages.
+    if not locking.other_runs_active(TEMP_ROOT):
+        for filename in os.listdir(TARGET):
+            if filename not in current_packages \
+               and os.path.isfile(os.path.join(TARGET, filename)):
+                os.remove(os.path.join(TARGET, filename))
+
+    packer.close()
+    janitor.finish()
+
+    buildstate.save(project_states_file, project_states)
+    token_index.save(srg_hash)
+    file_hashes.save()
+    state_lock.release()
+
+    if args.worker:
+        # The coordinator reports on everything.
+        return 0
+
+    s = "" if tally.count == 1 else "s"
+    print "%d project%s compiled and packaged successfully." \
+            % (tally.count, s)
+    if tally.up_to_date_count:
+        s = "" if tally.up_to_date_count == 1 else "s"
+        print "(%d unchanged project%s skipped.)" \
+                % (tally.up_to_date_count, s)
+    if tally.shared_count:
+        s = "" if tally.shared_count == 1 else "s"
+        print "(%d resource file%s shared with another package.)" \
+                % (tally.shared_count, s)
+    if tally.count and not forge_installed():
+        print "(%d client, %d server)" \
+                % (tally.client_count, tally.server_count)
+    if tally.count:
+        if tally.source_count == 0:
+            smiley = ":/"
+        elif tally.source_count == tally.count:
+            smiley = ":D"
+        else:
+            smiley = ":)"
+
+        print "Source included in packages for %d/%d projects.  %s" \
+                % (tally.source_count, tally.count, smiley)
+
+    biggest = usage_log.biggest()
+    if biggest is not None:
+        cpu = sum(entry["user"] + entry["system"]
+                  for entry in usage_log.processes if entry["user"] is not None)
+        where = biggest["project"] or ""
+        if biggest["side"]:
+            where += " (%s)" % biggest["side"]
+        print "%d child processes used %.1fs of CPU; the biggest was %s " \
+              "for %s, at %.1f MiB." % (len(usage_log.processes), cpu,
+                                        biggest["command"], where,
+                                        biggest["max_rss"] / 1024.0)
+
+    if args.usage:
+        usage_log.save(absolute(args.usage))
+        print
+        for line in usage_log.summary():
+            print line
+        print "(Usage saved to %s.)" % args.usage
 
-    print_messages(errors)
+    if args.trace:
+        tracer.save(absolute(args.trace))
+        print
+        for line in tracer.summary():
+            print line
+        print "(Trace saved to %s.)" % args.trace
+
+    if warnings:
+        print
+        print "Warnings in %d projects:" % len(warnings)
+
+        print_messages(warnings)
 
-    if __name__ == "__main__":
-        sys.exit(len(errors))
+    if errors:
+        print
+        print "Errors in %d projects:" % len(errors)
+
+        print_messages(errors)
+
+    return len(errors)
+
+def list_projects(argv):
+    """Lists the projects in USER, without building anything."""
+    argparse.ArgumentParser(
+        prog="recompile_mods.py projects",
+        description="Lists the projects in mods/.").parse_args(argv)
+
+    projects = scan_projects(quiet=True)
+    if not projects:
+        print "No projects in %s." % USER
+    for project in sorted(projects, key=lambda project: project.name):
+        notes = []
+        if project.api:
+            notes.append("API")
+        if project.dependencies:
+            notes.append("depends on " + ", ".join(project.dependencies))
+        line = "%s: %s" % (project.name, os.path.relpath(project.dir, BASE))
+        if notes:
+            line += " (%s)" % "; ".join(notes)
+        print line
+    return 0
+
+def show_config(argv):
+    """Shows where builds find things, and how they run Java."""
+    argparse.ArgumentParser(
+        prog="recompile_mods.py config",
+        description="Shows the settings that builds use.").parse_args(argv)
+
+    def state(path):
+        return path if os.path.exists(path) else path + " (missing)"
+    print "MCP directory:  %s" % BASE
+    print "Projects:       %s" % state(USER)
+    print "Packages:       %s" % TARGET
+    print "Libraries:      %s" % state(LIB)
+    print "SRG:            %s" % state(SRG)
+    print "Forge:          %s" % ("installed" if forge_installed() else "no")
+    print "Java:           %s" % " ".join([jvm.java] + jvm.flags)
+    print "Class sharing:  %s" % ("on" if jvm.class_data_sharing else "off")
+    return 0
+
+def query_srg(argv):
+    """Looks names up in the SRG, for writing tokens."""
+    parser = argparse.ArgumentParser(
+        prog="recompile_mods.py srg",
+        description="Looks names up in the SRG and shows them as "
+                    "%CL:...%, %FD:...% and %MD:...% tokens, with what they "
+                    "become.  A name with a / in it is matched against the "
+                    "start of whole names (like net/minecraft/src/Block/get); "
+                    "otherwise, against the start of class, field and "
+                    "method names, ignoring case.")
+    parser.add_argument("name")
+    parser.add_argument("--type", action="append", choices=srgindex.TYPES,
+                        help="Only look at names of this type.  Can be given "
+                             "more than once.")
+    parser.add_argument("--obf", action="store_true",
+                        help="NAME is obfuscated.  Find what it's called "
+                             "in the source.")
+    parser.add_argument("--contains", action="store_true",
+                        help="Match NAME anywhere in the names.")
+    parser.add_argument("--limit", type=int, default=50, metavar="N",
+                        help="Show at most N names.  (Default: 50)")
+    options = parser.parse_args(argv)
+
+    if not os.path.exists(SRG):
+        print "%s is missing.  Please run deobfuscate_libs first." % SRG
+        return 1
+    index = srgindex.load(SRG)
+
+    if options.contains:
+        results = index.containing(options.name, options.type, options.obf,
+                                   options.limit + 1)
+    elif options.obf or "/" in options.name:
+        results = index.prefixed(options.name, options.type, options.obf,
+                                 options.limit + 1)
+    else:
+        results = index.named(options.name, options.type, options.limit + 1)
+
+    for line_type, deobf, obf in results[:options.limit]:
+        if line_type in ("CL", "FD", "MD"):
+            print "%%%s:%s%%  ->  %s" % (line_type, deobf, obf)
+        else:
+            print "%s: %s  ->  %s" % (line_type, deobf, obf)
+    if len(results) > options.limit:
+        print "(Only the first %d are shown.  --limit N shows more.)" \
+                % options.limit
+    if results:
+        return 0
+
+    print "Nothing in the SRG matches %s." % options.name
+    if not options.obf:
+        suggestions = [(line_type, suggestion)
+                       for line_type in index.types(options.type)
+                       for suggestion in index.suggest(line_type,
+                                                       options.name)]
+        if suggestions:
+            print "Close matches:"
+            for line_type, suggestion in suggestions:
+                print "  %%%s:%s%%" % (line_type, suggestion)
+    return 1
+
+# What else recompile_mods.py can do.  Anything else on the command line is for
+# build.
+COMMANDS = {"build": build, "projects": list_projects, "config": show_config,
+            "srg": query_srg}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    builddaemon.SCRIPT = SCRIPT
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return build(argv)
+
+if __name__ == "__main__":
+    sys.exit(main())
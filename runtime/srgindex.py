@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Lookups and searches over an SRG, for writing %CL:...%, %FD:...% and
+# %MD:...% tokens and for saying what a token that doesn't resolve was
+# probably meant to be.
+#
+# Names are given the way tokens use them: a class as net/minecraft/src/Block,
+# a field as net/minecraft/src/Block/blockID and a method as
+# net/minecraft/src/Block/getBlockName ()Ljava/lang/String; (its descriptor
+# after a space).  The obfuscated names are in the same form.
+
+import bisect, difflib
+
+# The kinds of SRG lines, in the order they're listed.
+TYPES = ["PK", "CL", "FD", "MD"]
+
+def read_srg(filename):
+    """Yields (line type, obfuscated name, deobfuscated name) for each line of
+    an SRG.
+    """
+    with open(filename) as srgfile:
+        for line in srgfile:
+            parts = line.split("#")[0].split()
+
+            if len(parts) < 2:
+                continue
+
+            line_type = parts[0].strip(":")
+            parts = parts[1:]
+
+            size = len(parts) // 2
+            yield line_type, " ".join(parts[:size]), " ".join(parts[size:])
+
+def split_name(name):
+    """(parent, leaf, leaf name) for a name: the package or class it's in,
+    the rest, and the rest without a method's descriptor.
+    """
+    path = name.split(" ", 1)[0]
+    if "/" in path:
+        parent = path.rsplit("/", 1)[0]
+        leaf = name[len(parent) + 1:]
+    else:
+        parent, leaf = "", name
+    return parent, leaf, leaf.split(" ", 1)[0]
+
+class SrgIndex(object):
+    """The rest of the index is only made for the line types (and
+    directions) that are searched, the first time they are.
+    """
+    def __init__(self, entries):
+        """entries are (line type, obfuscated name, deobfuscated name)."""
+        # {line type: {deobfuscated: obfuscated}}, and the other way around as
+        # {line type: {obfuscated: [deobfuscated]}}.  The client and the
+        # server reuse each other's obfuscated names.
+        self.forward = {}
+        self.reverse = {}
+        for line_type, obf, deobf in entries:
+            self.forward.setdefault(line_type, {})[deobf] = obf
+            names = self.reverse.setdefault(line_type, {}).setdefault(obf, [])
+            if deobf not in names:
+                names.append(deobf)
+
+        # {(line type, reverse): sorted names}, for prefix searches.
+        self.sorted = {}
+        # {line type: {parent: [leaves]}}, for suggestions.
+        self.children = {}
+        # {line type: sorted [(lowercase leaf name, name)]}, to find names by
+        # just their last part.
+        self.leaf_names = {}
+
+    def sorted_names(self, line_type, reverse):
+        if (line_type, reverse) not in self.sorted:
+            if reverse:
+                names = self.reverse[line_type]
+            else:
+                names = self.forward[line_type]
+            self.sorted[line_type, reverse] = sorted(names)
+        return self.sorted[line_type, reverse]
+
+    def index_leaves(self, line_type):
+        if line_type in self.leaf_names:
+            return
+        children = self.children[line_type] = {}
+        leaf_names = []
+        # split_name, inlined; this runs for every name.
+        for name in self.forward[line_type]:
+            parent, slash, leaf_name = name.partition(" ")[0].rpartition("/")
+            children.setdefault(parent, []).append(name[len(parent)
+                                                        + len(slash):])
+            leaf_names.append((leaf_name.lower(), name))
+        leaf_names.sort()
+        self.leaf_names[line_type] = leaf_names
+
+    def types(self, types=None):
+        """The line types in the index (that are in types, if given)."""
+        present = [line_type for line_type in TYPES
+                   if line_type in self.forward] \
+                  + sorted(set(self.forward) - set(TYPES))
+        return [line_type for line_type in present
+                if types is None or line_type in types]
+
+    def lookup(self, line_type, name):
+        """The obfuscated name for a deobfuscated one, or None."""
+        return self.forward.get(line_type, {}).get(name)
+
+    def reverse_lookup(self, line_type, name):
+        """The deobfuscated names for an obfuscated one, in the SRG's order.
+        Empty if there are none.
+        """
+        return list(self.reverse.get(line_type, {}).get(name, []))
+
+    def results(self, line_type, name, reverse):
+        """[(line type, deobfuscated name, obfuscated name)] for a name, one
+        for each deobfuscated name an obfuscated one has.
+        """
+        if reverse:
+            return [(line_type, deobf, name)
+                    for deobf in self.reverse[line_type][name]]
+        return [(line_type, name, self.forward[line_type][name])]
+
+    def prefixed(self, prefix, types=None, reverse=False, limit=None):
+        """The names that start with prefix, as (line type, deobfuscated,
+        obfuscated).  With reverse, the obfuscated names are searched.
+        """
+        results = []
+        for line_type in self.types(types):
+            names = self.sorted_names(line_type, reverse)
+            index = bisect.bisect_left(names, prefix)
+            while index < len(names) and names[index].startswith(prefix):
+                results.extend(self.results(line_type, names[index], reverse))
+                if limit is not None and len(results) >= limit:
+                    return results[:limit]
+                index += 1
+        return results
+
+    def containing(self, text, types=None, reverse=False, limit=None):
+        """Like prefixed, for the names with text anywhere in them."""
+        results = []
+        for line_type in self.types(types):
+            for name in self.sorted_names(line_type, reverse):
+                if text in name:
+                    results.extend(self.results(line_type, name, reverse))
+                    if limit is not None and len(results) >= limit:
+                        return results[:limit]
+        return results
+
+    def named(self, prefix, types=None, limit=None):
+        """Like prefixed, for the deobfuscated names whose last part (a class,
+        field or method name) starts with prefix, ignoring case.
+        """
+        prefix = prefix.lower()
+        results = []
+        for line_type in self.types(types):
+            self.index_leaves(line_type)
+            names = self.leaf_names[line_type]
+            index = bisect.bisect_left(names, (prefix,))
+            while index < len(names) and names[index][0].startswith(prefix):
+                results.extend(self.results(line_type, names[index][1],
+                                            False))
+                if limit is not None and len(results) >= limit:
+                    return results
+                index += 1
+        return results
+
+    def same_leaf_name(self, line_type, leaf_name):
+        """The deobfuscated names whose last part is leaf_name, ignoring
+        case.
+        """
+        self.index_leaves(line_type)
+        names = self.leaf_names[line_type]
+        index = bisect.bisect_left(names, (leaf_name.lower(),))
+        matches = []
+        while index < len(names) and names[index][0] == leaf_name.lower():
+            matches.append(names[index][1])
+            index += 1
+        return matches
+
+    def suggest(self, line_type, name, limit=5):
+        """Deobfuscated names of line_type that name was probably meant to be,
+        best first.
+        """
+        if line_type not in self.forward:
+            return []
+        self.index_leaves(line_type)
+        children = self.children[line_type]
+        parent, leaf, leaf_name = split_name(name)
+        suggestions = []
+        def add(candidate):
+            if candidate != name and candidate not in suggestions \
+               and candidate in self.forward[line_type]:
+                suggestions.append(candidate)
+
+        same_leaf = self.same_leaf_name(line_type, leaf_name)
+
+        # The same name, spelled with other capitals.
+        for candidate in same_leaf:
+            if candidate.lower() == name.lower():
+                add(candidate)
+
+        # The same thing somewhere else, like a method that's in a
+        # superclass.
+        for candidate in same_leaf:
+            if split_name(candidate)[1] == leaf:
+                add(candidate)
+
+        if not parent:
+            # Just a name, so compare it with just the names.
+            leaf_names = sorted(set(lower for lower, candidate
+                                    in self.leaf_names[line_type]))
+            for close in difflib.get_close_matches(leaf_name.lower(),
+                                                   leaf_names, limit):
+                for candidate in self.same_leaf_name(line_type, close):
+                    add(candidate)
+            return suggestions[:limit]
+
+        # Something else in the same place, or a package or class spelled
+        # nearly the same.
+        parents = [parent]
+        if parent not in children:
+            parents = difflib.get_close_matches(parent, list(children), 3)
+        for close_parent in parents:
+            leaves = children.get(close_parent, [])
+            # A method with another descriptor.
+            for other in leaves:
+                if other.split(" ", 1)[0] == leaf_name:
+                    add(close_parent + "/" + other)
+            for other in difflib.get_close_matches(leaf, leaves, limit):
+                add(close_parent + "/" + other)
+
+        # The same name somewhere else, with another descriptor.
+        for candidate in same_leaf:
+            add(candidate)
+
+        return suggestions[:limit]
+
+def load(filename):
+    """The index of the SRG in filename."""
+    return SrgIndex(read_srg(filename))
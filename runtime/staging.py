@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Helpers for the temp trees.  Files that don't need any changes are put
+# there without copying their bytes, if the filesystem allows it: first as a
+# reflink (a copy-on-write clone), then as a hardlink, and only then as a real
+# copy.  Old trees are moved out of the way and removed in the background.
+
+import itertools, os, os.path, Queue, re, shutil, threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Not on Windows.
+
+# The FICLONE ioctl from linux/fs.h.
+FICLONE = 0x40049409
+
+# (source device, destination device) pairs that can't be reflinked or
+# hardlinked, so that each is only tried once.
+no_reflink = set()
+no_hardlink = set()
+
+def device_of(path):
+    return os.stat(path).st_dev
+
+def reflink(source, dest):
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source, "rb") as infile:
+            with open(dest, "wb") as outfile:
+                fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dest):
+            os.remove(dest)
+        return False
+
+    shutil.copystat(source, dest)
+    return True
+
+def hardlink(source, dest):
+    try:
+        os.link(source, dest)
+    except (OSError, AttributeError):
+        return False
+    return True
+
+def stage(source, dest, hardlinks=True):
+    """Puts a copy of source at dest, which must not be written to in place.
+
+    Anything already at dest is replaced, never written through.  With
+    hardlinks, the copy may share its inode with source, so dest must only
+    ever be replaced or removed; without, it's always a file of its own.
+    Like shutil.copy2, the copy keeps source's timestamps.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+
+    devices = (device_of(source), device_of(os.path.dirname(dest) or "."))
+
+    if devices not in no_reflink:
+        if reflink(source, dest):
+            return
+        no_reflink.add(devices)
+
+    if hardlinks and devices not in no_hardlink:
+        if hardlink(source, dest):
+            return
+        no_hardlink.add(devices)
+
+    try:
+        shutil.copy2(source, dest)
+    except shutil.WindowsError:
+        pass # Windows doesn't like copying access time.
+
+def is_shared(path):
+    """Whether path is hardlinked to a file somewhere else."""
+    return os.stat(path).st_nlink > 1
+
+# Names of trees waiting to be removed.
+TRASH = re.compile(r"\.trash-\d+-\d+$")
+
+class Janitor(object):
+    """Removes old trees on a background thread.
+
+    Renaming a tree is nearly instant, even when removing it isn't, so the
+    build can go on while the old files are deleted.
+    """
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.counter = itertools.count()
+
+    def discard(self, dir):
+        """Moves dir out of the way, to be removed later."""
+        trash = "%s.trash-%d-%d" % (dir.rstrip(os.sep), os.getpid(),
+                                    next(self.counter))
+        try:
+            os.rename(dir, trash)
+        except OSError:
+            # Windows won't rename a directory that's in use.
+            shutil.rmtree(dir)
+            return
+        self.remove_later(trash)
+
+    def sweep(self, parent, prefix=""):
+        """Removes what an interrupted run left behind in parent (only the
+        trees whose names start with prefix).
+        """
+        if os.path.isdir(parent):
+            for name in os.listdir(parent):
+                if name.startswith(prefix) and TRASH.search(name):
+                    self.remove_later(os.path.join(parent, name))
+
+    def remove_later(self, path):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.work,
+                                           name="temp cleanup")
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(path)
+
+    def work(self):
+        while True:
+            path = self.queue.get()
+            shutil.rmtree(path, ignore_errors=True)
+            self.queue.task_done()
+
+    def finish(self):
+        """Waits until everything has been removed."""
+        self.queue.join()
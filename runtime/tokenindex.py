@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Remembers which substitution tokens (%MD:...%, %FD:...%, %CL:...% and
+# %conf:...%) each project's files use and what they resolved to, so that an
+# SRG update only affects the projects whose tokens now resolve differently.
+
+import collections
+
+import buildstate
+
+class TokenIndex(object):
+    def __init__(self, filename):
+        self.filename = filename
+        state = buildstate.load(filename, {})
+
+        # The hash of the SRG that was current when this was saved.
+        self.srg = state.get("srg")
+        # {project name: {file: set of (token type, value)}}
+        self.usage = state.get("usage", {})
+        # {project name: {(token type, value): replacement}}
+        self.resolutions = state.get("resolutions", {})
+        # Projects this has updated or forgotten since it was loaded.
+        self.touched = set()
+
+    def users(self):
+        """The reverse index: {token: {project name: set of files}}."""
+        users = collections.defaultdict(lambda: collections.defaultdict(set))
+        for project, files in self.usage.items():
+            for filename, tokens in files.items():
+                for token in tokens:
+                    users[token][project].add(filename)
+        return users
+
+    def stale_projects(self, resolve):
+        """Finds the projects using tokens that resolve differently now.
+
+        resolve takes a (token type, value) pair and returns its current
+        replacement, or None if there isn't one.  Returns
+        {project name: set of affected files}.
+        """
+        stale = collections.defaultdict(set)
+        for token, projects in self.users().items():
+            replacement = resolve(token)
+            for project, files in projects.items():
+                if self.resolutions[project].get(token) != replacement:
+                    stale[project].update(files)
+        return stale
+
+    def update(self, project, usage, resolve):
+        """Replaces a project's usage with what its latest build used."""
+        self.touched.add(project)
+        self.usage[project] = dict((filename, set(tokens))
+                                   for filename, tokens in usage.items()
+                                   if tokens)
+        self.resolutions[project] = {}
+        for tokens in self.usage[project].values():
+            for token in tokens:
+                self.resolutions[project][token] = resolve(token)
+
+    def forget(self, project):
+        self.touched.add(project)
+        self.usage.pop(project, None)
+        self.resolutions.pop(project, None)
+
+    def save(self, srg):
+        """Saves the projects this has touched, keeping whatever other
+        builds saved for the rest in the meantime.  (Callers have to make
+        sure nobody else saves at the same time.)
+        """
+        state = buildstate.load(self.filename, {})
+        usage = state.get("usage", {})
+        resolutions = state.get("resolutions", {})
+        for project in self.touched:
+            if project in self.usage:
+                usage[project] = self.usage[project]
+                resolutions[project] = self.resolutions[project]
+            else:
+                usage.pop(project, None)
+                resolutions.pop(project, None)
+
+        self.srg = srg
+        self.usage = usage
+        self.resolutions = resolutions
+        self.touched = set()
+        buildstate.save(self.filename, {"srg": srg, "usage": usage,
+                                        "resolutions": resolutions})
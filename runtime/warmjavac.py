@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Keeps one JVM running javac for the daemon's (or the watcher's) builds, so
+# that each javac run doesn't start a JVM and warm up the compiler again.
+#
+# The server is WarmJavac.java, compiled the first time it's needed.  It
+# listens on a loopback port, and only answers requests that start with the
+# secret it was given on its stdin.  A request is the secret, the number of
+# arguments and the arguments, a line each; the reply is javac's exit code on
+# a line of its own, then its output.  The server exits once its stdin is
+# closed, i.e. once the daemon and every build it forked are gone.
+#
+# Builds find the server through the environment, so that their workers can
+# use it too.  Whenever it can't be used, they run javac themselves.
+
+import binascii, os, os.path, shutil, socket, subprocess, sys, \
+       tempfile, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Not on Windows.
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "WarmJavac.java")
+MAIN_CLASS = "WarmJavac"
+
+# "port secret directory" of the server builds should use.
+ENVIRONMENT = "MCP_WARM_JAVAC"
+
+# The server this process started, kept so that its stdin stays open.
+server = []
+
+def find_java():
+    """The java that goes with the javac on the PATH, or None."""
+    for dir in os.environ.get("PATH", "").split(os.pathsep):
+        javac = os.path.join(dir, "javac")
+        if os.path.isfile(javac) and os.access(javac, os.X_OK):
+            java = os.path.join(os.path.dirname(os.path.realpath(javac)),
+                                "java")
+            if os.path.isfile(java):
+                return java
+            return None
+    return None
+
+def compile_server(class_dir):
+    """Compiles the server into class_dir, unless it's there already.
+    Returns whether it is now.
+    """
+    main_file = os.path.join(class_dir, MAIN_CLASS + ".class")
+    if os.path.exists(main_file) \
+       and os.path.getmtime(main_file) >= os.path.getmtime(SOURCE):
+        return True
+
+    parent = os.path.dirname(class_dir)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    staging_dir = tempfile.mkdtemp(dir=parent)
+    try:
+        with open(os.devnull, "w") as devnull:
+            exit = subprocess.call(["javac", "-nowarn", "-d", staging_dir,
+                                    SOURCE], stdout=devnull, stderr=devnull)
+        compiled = os.path.join(staging_dir, MAIN_CLASS + ".class")
+        if exit != 0 or not os.path.exists(compiled):
+            return False
+
+        if not os.path.isdir(class_dir):
+            os.makedirs(class_dir)
+        # The main class goes last, so that it's only ever there with the
+        # inner classes it needs.
+        for name in sorted(os.listdir(staging_dir),
+                           key=lambda name: name == MAIN_CLASS + ".class"):
+            os.rename(os.path.join(staging_dir, name),
+                      os.path.join(class_dir, name))
+        return True
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def close_on_exec(stream):
+    if fcntl is not None:
+        flags = fcntl.fcntl(stream.fileno(), fcntl.F_GETFD)
+        fcntl.fcntl(stream.fileno(), fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+def start(class_dir, directory):
+    """Starts the server in directory, unless it's running already.  Builds
+    started from here on use it, as long as they run from the same directory.
+    Returns whether they can.
+    """
+    if server and server[0].poll() is None:
+        return True
+    del server[:]
+    os.environ.pop(ENVIRONMENT, None)
+
+    java = find_java()
+    try:
+        if java is None or not compile_server(class_dir):
+            return False
+        process = subprocess.Popen([java, "-classpath", class_dir, MAIN_CLASS],
+                                   cwd=directory, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, close_fds=True)
+    except (OSError, IOError):
+        return False
+
+    # Only this process and its forks keep the server going; nothing they
+    # run should.
+    close_on_exec(process.stdin)
+    secret = binascii.hexlify(os.urandom(16))
+    try:
+        process.stdin.write(secret + "\n")
+        process.stdin.flush()
+        port = process.stdout.readline().strip()
+    except IOError:
+        port = ""
+    process.stdout.close()
+    if not port.isdigit():
+        process.stdin.close()
+        process.wait()
+        return False
+
+    server.append(process)
+    os.environ[ENVIRONMENT] = "%s %s %s" % (port, secret, directory)
+    return True
+
+def call(cmd):
+    """Runs javac with cmd's arguments on the server.
+
+    Returns (exit code, resource usage) like childusage.call, except that
+    only the wall time is known.  javac's output goes to stderr.  Returns
+    None, without running anything, if there's no server to use.
+    """
+    setting = os.environ.get(ENVIRONMENT)
+    if not setting:
+        return None
+    port, secret, directory = setting.split(" ", 2)
+    # The server resolves relative paths against its own directory, and can't
+    # apply JVM options (-J).  Argument files are left to a real javac too.
+    if os.path.realpath(os.getcwd()) != os.path.realpath(directory) \
+       or [arg for arg in cmd[1:] if "\n" in arg or arg.startswith("-J")
+                                     or arg.startswith("@")]:
+        return None
+
+    started = time.time()
+    request = [secret, str(len(cmd) - 1)] + list(cmd[1:])
+    try:
+        connection = socket.create_connection(("127.0.0.1", int(port)))
+        try:
+            connection.sendall("\n".join(request) + "\n")
+            replies = connection.makefile("rb")
+            exit = replies.readline()
+            output = replies.read()
+            replies.close()
+        finally:
+            connection.close()
+    except socket.error:
+        return None
+
+    try:
+        exit = int(exit)
+    except ValueError:
+        return None # It gave up on the request.
+    sys.stderr.write(output)
+    sys.stderr.flush()
+    return exit, {"wall": time.time() - started, "user": None,
+                  "system": None, "max_rss": None}
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Watches directory trees and single files for changes.  On Linux, that's done
+# with inotify (through ctypes); anywhere else, or if inotify can't be used,
+# the files are polled instead.
+
+import ctypes, ctypes.util, errno, os, os.path, select, struct, time
+
+# How long things have to stay quiet before a burst of changes counts as done.
+SETTLE_TIME = 0.3
+# How often files are polled without inotify.
+POLL_INTERVAL = 1.0
+
+# From sys/inotify.h.
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 02000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+              | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher(object):
+    """Watches with inotify.  Raises OSError if it can't."""
+    def __init__(self, dirs, files):
+        name = ctypes.util.find_library("c")
+        if name is None:
+            raise OSError(errno.ENOSYS, "No C library found")
+        self.libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "No inotify")
+
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self.dirs = [os.path.abspath(dir) for dir in dirs]
+        self.files = set(os.path.abspath(file) for file in files)
+        # What each watch descriptor is watching.
+        self.watches = {}
+
+        for dir in self.dirs:
+            self.add_tree(dir)
+        for dir in set(os.path.dirname(file) for file in self.files):
+            self.add(dir)
+
+    def add(self, dir):
+        wd = self.libc.inotify_add_watch(self.fd, dir, WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                return # Gone already.
+            raise OSError(error, "%s: %s" % (dir, os.strerror(error)))
+        self.watches[wd] = dir
+
+    def add_tree(self, root):
+        """Watches root and everything under it.  Returns the files in it."""
+        found = []
+        for (dir, subdirs, files) in os.walk(root, followlinks=True):
+            self.add(dir)
+            found.extend(os.path.join(dir, file) for file in files)
+        return found
+
+    def watched(self, path):
+        return path in self.files \
+               or any(path == dir or path.startswith(dir + os.sep)
+                      for dir in self.dirs)
+
+    def changes(self, timeout=None):
+        """Waits up to timeout seconds (forever if None) for changes, and
+        returns the paths that changed.
+        """
+        while True:
+            try:
+                readable = select.select([self.fd], [], [], timeout)[0]
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                return []
+            changed = self.read_events()
+            if changed or timeout is not None:
+                return changed
+
+    def read_events(self):
+        data = os.read(self.fd, 65536)
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip("\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so anything could have changed.
+                changed.extend(self.dirs)
+                changed.extend(self.files)
+                continue
+
+            dir = self.watches.get(wd)
+            if dir is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+
+            if name:
+                path = os.path.join(dir, name)
+            else:
+                path = dir
+            if not self.watched(path):
+                continue # Something else next to a watched file.
+
+            changed.append(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Whatever is in a new directory is new as well.
+                changed.extend(self.add_tree(path))
+        return changed
+
+class PollingWatcher(object):
+    """Watches by comparing sizes and mtimes every so often."""
+    def __init__(self, dirs, files):
+        self.dirs = [os.path.abspath(dir) for dir in dirs]
+        self.files = [os.path.abspath(file) for file in files]
+        self.snapshot = self.scan()
+
+    def scan(self):
+        stamps = {}
+        def stamp(path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            stamps[path] = (stat.st_size, stat.st_mtime)
+
+        for root in self.dirs:
+            for (dir, subdirs, files) in os.walk(root, followlinks=True):
+                for file in files:
+                    stamp(os.path.join(dir, file))
+        for file in self.files:
+            stamp(file)
+        return stamps
+
+    def changes(self, timeout=None):
+        while True:
+            if timeout is None:
+                time.sleep(POLL_INTERVAL)
+            else:
+                time.sleep(timeout)
+
+            snapshot = self.scan()
+            changed = [path for path in set(snapshot) | set(self.snapshot)
+                       if snapshot.get(path) != self.snapshot.get(path)]
+            self.snapshot = snapshot
+            if changed or timeout is not None:
+                return changed
+
+def watcher(dirs, files):
+    """The best watcher available for dirs (whole trees) and files."""
+    try:
+        return InotifyWatcher(dirs, files)
+    except (OSError, AttributeError), e:
+        print "Can't use inotify (%s).  Polling for changes instead." % e
+        return PollingWatcher(dirs, files)
+
+def wait_for_changes(watcher):
+    """Waits for a burst of changes to be over, and returns what changed."""
+    changed = set(watcher.changes())
+    while True:
+        more = watcher.changes(SETTLE_TIME)
+        if not more:
+            return changed
+        changed.update(more)
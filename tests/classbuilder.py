@@ -0,0 +1,138 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+# Writes small class files for the tests, so that they don't need a JDK.
+
+import os, struct, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "runtime"))
+
+import classfile
+
+class ClassBuilder(object):
+    def __init__(self, name, super_name="java/lang/Object", interfaces=(),
+                 access=classfile.ACC_PUBLIC, source_file=None,
+                 signature=None):
+        self.name = name
+        self.super_name = super_name
+        self.interfaces = list(interfaces)
+        self.access = access
+        self.source_file = source_file
+        self.signature = signature
+        self.fields = []
+        self.methods = []
+        # Extra constants: references to other classes and longs.
+        self.references = []
+        self.longs = []
+
+    def field(self, name, descriptor, access=classfile.ACC_PUBLIC,
+              constant=None, signature=None):
+        """constant is an int (for ConstantValue), or None."""
+        self.fields.append((access, name, descriptor, constant, signature,
+                            None, ()))
+        return self
+
+    def method(self, name, descriptor, access=classfile.ACC_PUBLIC,
+               code="", exceptions=(), signature=None):
+        self.methods.append((access, name, descriptor, None, signature,
+                             code, exceptions))
+        return self
+
+    def reference(self, name):
+        self.references.append(name)
+        return self
+
+    def long(self, value):
+        self.longs.append(value)
+        return self
+
+    def build(self):
+        pool = Pool()
+        for value in self.longs:
+            pool.long(value)
+        this = pool.class_ref(self.name)
+        super_index = 0
+        if self.super_name is not None:
+            super_index = pool.class_ref(self.super_name)
+        interfaces = [pool.class_ref(name) for name in self.interfaces]
+        for name in self.references:
+            pool.class_ref(name)
+
+        members = [self.members(pool, self.fields),
+                   self.members(pool, self.methods)]
+        attributes = []
+        if self.source_file is not None:
+            attributes.append(pool.attribute(
+                "SourceFile", struct.pack(">H", pool.utf8(self.source_file))))
+        if self.signature is not None:
+            attributes.append(pool.attribute(
+                "Signature", struct.pack(">H", pool.utf8(self.signature))))
+
+        return "".join([struct.pack(">IHH", classfile.MAGIC, 0, 50),
+                        pool.data(),
+                        struct.pack(">HHH", self.access, this, super_index),
+                        struct.pack(">H", len(interfaces)),
+                        "".join(struct.pack(">H", index)
+                                for index in interfaces)]
+                       + members
+                       + [struct.pack(">H", len(attributes))] + attributes)
+
+    def members(self, pool, members):
+        data = [struct.pack(">H", len(members))]
+        for (access, name, descriptor, constant, signature, code,
+             exceptions) in members:
+            attributes = []
+            if constant is not None:
+                attributes.append(pool.attribute(
+                    "ConstantValue", struct.pack(">H", pool.integer(constant))))
+            if signature is not None:
+                attributes.append(pool.attribute(
+                    "Signature", struct.pack(">H", pool.utf8(signature))))
+            if code:
+                attributes.append(pool.attribute("Code", code))
+            if exceptions:
+                indices = [pool.class_ref(exception)
+                           for exception in exceptions]
+                attributes.append(pool.attribute(
+                    "Exceptions", struct.pack(">H%dH" % len(indices),
+                                              len(indices), *indices)))
+            data.append(struct.pack(">HHHH", access, pool.utf8(name),
+                                    pool.utf8(descriptor), len(attributes)))
+            data.extend(attributes)
+        return "".join(data)
+
+class Pool(object):
+    """A constant pool, which hands out the index of each constant."""
+    def __init__(self):
+        self.constants = []
+        self.indices = {}
+        self.next_index = 1
+
+    def add(self, tag, payload, slots=1):
+        key = (tag, payload)
+        if key not in self.indices:
+            self.indices[key] = self.next_index
+            self.constants.append(struct.pack(">B", tag) + payload)
+            self.next_index += slots
+        return self.indices[key]
+
+    def utf8(self, text):
+        return self.add(classfile.UTF8, struct.pack(">H", len(text)) + text)
+
+    def class_ref(self, name):
+        return self.add(classfile.CLASS, struct.pack(">H", self.utf8(name)))
+
+    def integer(self, value):
+        return self.add(classfile.INTEGER, struct.pack(">i", value))
+
+    def long(self, value):
+        return self.add(classfile.LONG, struct.pack(">q", value), slots=2)
+
+    def attribute(self, name, data):
+        return struct.pack(">HI", self.utf8(name), len(data)) + data
+
+    def data(self):
+        return struct.pack(">H", self.next_index) + "".join(self.constants)
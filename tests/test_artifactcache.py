@@ -0,0 +1,169 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import cPickle, json, os, shutil, tempfile, unittest, zipfile
+
+import classbuilder # Sets up the path.
+import artifactcache, recompile_mods
+
+METADATA = {"created": False,
+            "token_usage": {"src/A.java": set([("CL", "net/minecraft/A")])}}
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = artifactcache.ArtifactCache(self.path("cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, *names):
+        return os.path.join(self.dir, *names)
+
+    def make_zip(self, names):
+        filename = self.path("classes.zip")
+        archive = zipfile.ZipFile(filename, "w")
+        for name in names:
+            archive.writestr(zipfile.ZipInfo(name), "data")
+        archive.close()
+        return filename
+
+    def manifest(self, key):
+        return os.path.join(self.cache.entry_dir(key), artifactcache.MANIFEST)
+
+    def write_manifest(self, key, manifest):
+        with open(self.manifest(key), "w") as outfile:
+            json.dump(manifest, outfile)
+
+    def test_store_and_lookup(self):
+        classes = self.make_zip(["a/A.class"])
+        self.cache.store("abcdef", {"classes.zip": classes}, METADATA)
+        files, metadata = self.cache.lookup("abcdef")
+        self.assertEqual(metadata, {"created": False, "token_usage": {
+                             "src/A.java": [("CL", "net/minecraft/A")]}})
+
+        artifactcache.extract(files["classes.zip"], self.path("out"))
+        with open(self.path("out", "a", "A.class")) as infile:
+            self.assertEqual(infile.read(), "data")
+        self.assertEqual(self.cache.lookup("012345"), None)
+
+    def test_bad_member_names(self):
+        for name in ["../escaped.class", "/absolute.class",
+                     "a/../../escaped.class", "..\\escaped.class",
+                     "C:/drive.class"]:
+            classes = self.make_zip(["a/Fine.class", name])
+            self.assertRaises(artifactcache.BadEntry, artifactcache.extract,
+                              classes, self.path("out"))
+        self.assertFalse(os.path.exists(self.path("escaped.class")))
+
+    def test_unreadable(self):
+        with open(self.path("classes.zip"), "w") as outfile:
+            outfile.write("not a zip")
+        self.assertRaises(artifactcache.BadEntry, artifactcache.extract,
+                          self.path("classes.zip"), self.path("out"))
+
+    def test_bad_manifest(self):
+        self.cache.store("abcdef", {"classes.zip": self.make_zip([])},
+                         METADATA)
+        good = {"files": ["classes.zip"],
+                "metadata": {"created": False, "token_usage": {}}}
+        self.write_manifest("abcdef", good)
+        self.assertNotEqual(self.cache.lookup("abcdef"), None)
+
+        bad = [
+            [],
+            {"files": ["../../elsewhere", "classes.zip"],
+             "metadata": good["metadata"]},
+            {"files": ["classes.zip"]},
+            {"files": ["classes.zip"],
+             "metadata": {"created": "yes", "token_usage": {}}},
+            {"files": ["classes.zip"],
+             "metadata": {"created": False, "token_usage": {"A.java": "CL"}}},
+            {"files": ["classes.zip"],
+             "metadata": {"created": False,
+                          "token_usage": {"A.java": [["CL", 1]]}}},
+            # A package was created, but isn't there.
+            {"files": ["classes.zip"],
+             "metadata": {"created": True, "token_usage": {}}},
+        ]
+        for manifest in bad:
+            self.write_manifest("abcdef", manifest)
+            self.assertEqual(self.cache.lookup("abcdef"), None)
+
+        with open(self.manifest("abcdef"), "w") as outfile:
+            outfile.write("not JSON")
+        self.assertEqual(self.cache.lookup("abcdef"), None)
+
+    def test_pickles_not_read(self):
+        self.cache.store("abcdef", {"classes.zip": self.make_zip([])},
+                         METADATA)
+        os.remove(self.manifest("abcdef"))
+        with open(os.path.join(self.cache.entry_dir("abcdef"), "manifest"),
+                  "wb") as outfile:
+            cPickle.dump({"files": ["classes.zip"], "metadata": METADATA},
+                         outfile)
+        self.assertEqual(self.cache.lookup("abcdef"), None)
+
+    def test_pruned(self):
+        self.cache.store("abcdef", {"classes.zip": self.make_zip([])},
+                         METADATA)
+        os.remove(os.path.join(self.cache.entry_dir("abcdef"), "classes.zip"))
+        self.assertEqual(self.cache.lookup("abcdef"), None)
+
+class RestoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = artifactcache.ArtifactCache(os.path.join(self.dir,
+                                                              "cache"))
+        for name in ["TEMP", "TARGET"]:
+            self.addCleanup(setattr, recompile_mods, name,
+                            getattr(recompile_mods, name, None))
+            setattr(recompile_mods, name, os.path.join(self.dir, name))
+            os.makedirs(getattr(recompile_mods, name))
+
+        self.project = recompile_mods.Project.__new__(recompile_mods.Project)
+        self.project.name = "test"
+        self.project.package_name = "test"
+        self.project.extension = "zip"
+        self.project.token_usage = recompile_mods.collections.defaultdict(set)
+
+        classes = os.path.join(self.dir, "classes.zip")
+        archive = zipfile.ZipFile(classes, "w")
+        archive.writestr("a/A.class", "data")
+        archive.close()
+        files = {"classes.zip": classes}
+        for name in ["package", "obfuscated"]:
+            files[name] = os.path.join(self.dir, name)
+            with open(files[name], "w") as outfile:
+                outfile.write(name)
+        self.cache.store("abcdef", files, {"created": True, "token_usage": {}})
+        self.compile_dir = os.path.join(self.dir, "build", "test")
+
+    def tearDown(self):
+        recompile_mods.janitor.finish()
+        shutil.rmtree(self.dir)
+
+    def test_restore(self):
+        cached = self.cache.lookup("abcdef")
+        self.assertTrue(self.project.restore_artifacts(
+            cached, recompile_mods.CLIENT, self.compile_dir))
+        published = os.path.join(recompile_mods.TARGET, "test.zip")
+        with open(published) as infile:
+            self.assertEqual(infile.read(), "obfuscated")
+        # Its own file, not a link into the cache.
+        self.assertEqual(os.stat(published).st_nlink, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.compile_dir, "a",
+                                                    "A.class")))
+
+    def test_pruned_after_lookup(self):
+        cached = self.cache.lookup("abcdef")
+        os.remove(cached[0]["obfuscated"])
+        self.assertRaises(artifactcache.BadEntry,
+                          self.project.restore_artifacts, cached,
+                          recompile_mods.CLIENT, self.compile_dir)
+        self.assertEqual(os.listdir(self.compile_dir), [])
+
+if __name__ == "__main__":
+    unittest.main()
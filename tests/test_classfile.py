@@ -0,0 +1,189 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import StringIO, unittest
+
+from classbuilder import ClassBuilder
+import classfile
+
+class SlowStream(object):
+    """A stream that hands out a few bytes at a time, and counts them."""
+    def __init__(self, data, step=3):
+        self.data = data
+        self.step = step
+        self.consumed = 0
+
+    def read(self, size):
+        chunk = self.data[self.consumed:self.consumed + min(size, self.step)]
+        self.consumed += len(chunk)
+        return chunk
+
+def parse(builder, **kwargs):
+    return classfile.ClassFile(builder.build(), **kwargs)
+
+def example():
+    return ClassBuilder("net/minecraft/src/Block", interfaces=["a/I", "a/J"],
+                        source_file="Block.java") \
+           .field("blockID", "I") \
+           .field("secret", "I", access=classfile.ACC_PRIVATE) \
+           .method("getBlockName", "()Ljava/lang/String;",
+                   code="\x01\x02\x03")
+
+class ParseTest(unittest.TestCase):
+    def test_header(self):
+        parsed = parse(example())
+        self.assertEqual(parsed.name, "net/minecraft/src/Block")
+        self.assertEqual(parsed.super_name, "java/lang/Object")
+        self.assertEqual(parsed.interfaces, ["a/I", "a/J"])
+        self.assertEqual(parsed.package, "net/minecraft/src")
+        self.assertEqual(parsed.source_file, "Block.java")
+        self.assertEqual(classfile.parents(parsed),
+                         ("java/lang/Object", "a/I", "a/J"))
+
+    def test_members(self):
+        parsed = parse(example())
+        self.assertEqual([field.name for field in parsed.fields],
+                         ["blockID", "secret"])
+        method = parsed.methods[0]
+        self.assertEqual((method.name, method.descriptor),
+                         ("getBlockName", "()Ljava/lang/String;"))
+        self.assertEqual(method.attributes["Code"], "\x01\x02\x03")
+
+    def test_no_superclass(self):
+        parsed = parse(ClassBuilder("java/lang/Object", super_name=None))
+        self.assertEqual(parsed.super_name, None)
+        self.assertEqual(classfile.parents(parsed), ())
+
+    def test_longs_take_two_slots(self):
+        parsed = parse(example().long(1).long(2))
+        self.assertEqual(parsed.name, "net/minecraft/src/Block")
+
+    def test_stream(self):
+        data = example().build()
+        parsed = classfile.ClassFile(SlowStream(data))
+        self.assertEqual(parsed.fields[0].name, "blockID")
+        self.assertEqual(parsed.source_file, "Block.java")
+
+    def test_header_only(self):
+        data = example().build()
+        stream = StringIO.StringIO(data)
+        parsed = classfile.ClassFile(stream, header_only=True)
+        self.assertEqual(parsed.interfaces, ["a/I", "a/J"])
+        self.assertEqual(parsed.fields, [])
+        self.assertEqual(parsed.methods, [])
+
+        # The members are never needed, so they don't have to be there.
+        header_end = stream.tell()
+        parsed = classfile.ClassFile(data[:header_end], header_only=True)
+        self.assertEqual(parsed.name, "net/minecraft/src/Block")
+
+    def test_bad_input(self):
+        data = example().build()
+        self.assertRaises(classfile.ClassFormatError,
+                          classfile.ClassFile, "\0" + data[1:])
+        self.assertRaises(classfile.ClassFormatError,
+                          classfile.ClassFile, data[:-1])
+        self.assertRaises(classfile.ClassFormatError,
+                          classfile.ClassFile, SlowStream(data[:-1]))
+        # The first constant's tag.
+        self.assertRaises(classfile.ClassFormatError,
+                          classfile.ClassFile, data[:10] + "\x63" + data[11:])
+
+class ReferenceTest(unittest.TestCase):
+    def test_referenced_classes(self):
+        parsed = parse(ClassBuilder("a/User")
+                       .reference("a/Called")
+                       .reference("[[La/Element;")
+                       .reference("[I")
+                       .field("map", "Ljava/util/Map;",
+                              signature="Ljava/util/Map<La/Key;La/Value;>;")
+                       .method("run", "(La/Argument;)V",
+                               exceptions=["a/Failure"]))
+        self.assertEqual(parsed.referenced_classes(),
+                         set(["java/lang/Object", "a/Called", "a/Element",
+                              "java/util/Map", "a/Key", "a/Value",
+                              "a/Argument", "a/Failure"]))
+
+    def test_source_path(self):
+        parsed = parse(ClassBuilder("a/b/Outer$Inner", source_file="Outer.java"))
+        self.assertEqual(classfile.source_path(parsed), "a/b/Outer.java")
+
+        # Without a SourceFile attribute, it's named after the outer class.
+        parsed = parse(ClassBuilder("a/b/Outer$Inner$1"))
+        self.assertEqual(classfile.source_path(parsed), "a/b/Outer.java")
+        parsed = parse(ClassBuilder("Outer$Inner"))
+        self.assertEqual(classfile.source_path(parsed), "Outer.java")
+
+class FingerprintTest(unittest.TestCase):
+    def abi(self, builder):
+        return classfile.abi_fingerprint(parse(builder))
+
+    def constants(self, builder):
+        return classfile.constants_fingerprint(parse(builder))
+
+    def test_abi_ignores_private_details(self):
+        base = self.abi(ClassBuilder("a/A").method("foo", "()V", code="\x01"))
+        # A different method body.
+        self.assertEqual(base, self.abi(ClassBuilder("a/A")
+                                        .method("foo", "()V", code="\x02")))
+        # Private and synthetic members.
+        self.assertEqual(base, self.abi(
+            ClassBuilder("a/A").method("foo", "()V")
+            .method("helper", "()V", access=classfile.ACC_PRIVATE)
+            .field("cache", "I", access=classfile.ACC_SYNTHETIC)))
+        # Other references in the constant pool.
+        self.assertEqual(base, self.abi(ClassBuilder("a/A")
+                                        .method("foo", "()V")
+                                        .reference("a/Other")))
+
+    def test_abi_ignores_member_order(self):
+        self.assertEqual(self.abi(ClassBuilder("a/A").method("foo", "()V")
+                                  .method("bar", "()V")),
+                         self.abi(ClassBuilder("a/A").method("bar", "()V")
+                                  .method("foo", "()V")))
+
+    def test_abi_changes(self):
+        base = self.abi(ClassBuilder("a/A").method("foo", "()V")
+                        .field("size", "I"))
+        changes = [
+            ClassBuilder("a/A").method("foo", "(I)V").field("size", "I"),
+            ClassBuilder("a/A").method("foo", "()V").field("size", "J"),
+            ClassBuilder("a/A").method("foo", "()V"),
+            ClassBuilder("a/A").method("foo", "()V", exceptions=["a/E"])
+            .field("size", "I"),
+            ClassBuilder("a/A").method("foo", "()V",
+                                       access=classfile.ACC_PROTECTED)
+            .field("size", "I"),
+            ClassBuilder("a/A", super_name="a/Base").method("foo", "()V")
+            .field("size", "I"),
+            ClassBuilder("a/A", interfaces=["a/I"]).method("foo", "()V")
+            .field("size", "I"),
+            ClassBuilder("a/A", signature="<T:Ljava/lang/Object;>"
+                                          "Ljava/lang/Object;")
+            .method("foo", "()V").field("size", "I"),
+        ]
+        for changed in changes:
+            self.assertNotEqual(base, self.abi(changed))
+
+    def test_constants(self):
+        base = ClassBuilder("a/A").field("LIMIT", "I", constant=5)
+        self.assertEqual(self.abi(base),
+                         self.abi(ClassBuilder("a/A")
+                                  .field("LIMIT", "I", constant=6)))
+        self.assertNotEqual(self.constants(base),
+                            self.constants(ClassBuilder("a/A")
+                                           .field("LIMIT", "I", constant=6)))
+        self.assertEqual(self.constants(base),
+                         self.constants(ClassBuilder("a/A")
+                                        .field("LIMIT", "I", constant=5)
+                                        .method("foo", "()V")))
+        # Private constants can't be inlined anywhere else.
+        self.assertEqual(self.constants(ClassBuilder("a/A")),
+                         self.constants(ClassBuilder("a/A").field(
+                             "hidden", "I", constant=1,
+                             access=classfile.ACC_PRIVATE)))
+
+if __name__ == "__main__":
+    unittest.main()
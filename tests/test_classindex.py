@@ -0,0 +1,57 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, unittest
+
+import classbuilder # Sets up the path.
+import classindex
+
+def make_index(entries):
+    index = classindex.ClassIndex(os.devnull)
+    index.entries = dict((path, {"stamp": None, "classes": set(classes),
+                                 "references": set(references)})
+                         for path, (classes, references) in entries.items())
+    index.index()
+    return index
+
+class SelectTest(unittest.TestCase):
+    def setUp(self):
+        self.index = make_index({
+            "api.jar": (["mod/api/Api", "mod/api/Helper"], ["util"]),
+            # The other half of a package that's split between two jars.
+            "api-extra.jar": (["mod/api/Extra"], []),
+            "util.jar": (["util/Strings"], []),
+            "unused.jar": (["other/Thing"], []),
+        })
+
+    def test_resolve(self):
+        self.assertEqual(self.index.resolve("mod.api.Helper"), ["api.jar"])
+        self.assertEqual(self.index.resolve("mod.api.Helper.CONSTANT"),
+                         ["api.jar"])
+        self.assertEqual(self.index.resolve("mod.api"),
+                         set(["api.jar", "api-extra.jar"]))
+        self.assertEqual(self.index.resolve("list.size"), None)
+        self.assertEqual(self.index.locate("mod.api.Missing"),
+                         ("mod/api", None))
+
+    def test_select_follows_references(self):
+        self.assertEqual(self.index.select(["bin"], ["mod.api.Api"]),
+                         set(["bin", "api.jar", "util.jar"]))
+
+    def test_select_split_packages(self):
+        # Extra is used from inside mod.api, without an import.
+        self.assertEqual(self.index.select([], [], ["mod/api"]),
+                         set(["api.jar", "api-extra.jar", "util.jar"]))
+
+    def test_conflicts(self):
+        index = make_index({"a.jar": (["x/A", "x/B"], []),
+                            "b.jar": (["x/B"], []),
+                            "c.jar": (["x/B"], [])})
+        self.assertEqual(dict(index.conflicts(["a.jar", "b.jar"])),
+                         {("a.jar", "b.jar"): ["x/B"]})
+        self.assertEqual(dict(index.conflicts(["a.jar"])), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, shutil, tempfile, unittest
+
+from classbuilder import ClassBuilder
+import recompile_mods
+
+def write_class(dir, builder):
+    filename = os.path.join(dir, *builder.name.split("/")) + ".class"
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, "wb") as outfile:
+        outfile.write(builder.build())
+
+def base_class(method_descriptor):
+    return ClassBuilder("a/A", source_file="A.java") \
+           .method("foo", method_descriptor)
+
+class SubclassTest(unittest.TestCase):
+    def test_with_subclasses(self):
+        parents = {"a/B": ("a/A",), "a/C": ("a/B", "a/I"),
+                   "a/D": ("a/Other",), "a/E": ("java/lang/Object", "a/I")}
+        self.assertEqual(recompile_mods.with_subclasses(["a/A"], parents),
+                         set(["a/A", "a/B", "a/C"]))
+        self.assertEqual(recompile_mods.with_subclasses(["a/I"], parents),
+                         set(["a/I", "a/C", "a/E"]))
+        self.assertEqual(recompile_mods.with_subclasses([], parents), set())
+
+class RunRelativeTest(unittest.TestCase):
+    def test_run_relative(self):
+        run_dir = os.path.join(tempfile.gettempdir(), "mods", "run-1")
+        self.addCleanup(setattr, recompile_mods, "TEMP",
+                        getattr(recompile_mods, "TEMP", None))
+        recompile_mods.TEMP = run_dir
+        self.assertEqual(recompile_mods.run_relative(
+                             os.path.join(run_dir, "lib") + ":/mcp/bin:"
+                             + run_dir),
+                         os.path.join("<TEMP>", "lib") + ":/mcp/bin:"
+                         + os.path.join("<TEMP>", "."))
+        # Only whole paths count.
+        self.assertEqual(recompile_mods.run_relative(run_dir + "0/lib"),
+                         run_dir + "0/lib")
+        self.assertEqual(recompile_mods.run_relative("-Xlint:all"),
+                         "-Xlint:all")
+
+class RecordClassesTest(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.project = recompile_mods.Project.__new__(recompile_mods.Project)
+        self.project.name = "test"
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_inherited_members(self):
+        # C calls b.foo(), which B inherits from A, so C only names B.
+        write_class(self.out_dir, base_class("()V"))
+        write_class(self.out_dir, ClassBuilder("a/B", super_name="a/A",
+                                               source_file="B.java"))
+        write_class(self.out_dir, ClassBuilder("a/C", source_file="C.java")
+                                  .reference("a/B"))
+
+        sources = ["a/A.java", "a/B.java", "a/C.java"]
+        record = {"classes": {}, "previous": {}, "api": {},
+                  "sources": dict((name, "") for name in sources),
+                  "own": set(sources),
+                  "source_paths": dict((name, name) for name in sources)}
+        self.assertEqual(self.project.record_classes(self.out_dir, record,
+                                                     set(sources)),
+                         set())
+
+        # A.foo changes its signature, and A.java is recompiled.
+        record["previous"]["a/A"] = record["classes"].pop("a/A")
+        write_class(self.out_dir, base_class("(I)V"))
+        self.assertEqual(self.project.record_classes(self.out_dir, record,
+                                                     set(["a/A.java"])),
+                         set(["a/B.java", "a/C.java"]))
+
+    def test_unchanged_abi(self):
+        write_class(self.out_dir, base_class("()V"))
+        write_class(self.out_dir, ClassBuilder("a/B", super_name="a/A",
+                                               source_file="B.java"))
+
+        sources = ["a/A.java", "a/B.java"]
+        record = {"classes": {}, "previous": {}, "api": {},
+                  "sources": dict((name, "") for name in sources),
+                  "own": set(sources),
+                  "source_paths": dict((name, name) for name in sources)}
+        self.project.record_classes(self.out_dir, record, set(sources))
+
+        # Only the body changed.
+        record["previous"]["a/A"] = record["classes"].pop("a/A")
+        write_class(self.out_dir, base_class("()V").method(
+            "helper", "()V", access=recompile_mods.classfile.ACC_PRIVATE))
+        self.assertEqual(self.project.record_classes(self.out_dir, record,
+                                                     set(["a/A.java"])),
+                         set())
+
+if __name__ == "__main__":
+    unittest.main()
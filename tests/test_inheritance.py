@@ -0,0 +1,44 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, shutil, tempfile, unittest, zipfile
+
+from classbuilder import ClassBuilder
+import inheritance
+
+class JarTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.jar = os.path.join(self.dir, "lib.jar")
+        archive = zipfile.ZipFile(self.jar, "w")
+        archive.writestr("a/B.class",
+                         ClassBuilder("a/B", super_name="a/A",
+                                      interfaces=["a/I"]).build())
+        archive.writestr("a/User.class",
+                         ClassBuilder("a/User").reference("a/B")
+                         .method("run", "(Lb/Other;)V").build())
+        archive.writestr("a/Broken.class", "not a class")
+        archive.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\n")
+        archive.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_jar(self):
+        self.assertEqual(inheritance.read_jar(self.jar),
+                         {"a/B": ["a/A", "a/I"],
+                          "a/User": ["java/lang/Object"]})
+
+    def test_read_references(self):
+        self.assertEqual(inheritance.read_references(self.jar),
+                         ["a/A", "a/B", "a/I", "b/Other", "java/lang/Object"])
+
+    def test_table_round_trip(self):
+        table = inheritance.read_jar(self.jar)
+        self.assertEqual(
+            inheritance.parse_table(inheritance.format_table(table)), table)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, shutil, tempfile, unittest, zipfile
+
+import classbuilder # Sets up the path.
+import buildstate, packaging
+
+DATE_TIME = (2011, 11, 5, 13, 37, 42)
+
+def entry(data, compress_type=zipfile.ZIP_DEFLATED, **kwargs):
+    made = packaging.Entry(data, compress_type, date_time=DATE_TIME,
+                           external_attr=0644 << 16, **kwargs)
+    made.create_system = packaging.UNIX
+    return made
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_readable(self):
+        contents = {"a.txt": "hello " * 100, "dir/b.class": "\xca\xfe" * 7,
+                    "empty": ""}
+        entries = [(name, entry(data)) for name, data in sorted(contents.items())]
+        entries.append(("stored.txt", entry("as is", zipfile.ZIP_STORED)))
+        packaging.write_archive(self.path("out.zip"), entries)
+
+        archive = zipfile.ZipFile(self.path("out.zip"))
+        try:
+            self.assertEqual(archive.testzip(), None)
+            self.assertEqual(archive.namelist(),
+                             [name for name, made in entries])
+            for name, data in contents.items():
+                self.assertEqual(archive.read(name), data)
+            self.assertEqual(archive.read("stored.txt"), "as is")
+
+            info = archive.getinfo("a.txt")
+            self.assertEqual(info.date_time, DATE_TIME)
+            self.assertEqual(info.external_attr, 0644 << 16)
+            self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(archive.getinfo("stored.txt").compress_type,
+                             zipfile.ZIP_STORED)
+        finally:
+            archive.close()
+
+    def test_same_as_zipfile(self):
+        for compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            theirs = zipfile.ZipFile(self.path("theirs.zip"), "w")
+            info = zipfile.ZipInfo("a/b.txt", DATE_TIME)
+            info.external_attr = 0644 << 16
+            info.create_system = packaging.UNIX
+            info.compress_type = compress_type
+            theirs.writestr(info, "contents " * 50)
+            theirs.close()
+
+            packaging.write_archive(self.path("ours.zip"), [
+                ("a/b.txt", entry("contents " * 50, compress_type))])
+
+            with open(self.path("theirs.zip"), "rb") as infile:
+                expected = infile.read()
+            with open(self.path("ours.zip"), "rb") as infile:
+                self.assertEqual(infile.read(), expected)
+
+    def test_unicode_name(self):
+        packaging.write_archive(self.path("out.zip"),
+                                [(u"caf\xe9.txt", entry("x")),
+                                 (u"plain.txt", entry("y"))])
+        archive = zipfile.ZipFile(self.path("out.zip"))
+        try:
+            self.assertEqual(archive.namelist(), [u"caf\xe9.txt", "plain.txt"])
+            self.assertEqual(archive.read(u"caf\xe9.txt"), "x")
+        finally:
+            archive.close()
+
+    def test_reproducible(self):
+        first = [("b", entry("two")), ("a", entry("one"))]
+        second = [("a", packaging.Entry("one", zipfile.ZIP_DEFLATED)),
+                  ("b", packaging.Entry("old", zipfile.ZIP_DEFLATED)),
+                  ("b", packaging.Entry("two", zipfile.ZIP_DEFLATED))]
+        packaging.write_archive(self.path("first.zip"), first, True)
+        packaging.write_archive(self.path("second.zip"), second, True)
+        with open(self.path("first.zip"), "rb") as infile:
+            expected = infile.read()
+        with open(self.path("second.zip"), "rb") as infile:
+            self.assertEqual(infile.read(), expected)
+
+    def test_reuse_previous(self):
+        written = packaging.write_archive(self.path("old.zip"), [
+            ("same", entry("unchanged " * 20)),
+            ("changed", entry("before"))])
+        buildstate.save(self.path("old.manifest"), packaging.manifest(written))
+
+        previous = packaging.PreviousArchive(self.path("old.zip"),
+                                             self.path("old.manifest"))
+        try:
+            same = entry("unchanged " * 20, previous=previous, name="same")
+            changed = entry("after", previous=previous, name="changed")
+            # Same contents, but not what the archive had under this name.
+            moved = entry("before", previous=previous, name="moved")
+            self.assertEqual(previous.reused, 1)
+        finally:
+            previous.close()
+
+        packaging.write_archive(self.path("new.zip"), [
+            ("same", same), ("changed", changed), ("moved", moved)])
+        archive = zipfile.ZipFile(self.path("new.zip"))
+        try:
+            self.assertEqual(archive.testzip(), None)
+            self.assertEqual(archive.read("same"), "unchanged " * 20)
+            self.assertEqual(archive.read("changed"), "after")
+        finally:
+            archive.close()
+
+    def test_previous_missing(self):
+        previous = packaging.PreviousArchive(self.path("none.zip"),
+                                             self.path("none.manifest"))
+        made = entry("data", previous=previous, name="data")
+        previous.close()
+        self.assertEqual(previous.reused, 0)
+        self.assertEqual(made.file_size, 4)
+
+class EntryStoreTest(unittest.TestCase):
+    def test_shared(self):
+        store = packaging.EntryStore()
+        first = entry("resource " * 30, store=store)
+        second = entry("resource " * 30, store=store)
+        self.assertEqual(store.hits, 1)
+        self.assertTrue(second.data is first.data)
+
+    def test_stored_entries_not_kept(self):
+        store = packaging.EntryStore()
+        entry("resource", zipfile.ZIP_STORED, store=store)
+        entry("resource", zipfile.ZIP_STORED, store=store)
+        self.assertEqual(store.entries, {})
+        self.assertEqual(store.hits, 0)
+
+    def test_limit(self):
+        store = packaging.EntryStore(limit=30)
+        entry("a" * 10, store=store)
+        entry(os.urandom(100), store=store) # Doesn't compress at all.
+        self.assertEqual(len(store.entries), 1)
+        self.assertTrue(store.size <= 30)
+
+if __name__ == "__main__":
+    unittest.main()
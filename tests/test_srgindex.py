@@ -0,0 +1,103 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, shutil, tempfile, unittest
+
+import classbuilder # Sets up the path.
+import srgindex
+
+ENTRIES = [
+    ("PK", ".", "net/minecraft/src"),
+    ("CL", "a", "net/minecraft/src/Block"),
+    # The server's obfuscated names overlap with the client's.
+    ("CL", "a", "net/minecraft/server/Foo"),
+    ("CL", "b", "net/minecraft/src/BlockGrass"),
+    ("FD", "a/a", "net/minecraft/src/Block/blockID"),
+    ("MD", "a/a ()Ljava/lang/String;",
+     "net/minecraft/src/Block/getBlockName ()Ljava/lang/String;"),
+    ("MD", "a/b (I)V", "net/minecraft/src/Block/setLightValue (I)V"),
+]
+
+class SrgIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = srgindex.SrgIndex(ENTRIES)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup("CL", "net/minecraft/src/Block"),
+                         "a")
+        self.assertEqual(self.index.lookup("CL", "net/minecraft/src/Missing"),
+                         None)
+        self.assertEqual(self.index.reverse_lookup("CL", "a"),
+                         ["net/minecraft/src/Block",
+                          "net/minecraft/server/Foo"])
+        self.assertEqual(self.index.reverse_lookup("CL", "z"), [])
+        self.assertEqual(self.index.reverse_lookup("XX", "a"), [])
+
+    def test_prefixed(self):
+        self.assertEqual(self.index.prefixed("net/minecraft/src/Block",
+                                             ["CL"]),
+                         [("CL", "net/minecraft/src/Block", "a"),
+                          ("CL", "net/minecraft/src/BlockGrass", "b")])
+        self.assertEqual(self.index.prefixed("a", reverse=True),
+                         [("CL", "net/minecraft/src/Block", "a"),
+                          ("CL", "net/minecraft/server/Foo", "a"),
+                          ("FD", "net/minecraft/src/Block/blockID", "a/a"),
+                          ("MD", "net/minecraft/src/Block/getBlockName "
+                                 "()Ljava/lang/String;",
+                           "a/a ()Ljava/lang/String;"),
+                          ("MD", "net/minecraft/src/Block/setLightValue (I)V",
+                           "a/b (I)V")])
+        self.assertEqual(len(self.index.prefixed("a", reverse=True,
+                                                 limit=1)), 1)
+
+    def test_containing(self):
+        self.assertEqual(self.index.containing("a", ["CL"], reverse=True),
+                         [("CL", "net/minecraft/src/Block", "a"),
+                          ("CL", "net/minecraft/server/Foo", "a")])
+        self.assertEqual(self.index.containing("Light", ["MD"]),
+                         [("MD", "net/minecraft/src/Block/setLightValue (I)V",
+                           "a/b (I)V")])
+
+    def test_named(self):
+        self.assertEqual(self.index.named("block", ["CL", "FD"]),
+                         [("CL", "net/minecraft/src/Block", "a"),
+                          ("CL", "net/minecraft/src/BlockGrass", "b"),
+                          ("FD", "net/minecraft/src/Block/blockID", "a/a")])
+
+    def test_suggest(self):
+        self.assertEqual(self.index.suggest("CL", "net/minecraft/src/block"),
+                         ["net/minecraft/src/Block"])
+        self.assertEqual(self.index.suggest("MD",
+                                            "net/minecraft/src/Block/"
+                                            "getBlockName ()V"),
+                         ["net/minecraft/src/Block/getBlockName "
+                          "()Ljava/lang/String;"])
+
+class ReadSrgTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_load(self):
+        filename = os.path.join(self.dir, "full.srg")
+        with open(filename, "w") as outfile:
+            outfile.write("PK: . net/minecraft/src\n"
+                          "CL: a net/minecraft/src/Block # A comment.\n"
+                          "CL: a net/minecraft/server/Foo\n"
+                          "\n"
+                          "MD: a/a ()I net/minecraft/src/Block/getID ()I\n")
+        index = srgindex.load(filename)
+        self.assertEqual(index.types(), ["PK", "CL", "MD"])
+        self.assertEqual(index.reverse_lookup("CL", "a"),
+                         ["net/minecraft/src/Block",
+                          "net/minecraft/server/Foo"])
+        self.assertEqual(index.lookup("MD",
+                                      "net/minecraft/src/Block/getID ()I"),
+                         "a/a ()I")
+
+if __name__ == "__main__":
+    unittest.main()
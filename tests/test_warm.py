@@ -0,0 +1,54 @@
+# mcp_rebuild - A Python script for safe and easy rebuilding of MCP projects.
+# Copyright (c) 2011 FunnyMan3595 (Charlie Nolan)
+# This code is made avilable under the MIT license.  See LICENSE for the full
+# details.
+
+import os, shutil, tempfile, unittest
+
+import classbuilder # Sets up the path.
+import recompile_mods
+
+class ProjectStampTest(unittest.TestCase):
+    def setUp(self):
+        self.user = tempfile.mkdtemp()
+        self.addCleanup(setattr, recompile_mods, "USER", recompile_mods.USER)
+        recompile_mods.USER = self.user
+        self.touch("CATEGORY")
+        self.touch("foo", "conf", "VERSION", contents="1.0")
+        self.touch("foo", "src", "common", "Foo.java")
+
+    def tearDown(self):
+        shutil.rmtree(self.user)
+        recompile_mods.warm_state.clear()
+
+    def touch(self, *parts, **kwargs):
+        filename = os.path.join(self.user, *parts)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, "w") as outfile:
+            outfile.write(kwargs.get("contents", ""))
+
+    def test_changes(self):
+        stamp = recompile_mods.project_stamp()
+        # Sources don't change which projects there are.
+        self.touch("foo", "src", "common", "Bar.java")
+        self.assertEqual(recompile_mods.project_stamp(), stamp)
+
+        self.touch("foo", "conf", "VERSION", contents="1.0.1")
+        changed = recompile_mods.project_stamp()
+        self.assertNotEqual(changed, stamp)
+
+        self.touch("bar", "conf", "DISABLED")
+        self.assertNotEqual(recompile_mods.project_stamp(), changed)
+
+    def test_keep_warm(self):
+        loads = []
+        def load():
+            loads.append(None)
+            return len(loads)
+        self.assertEqual(recompile_mods.keep_warm("test", 1, load), 1)
+        self.assertEqual(recompile_mods.keep_warm("test", 1, load), 1)
+        self.assertEqual(recompile_mods.keep_warm("test", 2, load), 2)
+
+if __name__ == "__main__":
+    unittest.main()